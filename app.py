@@ -1,6 +1,9 @@
 from app import create_app
 
-app = create_app()
+# Job pool processes are spawned and re-import this file as __mp_main__;
+# they build their own app (create_app(job_worker=True)) in the initializer
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -14,14 +14,15 @@ load_dotenv()
 db = SQLAlchemy()
 csrf = CSRFProtect()
 assets = Environment()
-cache = Cache(config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300
-})
+cache = Cache()  # Backend is selected by the CACHE_* settings in app.config
 cors = CORS()
 
-def create_app():
-    """Application factory pattern"""
+def create_app(job_worker=False):
+    """Application factory pattern
+
+    ``job_worker`` builds the app for a background job process, which
+    leaves the attendance write-behind buffer to the web workers.
+    """
     app = Flask(__name__, 
                 static_folder='static',
                 template_folder='templates')
@@ -51,6 +52,20 @@ def create_app():
     assets.register('css_all', css)
     assets.register('js_all', js)
     
+    # Bump cache versions for every table a commit writes to
+    from app.services.cache_service import register_invalidation_hooks, tiered_cache
+    register_invalidation_hooks(db.session)
+    tiered_cache.init_app(app)
+    
+    # Optional write-behind buffer for attendance; replays unflushed logs on start
+    if not job_worker:
+        from app.services.write_behind import write_behind
+        write_behind.init_app(app)
+    
+    # Process pool for imports and report exports
+    from app.services.jobs import job_runner
+    job_runner.init_app(app)
+    
     # Register blueprints
     from app.controllers.main import main_bp
     from app.controllers.services import services_bp
@@ -58,6 +73,7 @@ def create_app():
     from app.controllers.saints import saints_bp
     from app.controllers.assignments import assignments_bp
     from app.controllers.reports import reports_bp
+    from app.controllers.jobs import jobs_bp
     from app.api.routes import api_bp
     
     app.register_blueprint(main_bp)
@@ -66,6 +82,7 @@ def create_app():
     app.register_blueprint(saints_bp)
     app.register_blueprint(assignments_bp)
     app.register_blueprint(reports_bp)
+    app.register_blueprint(jobs_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     
     # Cache headers for better performance in low network areas
@@ -73,7 +90,13 @@ def create_app():
     def add_header(response):
         """Add cache headers for improved performance"""
         response.headers['X-UA-Compatible'] = 'IE=Edge,chrome=1'
-        response.headers['Cache-Control'] = 'public, max-age=600'
+        response.headers.setdefault('Cache-Control', 'public, max-age=600')
+        return response
+    
+    @app.after_request
+    def publish_cache_stats(response):
+        """Periodically share this worker's cache counters"""
+        tiered_cache.publish_stats()
         return response
         
     return app
@@ -1,14 +1,49 @@
-from flask import Blueprint, jsonify, request
-from app import db, cache
+from flask import Blueprint, jsonify, request, abort, current_app, Response, stream_with_context
+from app import db, cache, csrf
 from app.models.services import Service, ServiceType, Attendance
 from app.models.people import Person
-from app.models.organization import Region, Direction, Department, Team, Cell
-from sqlalchemy import or_, func
+from app.models.organization import Department, Team, Cell
+from app.services.cache_service import tiered_cache
+from app.services.org_hierarchy import get_org_hierarchy, resolve_hierarchy_paths
+from app.services.name_search import search_people as search_people_by_name
+from app.services.cache_stats import aggregate_stats, render_prometheus
+from app.services.attendance_sync import sync_attendance
+from app.services.attendance_changes import latest_seq, wait_for_changes, CHANGE_COLUMNS
+from app.services.live_counters import live_counters
+from app.services.reassignment import reassign_people
+from sqlalchemy import func
 from datetime import datetime
+from flask_wtf.csrf import generate_csrf
+import hmac
 
 # Create API blueprint
 api_bp = Blueprint('api', __name__)
 
+def authorize_api_client():
+    """Allow a request carrying ``Authorization: Bearer <API_TOKEN>``, or a
+    browser request with a valid CSRF token; anything else is refused.
+
+    For views exempted from the global CSRF check because devices and
+    scripts call them without a browser session.
+    """
+    token = current_app.config.get('API_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        if token and hmac.compare_digest(header[len('Bearer '):], token):
+            return
+        abort(401)
+    csrf.protect()
+
+@api_bp.route('/csrf-token')
+def get_csrf_token():
+    """
+    CSRF token for the current session. Pages served from the shared view
+    cache cannot carry one, so their forms fetch it before submitting.
+    """
+    response = jsonify({'csrf_token': generate_csrf()})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @api_bp.route('/services')
 def get_services():
     """Get upcoming services"""
@@ -33,14 +68,8 @@ def search_people():
     if not query or len(query) < 2:
         return jsonify([])
     
-    # Search for matching people
-    people = Person.query.filter(
-        or_(
-            Person.first_name.ilike(f'%{query}%'),
-            Person.last_name.ilike(f'%{query}%')
-        ),
-        Person.is_active == True
-    ).limit(20).all()
+    # Search for matching people, best matches first
+    people = search_people_by_name(query, limit=20)
     
     # Check if they're already marked for this service
     marked_ids = []
@@ -48,10 +77,13 @@ def search_people():
         attendance_records = Attendance.query.filter_by(service_id=service_id).all()
         marked_ids = [record.person_id for record in attendance_records]
     
+    # Resolve every hierarchy path in one batch
+    paths = resolve_hierarchy_paths(people)
+    
     # Format results
     results = []
     for person in people:
-        hierarchy = person.hierarchy_path
+        hierarchy = paths[person.cell_id]
         results.append({
             'id': person.person_id,
             'name': f"{person.first_name} {person.last_name}",
@@ -68,55 +100,14 @@ def search_people():
 @api_bp.route('/organization')
 def get_organization():
     """Get organization hierarchy"""
-    # Get all regions with related entities
-    regions = Region.query.order_by(Region.region_name).all()
-    
-    # Build hierarchical structure
-    hierarchy = []
-    for region in regions:
-        region_data = {
-            'id': region.region_id,
-            'name': region.region_name,
-            'directions': []
-        }
-        
-        for direction in region.directions:
-            direction_data = {
-                'id': direction.direction_id,
-                'name': direction.direction_name,
-                'departments': []
-            }
-            
-            for department in direction.departments:
-                department_data = {
-                    'id': department.department_id,
-                    'name': department.department_name,
-                    'teams': []
-                }
-                
-                for team in department.teams:
-                    team_data = {
-                        'id': team.team_id,
-                        'name': team.team_name,
-                        'cells': []
-                    }
-                    
-                    for cell in team.cells:
-                        cell_data = {
-                            'id': cell.cell_id,
-                            'name': cell.cell_name
-                        }
-                        team_data['cells'].append(cell_data)
-                    
-                    department_data['teams'].append(team_data)
-                
-                direction_data['departments'].append(department_data)
-            
-            region_data['directions'].append(direction_data)
-        
-        hierarchy.append(region_data)
-    
-    return jsonify(hierarchy)
+    # Tree is assembled from the hierarchy index (one query per level when
+    # it is rebuilt) and carries an ETag so clients can skip refetching it
+    body, etag = get_org_hierarchy().tree_json()
+    
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
 
 @api_bp.route('/organization/hierarchy')
 def get_organization_hierarchy():
@@ -124,54 +115,8 @@ def get_organization_hierarchy():
     Get organizational hierarchy with relationships between entities.
     Used for cascading dropdowns in the UI.
     """
-    # Fetch all organizational entities
-    regions = Region.query.all()
-    directions = Direction.query.join(Region).all()
-    departments = Department.query.join(Direction).all()
-    teams = Team.query.join(Department).all()
-    cells = Cell.query.join(Team).all()
-    
-    # Format the data with their relationships
-    formatted_directions = []
-    for direction in directions:
-        formatted_directions.append({
-            'direction_id': direction.direction_id,
-            'direction_name': direction.direction_name,
-            'region_id': direction.region_id
-        })
-    
-    formatted_departments = []
-    for department in departments:
-        formatted_departments.append({
-            'department_id': department.department_id,
-            'department_name': department.department_name,
-            'direction_id': department.direction_id
-        })
-    
-    formatted_teams = []
-    for team in teams:
-        formatted_teams.append({
-            'team_id': team.team_id,
-            'team_name': team.team_name,
-            'department_id': team.department_id
-        })
-    
-    formatted_cells = []
-    for cell in cells:
-        formatted_cells.append({
-            'cell_id': cell.cell_id,
-            'cell_name': cell.cell_name,
-            'team_id': cell.team_id
-        })
-    
-    # Return the complete hierarchy
-    return jsonify({
-        'regions': [{'region_id': r.region_id, 'region_name': r.region_name} for r in regions],
-        'directions': formatted_directions,
-        'departments': formatted_departments,
-        'teams': formatted_teams,
-        'cells': formatted_cells
-    })
+    # Served from the in-memory index, rebuilt only when an org table changes
+    return jsonify(get_org_hierarchy().to_dict())
 
 @api_bp.route('/attendance/<int:service_id>')
 def get_attendance(service_id):
@@ -197,6 +142,146 @@ def get_attendance(service_id):
         } for record in records]
     })
 
+@api_bp.route('/attendance/<int:service_id>/changes')
+def get_attendance_changes(service_id):
+    """
+    Attendance changes for a service after a cursor.
+    
+    ?since=<seq> returns the changes after that sequence number, oldest
+    first; without it only the current cursor is returned. ?wait=<seconds>
+    holds the request open until a change arrives (long-poll); it is ignored
+    unless ATTENDANCE_LONG_POLL is set. A status of null means the mark was
+    removed. Pass the returned seq as the next since.
+    """
+    Service.query.get_or_404(service_id)
+    since = request.args.get('since', type=int)
+    
+    if since is None:
+        changes, more, seq = [], False, latest_seq(service_id)
+    else:
+        wait = 0
+        if current_app.config.get('ATTENDANCE_LONG_POLL'):
+            max_wait = current_app.config.get('ATTENDANCE_CHANGES_MAX_WAIT', 25)
+            wait = min(max(request.args.get('wait', 0, type=float), 0), max_wait)
+        changes, more = wait_for_changes(service_id, since, wait=wait)
+        seq = changes[-1][0] if changes else since
+    
+    response = jsonify({
+        'seq': seq,
+        'columns': CHANGE_COLUMNS,
+        'changes': changes,
+        'more': more
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api_bp.route('/attendance/<int:service_id>/live')
+def stream_attendance_counts(service_id):
+    """
+    Server-Sent Events stream of a service's present/absent/watched_recording
+    counts, in total and per region and department. With
+    ATTENDANCE_LONG_POLL set, an event is pushed whenever the counts change
+    and the stream closes after a few minutes; otherwise one event is sent
+    and EventSource reconnects after the poll interval. Either way the
+    client simply reconnects.
+    """
+    Service.query.get_or_404(service_id)
+    db.session.rollback()
+    
+    if current_app.config.get('ATTENDANCE_LONG_POLL'):
+        events = live_counters.stream(service_id)
+    else:
+        events = live_counters.stream(
+            service_id, duration=0, retry=current_app.config['ATTENDANCE_CHANGES_POLL_INTERVAL'] * 1000
+        )
+    
+    response = Response(
+        stream_with_context(events),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/attendance/sync', methods=['POST'])
+@csrf.exempt
+def sync_attendance_ops():
+    """
+    Apply a batch of queued attendance operations from an offline client.
+    
+    Body: {"device_id": "...", "ops": [{"op_id", "service_id", "person_id",
+    "status", "client_ts"}, ...]}. Operation ids make replays safe; the whole
+    batch is applied in one transaction. Clients drop every op_id listed in
+    the response, whether acknowledged or rejected. Devices authenticate
+    with the API bearer token, so a replay after the session has expired
+    still succeeds.
+    """
+    authorize_api_client()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('ops'), list):
+        return jsonify({'error': 'expected a JSON object with an "ops" list'}), 400
+    
+    ops = payload['ops']
+    max_ops = current_app.config.get('ATTENDANCE_SYNC_MAX_OPS', 5000)
+    if len(ops) > max_ops:
+        return jsonify({'error': f'at most {max_ops} operations per batch'}), 413
+    
+    device_id = payload.get('device_id')
+    device_id = str(device_id)[:64] if device_id else None
+    
+    try:
+        ack, rejected = sync_attendance(ops, device_id=device_id)
+        db.session.commit()
+        live_counters.notify()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Attendance sync failed')
+        return jsonify({'error': 'sync failed'}), 500
+    
+    return jsonify({
+        'ack': ack,
+        'rejected': rejected,
+        'server_time': datetime.utcnow().isoformat() + 'Z'
+    })
+
+@api_bp.route('/assignments/reassign', methods=['POST'])
+@csrf.exempt
+def reassign_assignments():
+    """
+    Move a group of people to another cell in one statement.
+    
+    Body: {"cell_id": ..., and one of "person_ids": [...], "from_cell_id"
+    or "from_team_id"}. Responds with the number of people moved. Scripts
+    authenticate with the API bearer token.
+    """
+    authorize_api_client()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('cell_id'), int):
+        return jsonify({'error': 'expected a JSON object with an integer "cell_id"'}), 400
+    
+    person_ids = payload.get('person_ids')
+    if person_ids is not None and not (
+        isinstance(person_ids, list) and all(isinstance(person_id, int) for person_id in person_ids)
+    ):
+        return jsonify({'error': '"person_ids" must be a list of integers'}), 400
+    for key in ('from_cell_id', 'from_team_id'):
+        if payload.get(key) is not None and not isinstance(payload[key], int):
+            return jsonify({'error': f'"{key}" must be an integer'}), 400
+
+    try:
+        updated = reassign_people(
+            payload['cell_id'],
+            person_ids=person_ids,
+            from_cell_id=payload.get('from_cell_id'),
+            from_team_id=payload.get('from_team_id')
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'updated': updated})
+
 @api_bp.route('/stats/overview')
 def get_overview_stats():
     """Get overview statistics"""
@@ -242,3 +327,27 @@ def get_overview_stats():
             for dept, count in department_stats
         ]
     })
+
+
+@api_bp.route('/internal/cache-stats')
+def get_cache_stats():
+    """
+    Cache statistics per view, aggregated across all workers.
+    Returns JSON by default or Prometheus text with ?format=prometheus.
+    """
+    token = current_app.config.get('INTERNAL_API_TOKEN')
+    if not token or not hmac.compare_digest(request.headers.get('X-Internal-Token', ''), token):
+        abort(403)
+    
+    # Include this worker's latest counters before aggregating
+    tiered_cache.publish_stats(force=True)
+    stats = aggregate_stats()
+    
+    if request.args.get('format') == 'prometheus':
+        response = Response(render_prometheus(stats), mimetype='text/plain')
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        response = jsonify(stats)
+    
+    response.headers['Cache-Control'] = 'no-store'
+    return response
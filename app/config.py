@@ -17,8 +17,57 @@ class Config:
     }
     
     # Caching
-    CACHE_TYPE = 'SimpleCache'
+    # Use RedisCache in production so every gunicorn worker shares entries
+    # and tag invalidations; FileSystemCache is a local shared stand-in
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', '')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DIR = os.getenv('CACHE_DIR', '/tmp/churchops-cache')
+    CACHE_STALE_TTL = 30  # Seconds an expired page may still be served while it is rebuilt
+    CACHE_LOCK_TIMEOUT = 10  # Seconds a request waits for another to rebuild a page
+    CACHE_VERSIONED_TIMEOUT = 86400  # Expiry for data-versioned entries orphaned by a commit
+    CACHE_L1_MAX_ENTRIES = 2048  # Per-worker in-process tier
+    CACHE_L1_MAX_BYTES = 32 * 1024 * 1024
+    CACHE_L1_TIMEOUT = 60  # Longest a worker serves an entry without asking the shared tier
+    CACHE_L1_TAG_TIMEOUT = 1  # How quickly other workers' invalidations are seen
+    
+    # Internal endpoints (cache statistics) require this in X-Internal-Token;
+    # they are refused while it is unset
+    INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN')
+    
+    # Bearer token for non-browser API clients (offline attendance sync, bulk
+    # reassignment);
+    # browser requests use the CSRF token instead. Unset refuses bearer calls
+    API_TOKEN = os.getenv('API_TOKEN')
+    
+    # Attendance rosters larger than this render collapsed, loading each cell on demand
+    ATTENDANCE_ROSTER_INLINE_LIMIT = 300
+    
+    # Largest batch of operations accepted by /api/attendance/sync
+    ATTENDANCE_SYNC_MAX_OPS = 5000
+    
+    # Long-polling and the live counter stream hold a worker thread per open
+    # attendance form or viewer, so they are opt-in and need a threaded worker
+    # class (see gunicorn.conf.py); without them clients poll every few seconds
+    ATTENDANCE_LONG_POLL = os.getenv('ATTENDANCE_LONG_POLL', 'false').lower() == 'true'
+    ATTENDANCE_CHANGES_MAX_WAIT = 25  # Longest a long-poll may wait for a change
+    ATTENDANCE_CHANGES_POLL_INTERVAL = 10  # Seconds between short polls
+    
+    # Write-behind mode: mark_attendance acknowledges once marks are fsynced to
+    # a local log and a background thread flushes them to Postgres in batches
+    ATTENDANCE_WRITE_BEHIND = os.getenv('ATTENDANCE_WRITE_BEHIND', 'false').lower() == 'true'
+    ATTENDANCE_WAL_DIR = os.getenv('ATTENDANCE_WAL_DIR', '/var/lib/churchops/attendance-wal')
+    ATTENDANCE_FLUSH_INTERVAL = 1.0  # Seconds between flushes
+    ATTENDANCE_FLUSH_BATCH = 2000  # Flush early once this many marks are buffered
+    
+    # Background jobs (imports, report exports); inputs and results live under JOB_DIR
+    JOB_DIR = os.getenv('JOB_DIR', '/var/lib/churchops/jobs')
+    JOB_MAX_WORKERS = 2  # Pool processes per web worker
+    JOB_MAX_CONCURRENT = 2  # Jobs running at once across all workers
+    JOB_HEARTBEAT_INTERVAL = 30  # Seconds between heartbeats of a worker's jobs
+    JOB_STALE_AFTER = 180  # Unfinished jobs without a heartbeat this long are failed
+    JOB_RETENTION_DAYS = 7  # Finished jobs and their files are removed after this
     
     # Asset compilation
     ASSETS_DEBUG = False
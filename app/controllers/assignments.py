@@ -2,13 +2,16 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 
 from app import db, cache
 from app.models.people import Person
-from app.models.organization import Region, Direction, Department, Team, Cell
-from sqlalchemy import or_
-from app.services.cache_service import invalidate_cache
+from app.models.jobs import Job
+from app.services.org_hierarchy import get_org_hierarchy, resolve_hierarchy_paths
+from app.services.name_search import name_filter, name_rank
+from app.services.jobs import job_runner
+from app.services.reassignment import reassign_people
+from app.services.import_service import REQUIRED_COLUMNS, OPTIONAL_COLUMNS
 from datetime import datetime
-import pandas as pd
 import io
 import csv
+import json
 from werkzeug.utils import secure_filename
 
 # Create blueprint
@@ -18,12 +21,13 @@ assignments_bp = Blueprint('assignments', __name__, url_prefix='/assignments')
 
 def assignments_index():
     """Assignment management page"""
-    # Get dropdown data for filters
-    regions = Region.query.order_by(Region.region_name).all()
-    directions = Direction.query.join(Region).order_by(Direction.direction_name).all()
-    departments = Department.query.join(Direction).order_by(Department.department_name).all()
-    teams = Team.query.join(Department).order_by(Team.team_name).all()
-    cells = Cell.query.join(Team).order_by(Cell.cell_name).all()
+    # Get dropdown data for filters from the in-memory hierarchy index
+    org = get_org_hierarchy()
+    regions = org.regions()
+    directions = org.directions()
+    departments = org.departments()
+    teams = org.teams()
+    cells = org.cells()
     
     return render_template(
         'assignments/index.html',
@@ -48,49 +52,51 @@ def search_bulk_people():
     is_active = request.args.get('is_active', 'true') == 'true'
     name_search = request.args.get('name_search', '')
     
-    # Build people query with filters
-    people_query = Person.query.join(Cell).join(Team).join(Department).join(Direction).join(Region)
+    # Build people query with filters; ancestor ids live on the person row,
+    # so no join through the hierarchy is needed
+    people_query = Person.query
     
     # Apply filters
     if is_active is not None:
         people_query = people_query.filter(Person.is_active == is_active)
     
     if region_id:
-        people_query = people_query.filter(Region.region_id == region_id)
+        people_query = people_query.filter(Person.region_id == region_id)
     
     if direction_id:
-        people_query = people_query.filter(Direction.direction_id == direction_id)
+        people_query = people_query.filter(Person.direction_id == direction_id)
     
     if department_id:
-        people_query = people_query.filter(Department.department_id == department_id)
+        people_query = people_query.filter(Person.department_id == department_id)
     
     if team_id:
-        people_query = people_query.filter(Team.team_id == team_id)
+        people_query = people_query.filter(Person.team_id == team_id)
     
     if cell_id:
-        people_query = people_query.filter(Cell.cell_id == cell_id)
+        people_query = people_query.filter(Person.cell_id == cell_id)
     
     if name_search:
-        people_query = people_query.filter(
-            or_(
-                Person.first_name.ilike(f'%{name_search}%'),
-                Person.last_name.ilike(f'%{name_search}%')
-            )
-        )
+        people_query = people_query.filter(name_filter(name_search))
     
-    # Order results
-    people_query = people_query.order_by(
-        Person.last_name,
-        Person.first_name
-    )
+    # Order results, best name matches first when searching by name
+    if name_search:
+        people_query = people_query.order_by(*name_rank(name_search))
+    else:
+        people_query = people_query.order_by(
+            Person.last_name,
+            Person.first_name
+        )
     
     # Limit results for performance
     people = people_query.limit(100).all()
     
+    # Resolve every hierarchy path in one batch
+    paths = resolve_hierarchy_paths(people)
+    
     # Format results for the frontend
     results = []
     for person in people:
-        hierarchy = person.hierarchy_path
+        hierarchy = paths[person.cell_id]
         results.append({
             'id': person.person_id,
             'name': f"{person.first_name} {person.last_name}",
@@ -132,12 +138,14 @@ def save_assignment():
     # Get the person
     person = Person.query.get_or_404(person_id)
     
-    # Update their cell assignment
-    person.cell_id = cell_id
-    db.session.commit()
-    
-    # Invalidate any cached data
-    invalidate_cache('people')
+    # Update their cell assignment, keeping the direction name in step
+    try:
+        reassign_people(cell_id, person_ids=[person.person_id])
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('assignments.assignments_index'))
     
     flash('Assignment updated successfully', 'success')
     return redirect(url_for('assignments.assignments_index'))
@@ -145,26 +153,31 @@ def save_assignment():
 @assignments_bp.route('/bulk-save', methods=['POST'])
 
 def save_bulk_assignment():
-    """Save bulk assignments for multiple people"""
-    person_ids = request.form.getlist('person_ids')
+    """Save bulk assignments for multiple people, or everyone in a cell or team"""
+    person_ids = request.form.getlist('person_ids', type=int)
+    from_cell_id = request.form.get('from_cell_id', type=int)
+    from_team_id = request.form.get('from_team_id', type=int)
     cell_id = request.form.get('cell_id', type=int)
     
-    if not person_ids or not cell_id:
+    if not (person_ids or from_cell_id or from_team_id) or not cell_id:
         flash('Missing required information', 'danger')
         return redirect(url_for('assignments.assignments_index'))
     
-    # Update all selected people
-    for person_id in person_ids:
-        person = Person.query.get(person_id)
-        if person:
-            person.cell_id = cell_id
-    
-    db.session.commit()
-    
-    # Invalidate any cached data
-    invalidate_cache('people')
+    # One UPDATE for the whole group
+    try:
+        updated = reassign_people(
+            cell_id,
+            person_ids=person_ids or None,
+            from_cell_id=from_cell_id if not person_ids else None,
+            from_team_id=from_team_id if not (person_ids or from_cell_id) else None
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('assignments.assignments_index'))
     
-    flash(f'{len(person_ids)} assignments updated successfully', 'success')
+    flash(f'{updated} assignments updated successfully', 'success')
     return redirect(url_for('assignments.assignments_index'))
 
 @assignments_bp.route('/template')
@@ -174,11 +187,17 @@ def download_template():
     output = io.StringIO()
     writer = csv.writer(output)
     
-    # Write headers
-    writer.writerow(['First Name', 'Last Name', 'Phone', 'Country', 'Region', 'Zone', 'Department', 'Team', 'Cell', 'Gender'])
+    # Write headers, the same columns the importer reads
+    columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    writer.writerow(columns)
     
     # Write a sample row
-    writer.writerow(['John', 'Doe', '1234567890', 'India', '1', 'North', 'Adult Department', 'Team A', 'Cell 1', 'M'])
+    sample = {
+        'First Name': 'John', 'Last Name': 'Doe', 'Region': 'North', 'Direction': 'Adults',
+        'Department': 'Adult Department', 'Team': 'Team A', 'Cell': 'Cell 1',
+        'Email': 'john.doe@example.org', 'Phone': '1234567890', 'Country': 'India', 'Gender': 'M'
+    }
+    writer.writerow([sample.get(column, '') for column in columns])
     
     # Reset file pointer
     output.seek(0)
@@ -209,148 +228,25 @@ def import_assignments():
         flash('File must be CSV or Excel', 'danger')
         return redirect(url_for('assignments.assignments_index'))
     
-    try:
-        # Read the file
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file)
-        
-        # Validate columns
-        required_columns = ['First Name', 'Last Name', 'Region', 'Direction', 'Department', 'Team', 'Cell']
-        optional_columns = ['Email', 'Phone', 'Country', 'Gender']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            flash(f"Missing required columns: {', '.join(missing_columns)}", 'danger')
-            return redirect(url_for('assignments.assignments_index'))
-        
-        # Process each row
-        success_count = 0
-        error_count = 0
-        error_messages = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Get or create region
-                region_name = str(row['Region']) if pd.notna(row['Region']) else ''
-                direction_name = str(row['Direction']) if pd.notna(row['Direction']) else ''
-                department_name = str(row['Department']) if pd.notna(row['Department']) else ''
-                team_name = str(row['Team']) if pd.notna(row['Team']) else ''
-                cell_name = str(row['Cell']) if pd.notna(row['Cell']) else ''
-                
-                # Get or create region
-                region = Region.query.filter_by(region_name=region_name).first()
-                if not region:
-                    region = Region(region_name=region_name)
-                    db.session.add(region)
-                    db.session.flush()
-                
-                # Get or create direction under the region
-                direction = Direction.query.filter_by(
-                    direction_name=direction_name,
-                    region_id=region.region_id
-                ).first()
-                if not direction:
-                    direction = Direction(direction_name=direction_name, region_id=region.region_id)
-                    db.session.add(direction)
-                    db.session.flush()
-                
-                # Get or create department under the direction
-                department = Department.query.filter_by(
-                    department_name=department_name,
-                    direction_id=direction.direction_id
-                ).first()
-                if not department:
-                    department = Department(department_name=department_name, direction_id=direction.direction_id)
-                    db.session.add(department)
-                    db.session.flush()
-                
-                # Get or create team under the department
-                team = Team.query.filter_by(
-                    team_name=team_name,
-                    department_id=department.department_id
-                ).first()
-                if not team:
-                    team = Team(team_name=team_name, department_id=department.department_id)
-                    db.session.add(team)
-                    db.session.flush()
-                
-                # Get or create cell under the team
-                cell = Cell.query.filter_by(
-                    cell_name=cell_name,
-                    team_id=team.team_id
-                ).first()
-                if not cell:
-                    cell = Cell(cell_name=cell_name, team_id=team.team_id)
-                    db.session.add(cell)
-                    db.session.flush()
-                
-                # Handle person data
-                first_name = str(row['First Name']) if pd.notna(row['First Name']) else ''
-                last_name = str(row['Last Name']) if pd.notna(row['Last Name']) else ''
-                email = str(row.get('Email', '')) if pd.notna(row.get('Email', '')) else ''
-                phone = str(row.get('Phone', '')) if pd.notna(row.get('Phone', '')) else ''
-                country = str(row.get('Country', '')) if pd.notna(row.get('Country', '')) else ''
-                gender = str(row.get('Gender', '')) if pd.notna(row.get('Gender', '')) else ''
-                
-                # Find or create person
-                person = Person.query.filter(
-                    Person.first_name == first_name,
-                    Person.last_name == last_name
-                ).first()
-                
-                if not person:
-                    person = Person(
-                        first_name=first_name,
-                        last_name=last_name,
-                        email=email,
-                        phone=phone,
-                        country=country,
-                        gender=gender,
-                        cell_id=cell.cell_id,
-                        direction=direction_name,  # Set the direction name
-                        is_active=True
-                    )
-                    db.session.add(person)
-                else:
-                    # Update existing person
-                    person.cell_id = cell.cell_id
-                    person.direction = direction_name  # Update direction name
-                    if email:
-                        person.email = email
-                    if phone:
-                        person.phone = phone
-                    if country:
-                        person.country = country
-                    if gender:
-                        person.gender = gender
-                
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                error_messages.append(f"Error in row {index + 2}: {str(e)}")
-                continue
-        
-        # Commit all changes
-        db.session.commit()
-        
-        # Invalidate any cached data
-        invalidate_cache('people')
-        
-        # Report results
-        if error_count > 0:
-            flash(f"Processed {success_count} records with {error_count} errors. See details below.", 'warning')
-            for error in error_messages[:10]:  # Show first 10 errors
-                flash(error, 'danger')
-            if len(error_messages) > 10:
-                flash(f"...and {len(error_messages) - 10} more errors", 'danger')
-        else:
-            flash(f"Successfully processed {success_count} records", 'success')
-        
-        return redirect(url_for('assignments.assignments_index'))
-        
-    except Exception as e:
-        flash(f"Error processing file: {str(e)}", 'danger')
-        return redirect(url_for('assignments.assignments_index'))
+    # Read and import in a background job; the job page reports the outcome.
+    # A dry run only lists the changes, and can be applied from the job page
+    kind = 'preview_assignments' if request.form.get('dry_run') == 'true' else 'import_assignments'
+    filename = 'input.csv' if file.filename.endswith('.csv') else 'input.xlsx'
+    job = job_runner.submit(kind, {'filename': filename}, files={filename: file})
+    return redirect(url_for('jobs.job_page', job_id=job.job_id))
+
+@assignments_bp.route('/import/<job_id>/apply', methods=['POST'])
+
+def apply_import_preview(job_id):
+    """Import the file of a finished dry run"""
+    preview = Job.query.get_or_404(job_id)
+    if preview.kind != 'preview_assignments' or preview.status != 'succeeded':
+        flash('Only a finished dry run can be applied', 'danger')
+        return redirect(url_for('jobs.job_page', job_id=job_id))
+    
+    params = json.loads(preview.params)
+    job = job_runner.submit(
+        'import_assignments', params,
+        files={params['filename']: job_runner.input_file(preview, params['filename'])}
+    )
+    return redirect(url_for('jobs.job_page', job_id=job.job_id))
@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from app import db, cache
-from app.models.services import Service, ServiceType, Attendance
+from app.models.services import Service, ServiceType
 from app.models.people import Person
-from app.models.organization import Region, Direction, Department, Team, Cell
-from sqlalchemy import or_
-from app.services.cache_service import cache_view, invalidate_cache
+from app.services.org_hierarchy import get_org_hierarchy
+from app.services.attendance_roster import roster_filters, load_roster, load_roster_cells
+from app.services.attendance_writer import apply_attendance, ATTENDANCE_STATUSES
+from app.services.write_behind import write_behind
+from app.services.attendance_changes import latest_seq
+from app.services.live_counters import live_counters
+from app.services.typeahead import people_typeahead
 from datetime import datetime
 
 # Create blueprint
@@ -27,131 +31,32 @@ def attendance_form(service_id):
         is_active = is_active == 'true'
     name_search = request.args.get('name_search', '')
     
-    # Get dropdown data for filters
-    regions = Region.query.order_by(Region.region_name).all()
-    directions = Direction.query.join(Region).order_by(Direction.direction_name).all()
-    departments = Department.query.join(Direction).order_by(Department.department_name).all()
-    teams = Team.query.join(Department).order_by(Team.team_name).all()
-    cells = Cell.query.join(Team).order_by(Cell.cell_name).all()
+    # Get dropdown data for filters from the in-memory hierarchy index
+    org = get_org_hierarchy()
+    regions = org.regions()
+    directions = org.directions()
+    departments = org.departments()
+    teams = org.teams()
+    cells = org.cells()
     
     # Get unique country values for filter dropdown
     countries = db.session.query(Person.country).filter(Person.country != None).distinct().order_by(Person.country).all()
     countries = [country[0] for country in countries if country[0]]
     
-    # Build people query with filters
-    people_query = Person.query.join(Cell).join(Team).join(Department).join(Direction).join(Region)
+    # Change feed position first, so no change after the roster is read is missed
+    change_seq = latest_seq(service_id)
     
-    # Apply filters
-    if is_active is not None:
-        people_query = people_query.filter(Person.is_active == is_active)
-    
-    if region_id:
-        people_query = people_query.filter(Region.region_id == region_id)
-    
-    if direction_id:
-        people_query = people_query.filter(Direction.direction_id == direction_id)
-    
-    if department_id:
-        people_query = people_query.filter(Department.department_id == department_id)
-    
-    if team_id:
-        people_query = people_query.filter(Team.team_id == team_id)
-    
-    if cell_id:
-        people_query = people_query.filter(Cell.cell_id == cell_id)
-        
-    # Filter by country if provided
-    country = request.args.get('country', '')
-    if country:
-        people_query = people_query.filter(Person.country == country)
-    
-    if name_search:
-        people_query = people_query.filter(
-            or_(
-                Person.first_name.ilike(f'%{name_search}%'),
-                Person.last_name.ilike(f'%{name_search}%')
-            )
-        )
-    
-    # Order results
-    people_query = people_query.order_by(
-        Region.region_name, 
-        Direction.direction_name, 
-        Department.department_name, 
-        Team.team_name, 
-        Cell.cell_name,
-        Person.last_name,
-        Person.first_name
-    )
-    
-    people = people_query.all()
-    
-    # Get already marked attendance
-    marked_attendance = Attendance.query.filter(Attendance.service_id == service_id).all()
-    marked_ids = [record.person_id for record in marked_attendance]
-    
-    # Organize people hierarchically
-    organized_people = {}
-    for person in people:
-        region_name = person.cell.team.department.direction.region.region_name
-        region_id = person.cell.team.department.direction.region.region_id
-        
-        direction_name = person.cell.team.department.direction.direction_name
-        direction_id = person.cell.team.department.direction.direction_id
-        
-        department_name = person.cell.team.department.department_name
-        department_id = person.cell.team.department.department_id
-        
-        team_name = person.cell.team.team_name
-        team_id = person.cell.team.team_id
-        
-        cell_name = person.cell.cell_name
-        cell_id = person.cell.cell_id
-        
-        # Create nested dictionary structure for organization
-        if region_name not in organized_people:
-            organized_people[region_name] = {
-                'id': region_id,
-                'directions': {}
-            }
-        
-        if direction_name not in organized_people[region_name]['directions']:
-            organized_people[region_name]['directions'][direction_name] = {
-                'id': direction_id,
-                'departments': {}
-            }
-        
-        if department_name not in organized_people[region_name]['directions'][direction_name]['departments']:
-            organized_people[region_name]['directions'][direction_name]['departments'][department_name] = {
-                'id': department_id,
-                'teams': {}
-            }
-        
-        if team_name not in organized_people[region_name]['directions'][direction_name]['departments'][department_name]['teams']:
-            organized_people[region_name]['directions'][direction_name]['departments'][department_name]['teams'][team_name] = {
-                'id': team_id,
-                'cells': {}
-            }
-        
-        if cell_name not in organized_people[region_name]['directions'][direction_name]['departments'][department_name]['teams'][team_name]['cells']:
-            organized_people[region_name]['directions'][direction_name]['departments'][department_name]['teams'][team_name]['cells'][cell_name] = {
-                'id': cell_id,
-                'people': []
-            }
-        
-        # Add person to the structure
-        organized_people[region_name]['directions'][direction_name]['departments'][department_name]['teams'][team_name]['cells'][cell_name]['people'].append({
-            'id': person.person_id,
-            'name': f"{person.first_name} {person.last_name}",
-            'country': person.country,
-            'marked': person.person_id in marked_ids,
-            'status': next((record.status for record in marked_attendance if record.person_id == person.person_id), 'not-marked')
-        })
+    # Roster grouped region -> cell; large rosters load each cell on demand
+    roster, roster_total = load_roster(service_id, roster_filters(request.args))
     
     return render_template(
         'attendance/form.html',
         service=service,
-        organized_people=organized_people,
+        roster=roster,
+        roster_total=roster_total,
+        change_seq=change_seq,
+        change_wait=current_app.config['ATTENDANCE_CHANGES_MAX_WAIT'] if current_app.config['ATTENDANCE_LONG_POLL'] else 0,
+        change_poll_interval=current_app.config['ATTENDANCE_CHANGES_POLL_INTERVAL'],
         regions=regions,
         directions=directions,
         departments=departments,
@@ -171,6 +76,26 @@ def attendance_form(service_id):
         now=datetime.now()
     )
 
+@attendance_bp.route('/<int:service_id>/roster', methods=['GET'])
+def attendance_roster(service_id):
+    """Roster rows for one cell or team, for expanding a collapsed roster"""
+    filters = roster_filters(request.args)
+    if not filters['cell_id'] and not filters['team_id']:
+        return jsonify({'error': 'cell_id or team_id is required'}), 400
+    
+    cells = load_roster_cells(service_id, filters)
+    return jsonify({
+        'columns': ['id', 'name', 'country', 'status', 'marked'],
+        'cells': [
+            {
+                'cell_id': cell.cell_id,
+                'path': {level: node['name'] for level, node in cell.path.items()},
+                'people': [list(person) for person in cell.people]
+            }
+            for cell in cells
+        ]
+    })
+
 @attendance_bp.route('/<int:service_id>', methods=['POST'])
 def mark_attendance(service_id):
     """Process attendance submission"""
@@ -198,62 +123,26 @@ def mark_attendance(service_id):
             except ValueError:
                 continue
     
-    # Create a list to track updated attendance records
-    updated_records = []
-    
     try:
-        # Process attendance records
-        for person_id, status in person_status.items():
-            # Find the person to validate
-            person = Person.query.get(person_id)
+        if write_behind.enabled:
+            # Logged durably now, written to Postgres by the next batch flush;
+            # live counters follow at that flush, not here
+            person_status = {
+                person_id: status for person_id, status in person_status.items()
+                if status == 'not-marked' or status in ATTENDANCE_STATUSES
+            }
+            write_behind.enqueue(service_id, person_status)
+            updated_records = [
+                {'person_id': person_id, 'status': status}
+                for person_id, status in person_status.items()
+            ]
+        else:
+            # Validate and write every mark in a few set-based statements
+            updated_records, _ = apply_attendance(service_id, person_status)
             
-            if not person:
-                continue
-                
-            if status == 'not-marked':
-                # Remove attendance record if it exists
-                attendance_record = Attendance.query.filter_by(
-                    service_id=service_id,
-                    person_id=person_id
-                ).first()
-                if attendance_record:
-                    db.session.delete(attendance_record)
-                updated_records.append({
-                    'person_id': person_id,
-                    'status': 'not-marked'
-                })
-            else:
-                # Create or update attendance record
-                attendance_record = Attendance.query.filter_by(
-                    service_id=service_id,
-                    person_id=person_id
-                ).first()
-                
-                if attendance_record:
-                    # Update existing record
-                    attendance_record.status = status
-                    attendance_record.check_in_time = datetime.now() if status == 'present' else None
-                    attendance_record.updated_at = datetime.now()
-                else:
-                    # Create new record
-                    attendance_record = Attendance(
-                        service_id=service_id,
-                        person_id=person_id,
-                        status=status,
-                        check_in_time=datetime.now() if status == 'present' else None
-                    )
-                    db.session.add(attendance_record)
-                
-                updated_records.append({
-                    'person_id': person_id,
-                    'status': status
-                })
-        
-        # Commit all changes
-        db.session.commit()
-        
-        # Invalidate any cached attendance data
-        invalidate_cache(f'attendance_{service_id}')
+            # Commit all changes (cached pages are invalidated by the commit hooks)
+            db.session.commit()
+            live_counters.notify()
         
         if is_ajax:
             return jsonify({
@@ -288,25 +177,16 @@ def search_people():
     if not query or len(query) < 2:
         return jsonify([])
     
-    # Search for matching people
-    people = Person.query.filter(
-        or_(
-            Person.first_name.ilike(f'%{query}%'),
-            Person.last_name.ilike(f'%{query}%')
-        ),
-        Person.is_active == True
-    ).limit(20).all()
+    # Search the in-memory index, best matches first
+    people = people_typeahead.search(query, limit=20)
     
     # Check if they're already marked for this service
-    marked_ids = []
-    if service_id:
-        attendance_records = Attendance.query.filter_by(service_id=service_id).all()
-        marked_ids = [record.person_id for record in attendance_records]
+    marked_ids = people_typeahead.marked_ids(service_id) if service_id else frozenset()
     
-    # Format results
+    # Format results (hierarchy paths are prejoined on the index entries)
     results = []
     for person in people:
-        hierarchy = person.hierarchy_path
+        hierarchy = person.path
         results.append({
             'id': person.person_id,
             'name': f"{person.first_name} {person.last_name}",
@@ -318,4 +198,4 @@ def search_people():
             'marked': person.person_id in marked_ids
         })
     
-    return jsonify(results)
\ No newline at end of file
+    return jsonify(results)
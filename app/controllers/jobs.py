@@ -0,0 +1,42 @@
+import os
+
+from flask import Blueprint, render_template, jsonify, send_file, abort
+from datetime import datetime
+
+from app.models.jobs import Job
+from app.services.jobs import job_runner
+
+# Create blueprint
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+@jobs_bp.route('/<job_id>')
+def job_page(job_id):
+    """Progress and outcome of a background job"""
+    job = Job.query.get_or_404(job_id)
+    return render_template('jobs/status.html', job=job, now=datetime.now())
+
+@jobs_bp.route('/<job_id>/status')
+def job_status(job_id):
+    """Current state of a job, polled by the job page"""
+    job = Job.query.get_or_404(job_id)
+    job_runner.expire_if_stale(job)
+    response = jsonify(job.to_dict())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@jobs_bp.route('/<job_id>/download')
+def job_download(job_id):
+    """File produced by a finished job"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'succeeded' or not job.result_name:
+        abort(404)
+
+    path = job_runner.result_file(job)
+    if not os.path.exists(path):
+        abort(410)  # Removed with expired jobs or job directories
+    return send_file(
+        path,
+        mimetype=job.result_mimetype,
+        as_attachment=True,
+        download_name=job.result_name
+    )
@@ -1,13 +1,14 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
-import io
-import csv
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 
 from app import db, cache
 from app.models.services import Service, ServiceType, Attendance
 from app.models.people import Person
 from app.models.organization import Region, Direction, Department, Team, Cell
-from sqlalchemy import func, desc, case
-from app.services.cache_service import cache_view
+from sqlalchemy import func, desc
+from app.services.cache_service import cache_view, ORG_TAGS
+from app.services.org_hierarchy import get_org_hierarchy
+from app.services.report_service import build_detailed_report
+from app.services.jobs import job_runner
 from datetime import datetime, timedelta
 
 # Create blueprint
@@ -15,14 +16,14 @@ reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
 @reports_bp.route('/')
 
-@cache_view(timeout=60)
+@cache_view(timeout=0, tags=('service_types', 'regions'))
 def reports_index():
     """Show report options"""
     # Get service types for filtering
     service_types = ServiceType.query.order_by(ServiceType.service_name).all()
     
     # Get organizational units for filtering
-    regions = Region.query.order_by(Region.region_name).all()
+    regions = get_org_hierarchy().regions()
     
     return render_template(
         'reports/index.html',
@@ -33,7 +34,7 @@ def reports_index():
 
 @reports_bp.route('/attendance-by-date')
 
-@cache_view(timeout=60)
+@cache_view(timeout=0, tags=('attendance', 'services', 'service_types'))
 def attendance_by_date():
     """Get attendance statistics by date"""
     # Parse date range parameters
@@ -116,7 +117,7 @@ def attendance_by_date():
 
 @reports_bp.route('/attendance-by-department')
 
-@cache_view(timeout=60)
+@cache_view(timeout=0, tags=('attendance', 'services', 'service_types', 'people') + ORG_TAGS)
 def attendance_by_department():
     """Get attendance statistics by department"""
     # Parse date range parameters
@@ -354,197 +355,20 @@ def api_attendance_data():
     return jsonify(response)
 
 @reports_bp.route('/detailed-report')
-@cache_view(timeout=0)
+@cache_view(timeout=0, tags=('attendance', 'services', 'people') + ORG_TAGS, lock_timeout=30)
 def detailed_report():
     """Get detailed attendance report with filters"""
-    # Parse date range parameters
     days = request.args.get('days', 30, type=int)
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=days)
-    
-    # Get filters
-    service_type_id = request.args.get('service_type_id', type=int)
-    region_id = request.args.get('region_id', type=int)
-    direction_id = request.args.get('direction_id', type=int)
-    department_id = request.args.get('department_id', type=int)
-    team_id = request.args.get('team_id', type=int)
-    cell_id = request.args.get('cell_id', type=int)
-    gender = request.args.get('gender')
-    download = request.args.get('download') == 'true'
 
     # Get organizational units with their relationships for filtering
-    regions = Region.query.order_by(Region.region_name).all()
-    directions = Direction.query.join(Region).order_by(Direction.direction_name).all()
-    departments = Department.query.join(Direction).order_by(Department.department_name).all()
-    teams = Team.query.join(Department).order_by(Team.team_name).all()
-    cells = Cell.query.join(Team).order_by(Cell.cell_name).all()
-
-    # Build base query for person data
-    query = db.session.query(
-        Person.person_id,
-        Person.first_name,
-        Person.last_name,
-        Person.gender,
-        Cell.cell_name,
-        Team.team_name,
-        Department.department_name,
-        Direction.direction_name,
-        Region.region_name
-    ).select_from(Person).join(
-        Cell, Person.cell_id == Cell.cell_id
-    ).join(
-        Team, Cell.team_id == Team.team_id
-    ).join(
-        Department, Team.department_id == Department.department_id
-    ).join(
-        Direction, Department.direction_id == Direction.direction_id
-    ).join(
-        Region, Direction.region_id == Region.region_id
-    )
-    
-    # Build subquery for attendance data within date range
-    attendance_subquery = db.session.query(
-        Attendance.person_id,
-        func.sum(case(
-            (Attendance.status == 'present', 1),
-            (Attendance.status == 'watched_recording', 0.5),
-            else_=0
-        )).label('attendance_points'),
-        func.count(Attendance.attendance_id).label('marked_services'),
-        func.sum(case(
-            (Attendance.status == 'present', 1),
-            else_=0
-        )).label('present_count'),
-        func.sum(case(
-            (Attendance.status == 'watched_recording', 1),
-            else_=0
-        )).label('watched_recording_count'),
-        func.sum(case(
-            (Attendance.status == 'absent', 1),
-            else_=0
-        )).label('absent_count')
-    ).join(
-        Service, Attendance.service_id == Service.service_id
-    ).filter(
-        Service.service_date.between(start_date, end_date)
-    )
-    
-    # Apply service type filter to the subquery if provided
-    if service_type_id:
-        attendance_subquery = attendance_subquery.filter(Service.service_type_id == service_type_id)
-    
-    # Group the attendance data by person
-    attendance_subquery = attendance_subquery.group_by(Attendance.person_id).subquery()
-    
-    # Get the total number of services in the date range
-    service_count_query = db.session.query(func.count(Service.service_id))
-    service_count_query = service_count_query.filter(Service.service_date.between(start_date, end_date))
-    if service_type_id:
-        service_count_query = service_count_query.filter(Service.service_type_id == service_type_id)
-    total_services = service_count_query.scalar() or 0
-    
-    # Join with the attendance data and add columns from subquery
-    query = query.add_columns(
-        attendance_subquery.c.attendance_points,
-        attendance_subquery.c.marked_services,
-        attendance_subquery.c.present_count,
-        attendance_subquery.c.watched_recording_count,
-        attendance_subquery.c.absent_count
-    ).outerjoin(
-        attendance_subquery,
-        Person.person_id == attendance_subquery.c.person_id
-    )
+    org = get_org_hierarchy()
+    regions = org.regions()
+    directions = org.directions()
+    departments = org.departments()
+    teams = org.teams()
+    cells = org.cells()
 
-    # Apply filters
-    if region_id:
-        query = query.filter(Region.region_id == region_id)
-    if direction_id:
-        query = query.filter(Direction.direction_id == direction_id)
-    if department_id:
-        query = query.filter(Department.department_id == department_id)
-    if team_id:
-        query = query.filter(Team.team_id == team_id)
-    if cell_id:
-        query = query.filter(Cell.cell_id == cell_id)
-    if gender:
-        query = query.filter(Person.gender == gender)
-
-    # Order results
-    query = query.order_by(
-        Region.region_name,
-        Direction.direction_name,
-        Department.department_name,
-        Team.team_name,
-        Cell.cell_name,
-        Person.first_name,
-        Person.last_name
-    )
-
-    # Process results
-    results_list = []
-    for person_data in query.all():
-        # Get attendance stats, defaulting to 0 if None
-        attendance_points = float(person_data.attendance_points or 0)
-        marked_services = int(person_data.marked_services or 0)
-        present_count = int(person_data.present_count or 0)
-        watched_recording_count = int(person_data.watched_recording_count or 0)
-        absent_count = int(person_data.absent_count or 0)
-        
-        # Calculate percentage based on points
-        # Present = 1 point, Watched Recording = 0.5 points
-        max_possible_points = total_services * 1.0  # Maximum points if present at all services
-        attendance_percentage = (attendance_points / max_possible_points * 100) if max_possible_points > 0 else 0
-        
-        # Create result object
-        result = {
-            'first_name': person_data.first_name,
-            'last_name': person_data.last_name,
-            'gender': person_data.gender,
-            'cell_name': person_data.cell_name,
-            'team_name': person_data.team_name,
-            'department_name': person_data.department_name,
-            'direction_name': person_data.direction_name,
-            'region_name': person_data.region_name,
-            'present_count': present_count,
-            'watched_recording_count': watched_recording_count,
-            'absent_count': absent_count,
-            'marked_services': marked_services,
-            'total_services': total_services,
-            'attendance_percentage': attendance_percentage
-        }
-        results_list.append(result)
-
-    if download:
-        # Prepare CSV data
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow([
-            'First Name', 'Last Name', 'Gender', 'Cell', 'Team', 
-            'Department', 'Zone', 'Region', 'Present Count', 
-            'Watched Recording Count', 'Absent Count', 'Total Marked',
-            'Total Services', 'Attendance Percentage'
-        ])
-        
-        # Write data
-        for row in results_list:
-            writer.writerow([
-                row['first_name'], row['last_name'], row['gender'] or 'Not specified',
-                row['cell_name'], row['team_name'], row['department_name'],
-                row['direction_name'], row['region_name'], row['present_count'],
-                row['watched_recording_count'], row['absent_count'], row['marked_services'],
-                row['total_services'], f"{row['attendance_percentage']:.1f}%"
-            ])
-        
-        # Prepare response
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'attendance_report_{datetime.now().strftime("%Y%m%d")}.csv'
-        )
+    results_list, total_services = build_detailed_report(request.args)
 
     # For AJAX requests, return JSON with proper content type
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -569,3 +393,12 @@ def detailed_report():
         now=datetime.now(),
         total_services=total_services
     )
+
+@reports_bp.route('/detailed-report/export', methods=['POST'])
+def export_detailed_report():
+    """Start a CSV export of the detailed report with the posted filters"""
+    # Large exports run in the background; the job page offers the file
+    args = request.form.to_dict(flat=False)
+    args.pop('csrf_token', None)
+    job = job_runner.submit('detailed_report_csv', {'args': args})
+    return redirect(url_for('jobs.job_page', job_id=job.job_id))
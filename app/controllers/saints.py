@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, abort
 from app import db, cache
 from app.models.people import Person
-from app.models.organization import Region, Direction, Department, Team, Cell
-from sqlalchemy import or_, func
-from app.services.cache_service import cache_view, invalidate_cache
+from sqlalchemy import func
+from app.services.cache_service import cache_view, cached_count, invalidate_cache, ORG_TAGS
+from app.services.org_hierarchy import get_org_hierarchy, resolve_hierarchy_paths
+from app.services.name_search import name_filter
+from app.services.pagination import keyset_paginate, InvalidCursor
 from datetime import datetime
 import math
 
@@ -11,7 +13,7 @@ import math
 saints_bp = Blueprint('saints', __name__, url_prefix='/saints')
 
 @saints_bp.route('/')
-@cache_view(timeout=30)
+@cache_view(timeout=0, tags=('people',) + ORG_TAGS)
 def saints_list():
     """View all saints with filtering options"""
     # Get filter parameters
@@ -24,155 +26,52 @@ def saints_list():
     name_search = request.args.get('name_search', '')
     ajax_request = request.args.get('ajax', 'false') == 'true'
     
-    # Get dropdown data for filters with optimized queries
-    regions = Region.query.order_by(Region.region_name).all()
+    # Get dropdown data for filters from the in-memory hierarchy index
+    org = get_org_hierarchy()
+    regions = org.regions()
     
     # Get unique country values for filter dropdown
     countries = db.session.query(Person.country).filter(Person.country != None).distinct().order_by(Person.country).all()
     countries = [country[0] for country in countries if country[0]]
     
-    # Get directions with their parent region info
-    directions_query = db.session.query(
-        Direction.direction_id,
-        Direction.direction_name,
-        Direction.region_id,
-        Region.region_name.label('region_name')
-    ).join(
-        Region, Direction.region_id == Region.region_id
-    )
-    
-    # Filter directions by region if selected
-    if region_id:
-        directions_query = directions_query.filter(Direction.region_id == region_id)
-    
-    directions = directions_query.order_by(Region.region_name, Direction.direction_name).all()
-    
-    # Get departments with their parent direction info to handle duplicates
-    departments_query = db.session.query(
-        Department.department_id,
-        Department.department_name,
-        Department.direction_id,
-        Direction.direction_name.label('direction_name'),
-        Region.region_name.label('region_name')
-    ).join(
-        Direction, Department.direction_id == Direction.direction_id
-    ).join(
-        Region, Direction.region_id == Region.region_id
-    )
-    
-    # Filter departments by region and direction if selected
-    if region_id:
-        departments_query = departments_query.filter(Region.region_id == region_id)
-    if direction_id:
-        departments_query = departments_query.filter(Department.direction_id == direction_id)
-    
-    departments = departments_query.order_by(Department.department_name, Direction.direction_name).all()
-    
-    # Group departments by name to identify duplicates
-    departments_by_name = {}
-    for dept in departments:
-        if dept.department_name not in departments_by_name:
-            departments_by_name[dept.department_name] = []
-        departments_by_name[dept.department_name].append(dept)
-    
-    # Format department names to include parent context for duplicates
-    formatted_departments = []
-    for dept_name, dept_list in departments_by_name.items():
-        if len(dept_list) > 1:
-            # Multiple departments with the same name
-            for dept in dept_list:
-                formatted_departments.append({
-                    'department_id': dept.department_id,
-                    'department_name': f"{dept.department_name} ({dept.direction_name})",
-                    'direction_id': dept.direction_id
-                })
-        else:
-            # Just one department with this name
-            dept = dept_list[0]
-            formatted_departments.append({
-                'department_id': dept.department_id,
-                'department_name': dept.department_name,
-                'direction_id': dept.direction_id
-            })
-    
-    # Sort formatted departments by name
-    formatted_departments.sort(key=lambda x: x['department_name'])
-    
-    # Get teams with parent department info
-    teams_query = db.session.query(
-        Team.team_id,
-        Team.team_name,
-        Team.department_id,
-        Department.department_name.label('department_name'),
-        Department.direction_id.label('direction_id')
-    ).join(
-        Department, Team.department_id == Department.department_id
-    ).join(
-        Direction, Department.direction_id == Direction.direction_id
-    ).join(
-        Region, Direction.region_id == Region.region_id
-    )
-    
-    # Filter teams by region, direction, and department if selected
-    if region_id:
-        teams_query = teams_query.filter(Region.region_id == region_id)
-    if direction_id:
-        teams_query = teams_query.filter(Direction.direction_id == direction_id)
-    if department_id:
-        teams_query = teams_query.filter(Department.department_id == department_id)
-    
-    teams = teams_query.order_by(Team.team_name).all()
-    
-    # Get cells with parent team info
-    cells_query = db.session.query(
-        Cell.cell_id,
-        Cell.cell_name,
-        Cell.team_id,
-        Team.team_name.label('team_name'),
-        Team.department_id.label('department_id')
-    ).join(
-        Team, Cell.team_id == Team.team_id
-    ).join(
-        Department, Team.department_id == Department.department_id
-    ).join(
-        Direction, Department.direction_id == Direction.direction_id
-    ).join(
-        Region, Direction.region_id == Region.region_id
-    )
+    # Directions grouped by their parent region
+    directions = sorted(org.directions(region_id), key=lambda d: (d.region_name, d.direction_name))
     
-    # Filter cells by region, direction, department, and team if selected
-    if region_id:
-        cells_query = cells_query.filter(Region.region_id == region_id)
-    if direction_id:
-        cells_query = cells_query.filter(Direction.direction_id == direction_id)
-    if department_id:
-        cells_query = cells_query.filter(Department.department_id == department_id)
-    if team_id:
-        cells_query = cells_query.filter(Team.team_id == team_id)
+    # Departments with duplicate names carry their direction in the label
+    formatted_departments = [
+        {
+            'department_id': dept.department_id,
+            'department_name': dept.label,
+            'direction_id': dept.direction_id
+        }
+        for dept in org.departments(region_id, direction_id)
+    ]
     
-    cells = cells_query.order_by(Cell.cell_name).all()
+    teams = org.teams(region_id, direction_id, department_id)
+    cells = org.cells(region_id, direction_id, department_id, team_id)
     
-    # Build people query with filters
-    people_query = Person.query.join(Cell).join(Team).join(Department).join(Direction).join(Region)
+    # Build people query with filters on the person's ancestor id columns,
+    # so the count reads people alone
+    people_query = Person.query
     
     # Apply filters
     if is_active is not None:
         people_query = people_query.filter(Person.is_active == is_active)
     
     if region_id:
-        people_query = people_query.filter(Region.region_id == region_id)
+        people_query = people_query.filter(Person.region_id == region_id)
     
     if direction_id:
-        people_query = people_query.filter(Direction.direction_id == direction_id)
+        people_query = people_query.filter(Person.direction_id == direction_id)
     
     if department_id:
-        people_query = people_query.filter(Department.department_id == department_id)
+        people_query = people_query.filter(Person.department_id == department_id)
     
     if team_id:
-        people_query = people_query.filter(Team.team_id == team_id)
+        people_query = people_query.filter(Person.team_id == team_id)
     
     if cell_id:
-        people_query = people_query.filter(Cell.cell_id == cell_id)
+        people_query = people_query.filter(Person.cell_id == cell_id)
         
     # Filter by country if provided
     country = request.args.get('country', '')
@@ -180,31 +79,44 @@ def saints_list():
         people_query = people_query.filter(Person.country == country)
     
     if name_search:
-        people_query = people_query.filter(
-            or_(
-                Person.first_name.ilike(f'%{name_search}%'),
-                Person.last_name.ilike(f'%{name_search}%')
-            )
-        )
+        people_query = people_query.filter(name_filter(name_search))
     
-    # Order results
-    people_query = people_query.order_by(
-        Region.region_name, 
-        Direction.direction_name, 
-        Department.department_name, 
-        Team.team_name, 
-        Cell.cell_name,
+    # Total comes from a count cached until people or the hierarchy change,
+    # so flipping pages never re-counts
+    total = cached_count(people_query, ('people',) + ORG_TAGS, name='saints_list')
+    
+    # Keyset pagination on the display order; person_id makes it total.
+    # The org names are denormalised onto people, so people_org_sort_idx
+    # serves this order without joining the hierarchy
+    sort_columns = (
+        Person.org_sort_names,
         Person.last_name,
-        Person.first_name
+        Person.first_name,
+        Person.person_id
     )
-    
-    # Paginate results
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
-    pagination = people_query.paginate(page=page, per_page=per_page, error_out=False)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    try:
+        pagination = keyset_paginate(
+            people_query,
+            sort_columns,
+            per_page,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            total=total
+        )
+    except InvalidCursor:
+        abort(400)
     people = pagination.items
     
+    # Resolve the page's hierarchy paths in one batch
+    paths = resolve_hierarchy_paths(people)
+    
     # Handle AJAX requests
+    if ajax_request and request.args.get('format') == 'compact':
+        return jsonify(_compact_people_payload(
+            people, paths, pagination, include_html=request.args.get('html') == 'true'
+        ))
+    
     if ajax_request:
         # Prepare JSON response
         people_data = []
@@ -216,73 +128,28 @@ def saints_list():
                 'mobile_number': person.phone or 'Not available',
                 'is_active': person.is_active,
                 'country': person.country or 'Not specified',
-                'cell': person.cell.cell_name,
-                'team': person.cell.team.team_name,
-                'department': person.cell.team.department.department_name,
-                'direction': person.cell.team.department.direction.direction_name,
-                'region': person.cell.team.department.direction.region.region_name
+                'cell': paths[person.cell_id]['cell']['name'],
+                'team': paths[person.cell_id]['team']['name'],
+                'department': paths[person.cell_id]['department']['name'],
+                'direction': paths[person.cell_id]['direction']['name'],
+                'region': paths[person.cell_id]['region']['name']
             })
         
         # Create pagination info
-        pagination_data = {
-            'page': pagination.page,
-            'pages': pagination.pages,
-            'per_page': pagination.per_page,
-            'total': pagination.total,
-            'has_prev': pagination.has_prev,
-            'has_next': pagination.has_next,
-            'prev_num': pagination.prev_num if pagination.has_prev else None,
-            'next_num': pagination.next_num if pagination.has_next else None
-        }
-        
-        # Generate HTML for table rows for easier rendering
-        html_content = ""
-        if people:
-            for person in people:
-                html_content += f"""
-                <tr>
-                    <td>{person.first_name} {person.last_name}</td>
-                    <td>{person.phone or 'Not available'}</td>
-                    <td>{person.country or 'Not specified'}</td>
-                    <td>{person.cell.cell_name}</td>
-                    <td>{person.cell.team.team_name}</td>
-                    <td>{person.cell.team.department.department_name}</td>
-                    <td>{person.cell.team.department.direction.direction_name}</td>
-                    <td>{person.cell.team.department.direction.region.region_name}</td>
-                    <td>
-                        <span class="badge {'badge-success' if person.is_active else 'badge-danger'}">
-                            {'Active' if person.is_active else 'Inactive'}
-                        </span>
-                    </td>
-                </tr>
-                """
-        else:
-            html_content = '<tr><td colspan="9" class="text-center">No saints found matching the current filters.</td></tr>'
-        
-        # Generate pagination HTML
-        pagination_html = ""
-        if pagination.pages > 1:
-            pagination_html = f"""
-            <div class="pagination-info">
-                Showing {pagination.page} of {pagination.pages} pages
-            </div>
-            <div class="pagination-controls">
-                {'<a href="' + url_for('saints.saints_list', page=pagination.prev_num, **{k: v for k, v in request.args.items() if k != 'page'}) + '" class="btn btn-outline btn-sm pagination-prev">Previous</a>' if pagination.has_prev else '<button class="btn btn-outline btn-sm" disabled>Previous</button>'}
-                {'<a href="' + url_for('saints.saints_list', page=pagination.next_num, **{k: v for k, v in request.args.items() if k != 'page'}) + '" class="btn btn-outline btn-sm pagination-next">Next</a>' if pagination.has_next else '<button class="btn btn-outline btn-sm" disabled>Next</button>'}
-            </div>
-            """
+        pagination_data = pagination.to_dict()
         
         return jsonify({
             'people': people_data,
             'pagination': pagination_data,
-            'html': html_content,
-            'pagination_html': pagination_html
+            'html': _people_rows_html(people, paths),
+            'pagination_html': _pagination_html(people, pagination)
         })
     
     # Render template for regular requests
     return render_template(
         'saints/index.html',
         people=people,
+        hierarchy_paths=paths,
         pagination=pagination,
         regions=regions,
         directions=directions,
@@ -302,3 +169,89 @@ def saints_list():
         },
         now=datetime.now()
     )
+
+# Columns of the compact AJAX format; hierarchy columns hold label indexes
+COMPACT_COLUMNS = (
+    'person_id', 'first_name', 'last_name', 'mobile_number', 'is_active', 'country',
+    'cell', 'team', 'department', 'direction', 'region'
+)
+HIERARCHY_LEVELS = ('cell', 'team', 'department', 'direction', 'region')
+
+def _compact_people_payload(people, paths, pagination, include_html=False):
+    """Columnar form of a saints page: column names once, rows as arrays,
+    and hierarchy names as indexes into a shared label table"""
+    labels = []
+    label_index = {}
+    
+    def label(name):
+        index = label_index.get(name)
+        if index is None:
+            index = label_index[name] = len(labels)
+            labels.append(name)
+        return index
+    
+    rows = []
+    for person in people:
+        hierarchy = paths[person.cell_id]
+        rows.append([
+            person.person_id,
+            person.first_name,
+            '' if isinstance(person.last_name, float) and math.isnan(person.last_name) else person.last_name,
+            person.phone,
+            1 if person.is_active else 0,
+            person.country
+        ] + [label(hierarchy[level]['name']) for level in HIERARCHY_LEVELS])
+    
+    payload = {
+        'columns': COMPACT_COLUMNS,
+        'labels': labels,
+        'rows': rows,
+        'pagination': pagination.to_dict()
+    }
+    if include_html:
+        payload['html'] = _people_rows_html(people, paths)
+        payload['pagination_html'] = _pagination_html(people, pagination)
+    return payload
+
+def _people_rows_html(people, paths):
+    """Table rows for a page of saints, as rendered by the AJAX branch"""
+    if not people:
+        return '<tr><td colspan="9" class="text-center">No saints found matching the current filters.</td></tr>'
+    
+    html_content = ""
+    for person in people:
+        hierarchy = paths[person.cell_id]
+        html_content += f"""
+        <tr>
+            <td>{person.first_name} {person.last_name}</td>
+            <td>{person.phone or 'Not available'}</td>
+            <td>{person.country or 'Not specified'}</td>
+            <td>{hierarchy['cell']['name']}</td>
+            <td>{hierarchy['team']['name']}</td>
+            <td>{hierarchy['department']['name']}</td>
+            <td>{hierarchy['direction']['name']}</td>
+            <td>{hierarchy['region']['name']}</td>
+            <td>
+                <span class="badge {'badge-success' if person.is_active else 'badge-danger'}">
+                    {'Active' if person.is_active else 'Inactive'}
+                </span>
+            </td>
+        </tr>
+        """
+    return html_content
+
+def _pagination_html(people, pagination):
+    """Pagination controls for the AJAX branch; empty for a single page"""
+    if not (pagination.has_prev or pagination.has_next):
+        return ""
+    
+    link_args = {k: v for k, v in request.args.items() if k not in ('page', 'after', 'before', 'format', 'html')}
+    return f"""
+    <div class="pagination-info">
+        Showing {len(people)} of {pagination.total} saints
+    </div>
+    <div class="pagination-controls">
+        {'<a href="' + url_for('saints.saints_list', before=pagination.prev_cursor, **link_args) + '" class="btn btn-outline btn-sm pagination-prev">Previous</a>' if pagination.has_prev else '<button class="btn btn-outline btn-sm" disabled>Previous</button>'}
+        {'<a href="' + url_for('saints.saints_list', after=pagination.next_cursor, **link_args) + '" class="btn btn-outline btn-sm pagination-next">Next</a>' if pagination.has_next else '<button class="btn btn-outline btn-sm" disabled>Next</button>'}
+    </div>
+    """
@@ -9,7 +9,7 @@ from sqlalchemy import desc
 services_bp = Blueprint('services', __name__, url_prefix='/services')
 
 @services_bp.route('/')
-@cache_view(timeout=30)  # Cache services page for 30 seconds
+@cache_view(timeout=0, tags=('services', 'service_types'))  # Cache services page until services change
 def services_list():
     """Show services based on filter (upcoming or previous)"""
     # Get view parameter from request (default to 'upcoming')
@@ -0,0 +1,45 @@
+from app import db
+from sqlalchemy.sql import func
+import json
+
+class Job(db.Model):
+    """Background job (import or export) run by the local job runner"""
+    __tablename__ = 'jobs'
+    __table_args__ = {'schema': 'church'}
+    
+    job_id = db.Column(db.String(36), primary_key=True)  # UUID
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    params = db.Column(db.Text)  # JSON
+    progress = db.Column(db.Integer, nullable=False, default=0)  # Percent
+    message = db.Column(db.Text)
+    summary = db.Column(db.Text)  # JSON
+    result_name = db.Column(db.String(255))  # Download file name, when the job produces a file
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed by the owning web worker while unfinished
+    
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'summary': json.loads(self.summary) if self.summary else None,
+            'has_result': bool(self.result_name) and self.status == 'succeeded',
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<Job {self.kind} {self.job_id} {self.status}>'
@@ -1,5 +1,7 @@
 from app import db
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import func
+from sqlalchemy.schema import FetchedValue
 
 class Person(db.Model):
     __tablename__ = 'people'
@@ -10,6 +12,15 @@ class Person(db.Model):
     last_name = db.Column(db.String(50), nullable=False)
     cell_id = db.Column(db.Integer, db.ForeignKey('church.cells.cell_id'), nullable=False)
     direction = db.Column(db.String(100), nullable=False)  # Added direction column
+    # Ancestor ids of the person's cell, maintained by database triggers
+    # (migrations/001_people_ancestor_columns.sql) for single-column filtering
+    team_id = db.Column(db.Integer, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    department_id = db.Column(db.Integer, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    direction_id = db.Column(db.Integer, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    region_id = db.Column(db.Integer, server_default=FetchedValue(), server_onupdate=FetchedValue(), index=True)
+    # Region..cell names, the listing order, maintained by database triggers
+    # (migrations/007_people_org_sort_names.sql)
+    org_sort_names = db.Column(ARRAY(db.Text), nullable=False, server_default='{}', server_onupdate=FetchedValue())
     email = db.Column(db.String(100))
     phone = db.Column(db.String(20))
     country = db.Column(db.String(50), nullable=True)
@@ -28,29 +39,15 @@ class Person(db.Model):
     
     @property
     def hierarchy_path(self):
-        """Returns full organizational hierarchy path as a dictionary"""
-        return {
-            'cell': {
-                'id': self.cell.cell_id,
-                'name': self.cell.cell_name
-            },
-            'team': {
-                'id': self.cell.team.team_id,
-                'name': self.cell.team.team_name
-            },
-            'department': {
-                'id': self.cell.team.department.department_id,
-                'name': self.cell.team.department.department_name
-            },
-            'direction': {
-                'id': self.cell.team.department.direction.direction_id,
-                'name': self.cell.team.department.direction.direction_name
-            },
-            'region': {
-                'id': self.cell.team.department.direction.region.region_id,
-                'name': self.cell.team.department.direction.region.region_name
-            }
-        }
+        """Returns full organizational hierarchy path as a dictionary
+
+        Resolved from the in-memory org index rather than walking
+        ``cell.team.department.direction.region`` through lazy loads.
+        Use ``resolve_hierarchy_paths`` when handling many people.
+        """
+        from app.services.org_hierarchy import resolve_hierarchy_paths
+        path = resolve_hierarchy_paths([self.cell_id])[self.cell_id]
+        return {level: dict(node) for level, node in path.items()}
     
     def __repr__(self):
         return f'<Person {self.full_name}>'
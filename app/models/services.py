@@ -61,7 +61,10 @@ class Service(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
-    __table_args__ = {'schema': 'church'}
+    __table_args__ = (
+        db.UniqueConstraint('service_id', 'person_id', name='attendance_service_person_key'),
+        {'schema': 'church'}
+    )
     
     attendance_id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.Integer, db.ForeignKey('church.services.service_id'), nullable=False)
@@ -78,3 +81,40 @@ class Attendance(db.Model):
     
     def __repr__(self):
         return f'<Attendance {self.person.full_name} at {self.service.service_type.service_name} - {self.status}>'
+
+
+class AttendanceSyncOp(db.Model):
+    """Attendance operation received from an offline client, kept to deduplicate replays"""
+    __tablename__ = 'attendance_sync_ops'
+    __table_args__ = (
+        db.Index('attendance_sync_ops_mark_idx', 'service_id', 'person_id', 'client_ts'),
+        {'schema': 'church'}
+    )
+    
+    op_id = db.Column(db.String(64), primary_key=True)  # Client-generated, e.g. a UUID
+    device_id = db.Column(db.String(64))
+    service_id = db.Column(db.Integer, db.ForeignKey('church.services.service_id'), nullable=False)
+    person_id = db.Column(db.Integer, db.ForeignKey('church.people.person_id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    client_ts = db.Column(db.DateTime, nullable=False)  # UTC
+    result = db.Column(db.String(20), nullable=False)  # 'applied', 'superseded', 'stale'
+    received_at = db.Column(db.DateTime, server_default=func.now())
+    
+    def __repr__(self):
+        return f'<AttendanceSyncOp {self.op_id} {self.result}>'
+
+
+class AttendanceChange(db.Model):
+    """Row of the per-service attendance change feed, written by a trigger"""
+    __tablename__ = 'attendance_changes'
+    __table_args__ = {'schema': 'church'}
+    
+    service_id = db.Column(db.Integer, db.ForeignKey('church.services.service_id'), primary_key=True)
+    seq = db.Column(db.BigInteger, primary_key=True)
+    person_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20))  # None when the mark was removed
+    previous_status = db.Column(db.String(20))
+    changed_at = db.Column(db.DateTime, server_default=func.now())
+    
+    def __repr__(self):
+        return f'<AttendanceChange {self.service_id}#{self.seq} {self.person_id} {self.status}>'
@@ -0,0 +1,58 @@
+"""
+Per-service attendance change feed with long-poll support
+"""
+import time
+
+from sqlalchemy import func
+
+from app import db
+from app.models.services import AttendanceChange
+from app.services.cache_service import tag_versions
+
+# How often a waiting request checks the attendance cache tag
+POLL_INTERVAL = 0.5
+
+# Re-query even without a tag bump, in case a write bypassed the app
+FORCE_CHECK_INTERVAL = 5
+
+CHANGE_COLUMNS = ('seq', 'person_id', 'status', 'previous_status')
+
+def latest_seq(service_id):
+    """Current end of a service's change feed (0 before the first change)"""
+    seq = db.session.query(func.max(AttendanceChange.seq)).filter(
+        AttendanceChange.service_id == service_id
+    ).scalar()
+    return seq or 0
+
+def changes_since(service_id, since, limit=1000):
+    """Changes after ``since``, oldest first, and whether more remain"""
+    rows = db.session.query(
+        AttendanceChange.seq, AttendanceChange.person_id,
+        AttendanceChange.status, AttendanceChange.previous_status
+    ).filter(
+        AttendanceChange.service_id == service_id,
+        AttendanceChange.seq > since
+    ).order_by(AttendanceChange.seq).limit(limit + 1).all()
+    return [tuple(row) for row in rows[:limit]], len(rows) > limit
+
+def wait_for_changes(service_id, since, wait=0, limit=1000):
+    """Like ``changes_since``, but wait up to ``wait`` seconds for a change
+
+    While waiting only the attendance cache tag is polled, which every
+    committed attendance write bumps; the feed is queried again when it
+    moves. The session is released between checks so a waiting request
+    holds no connection or transaction.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        changes, more = changes_since(service_id, since, limit)
+        db.session.rollback()
+        if changes or time.monotonic() >= deadline:
+            return changes, more
+
+        version = tag_versions(('attendance',))
+        checked_at = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            if tag_versions(('attendance',)) != version or time.monotonic() - checked_at >= FORCE_CHECK_INTERVAL:
+                break
@@ -0,0 +1,107 @@
+"""
+Attendance roster for a service, grouped by the organisational hierarchy
+"""
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models.people import Person
+from app.models.services import Attendance
+from app.services.name_search import name_filter
+from app.services.org_hierarchy import get_org_hierarchy
+
+RosterEntry = namedtuple('RosterEntry', 'person_id name country status marked')
+
+# One cell of the roster; ``people`` is None until the cell is loaded
+RosterCell = namedtuple('RosterCell', 'cell_id path count people')
+
+ROSTER_FILTERS = ('region_id', 'direction_id', 'department_id', 'team_id', 'cell_id')
+
+def roster_filters(args):
+    """Roster filters from request arguments, in the form ``load_roster`` takes"""
+    is_active = args.get('is_active', default=None)
+    filters = {level: args.get(level, type=int) for level in ROSTER_FILTERS}
+    filters.update({
+        'is_active': is_active == 'true' if is_active is not None else None,
+        'country': args.get('country', ''),
+        'name_search': args.get('name_search', '')
+    })
+    return filters
+
+def _filtered(query, filters):
+    """Apply roster filters; hierarchy filters use the ancestor id columns"""
+    if filters.get('is_active') is not None:
+        query = query.filter(Person.is_active == filters['is_active'])
+    for level in ROSTER_FILTERS:
+        if filters.get(level):
+            query = query.filter(getattr(Person, level) == filters[level])
+    if filters.get('country'):
+        query = query.filter(Person.country == filters['country'])
+    if filters.get('name_search'):
+        query = query.filter(name_filter(filters['name_search']))
+    return query
+
+def _statuses(service_id, filters):
+    """person_id -> status for the service, limited to the filtered people"""
+    rows = _filtered(
+        db.session.query(Attendance.person_id, Attendance.status)
+        .join(Person, Person.person_id == Attendance.person_id)
+        .filter(Attendance.service_id == service_id),
+        filters
+    )
+    return dict(rows)
+
+def _cell_order(org, cell_id):
+    path = org.path(cell_id)
+    return tuple(path[level]['name'] for level in ('region', 'direction', 'department', 'team', 'cell'))
+
+def load_roster(service_id, filters, inline_limit=None):
+    """Roster cells for a service, ordered region -> cell
+
+    Cell sizes come from one grouped count. When the roster fits within
+    ``inline_limit`` people it is loaded with a single projected query and
+    one status lookup; larger rosters return only the cell sizes, and each
+    cell's people are fetched on demand with ``load_roster_cells``.
+    """
+    if inline_limit is None:
+        inline_limit = current_app.config.get('ATTENDANCE_ROSTER_INLINE_LIMIT', 300)
+
+    org = get_org_hierarchy()
+    counts = dict(
+        _filtered(db.session.query(Person.cell_id, func.count(Person.person_id)), filters)
+        .group_by(Person.cell_id)
+    )
+    cell_ids = sorted((cell_id for cell_id in counts if org.cell(cell_id)), key=lambda cell_id: _cell_order(org, cell_id))
+    total = sum(counts[cell_id] for cell_id in cell_ids)
+
+    people = load_roster_people(service_id, filters) if total <= inline_limit else {}
+    cells = [
+        RosterCell(cell_id, org.path(cell_id), counts[cell_id], people.get(cell_id, []) if total <= inline_limit else None)
+        for cell_id in cell_ids
+    ]
+    return cells, total
+
+def load_roster_people(service_id, filters):
+    """cell_id -> people (sorted by name) with their status for the service"""
+    statuses = _statuses(service_id, filters)
+    rows = _filtered(db.session.query(
+        Person.person_id, Person.first_name, Person.last_name, Person.country, Person.cell_id
+    ), filters).order_by(Person.last_name, Person.first_name)
+
+    people = {}
+    for person_id, first_name, last_name, country, cell_id in rows:
+        status = statuses.get(person_id)
+        people.setdefault(cell_id, []).append(RosterEntry(
+            person_id, f"{first_name} {last_name}", country or 'Not specified',
+            status or 'not-marked', status is not None
+        ))
+    return people
+
+def load_roster_cells(service_id, filters):
+    """Fully loaded roster cells for a cell or team, for lazy expansion"""
+    org = get_org_hierarchy()
+    people = load_roster_people(service_id, filters)
+    cell_ids = sorted((cell_id for cell_id in people if org.cell(cell_id)), key=lambda cell_id: _cell_order(org, cell_id))
+    return [RosterCell(cell_id, org.path(cell_id), len(people[cell_id]), people[cell_id]) for cell_id in cell_ids]
@@ -0,0 +1,182 @@
+"""
+Batched, idempotent attendance sync for offline clients
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.services import Service, Attendance, AttendanceSyncOp
+from app.services.attendance_writer import apply_attendance, ATTENDANCE_STATUSES
+from app.services.cache_service import record_dirty_tags
+
+SYNC_STATUSES = ATTENDANCE_STATUSES + ('not-marked',)
+
+def parse_client_ts(value):
+    """Client timestamp as naive UTC; accepts ISO 8601 or epoch milliseconds"""
+    if isinstance(value, bool):
+        raise ValueError('invalid client_ts')
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError('invalid client_ts')
+
+def utc_to_local(value):
+    """Naive UTC timestamp as naive local time, as attendance rows store it"""
+    return value.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def local_to_utc(value):
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _parse_op(raw):
+    """Validated operation dict, or raise ValueError with the reason"""
+    if not isinstance(raw, dict):
+        raise ValueError('malformed')
+    op_id = raw.get('op_id')
+    if not isinstance(op_id, str) or not op_id or len(op_id) > 64:
+        raise ValueError('invalid op_id')
+
+    status = raw.get('status')
+    if status == 'watched-recording':
+        status = 'watched_recording'
+    if status not in SYNC_STATUSES:
+        raise ValueError('invalid status')
+
+    try:
+        service_id = int(raw['service_id'])
+        person_id = int(raw['person_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('invalid service_id or person_id')
+
+    try:
+        client_ts = parse_client_ts(raw.get('client_ts'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('invalid client_ts')
+
+    return {
+        'op_id': op_id,
+        'service_id': service_id,
+        'person_id': person_id,
+        'status': status,
+        'client_ts': client_ts
+    }
+
+def sync_attendance(raw_ops, device_id=None):
+    """Apply a batch of client attendance operations in the current transaction
+
+    Operations whose ids were seen before are acknowledged without being
+    applied again. For each (service, person) only the operation with the
+    latest client timestamp is written; earlier ones in the batch are
+    ``superseded``, and ones older than the mark's last write (an applied
+    sync operation or the attendance row itself, e.g. from the web form)
+    are ``stale``. Applied marks keep the client timestamp as their time.
+    The caller commits.
+
+    Returns ``(ack, rejected)``: ``ack`` maps each accepted op_id to its
+    result and ``rejected`` maps op_ids that were not accepted to a reason.
+    Operations without a usable op_id are rejected under ``ops[<index>]``.
+    """
+    ack = {}
+    rejected = {}
+    ops = {}
+    for index, raw in enumerate(raw_ops):
+        try:
+            op = _parse_op(raw)
+        except ValueError as e:
+            op_id = raw.get('op_id') if isinstance(raw, dict) else None
+            if not isinstance(op_id, str) or not op_id or len(op_id) > 64 or op_id in rejected:
+                op_id = f'ops[{index}]'
+            rejected[op_id] = str(e)
+            continue
+        ops[op['op_id']] = op
+
+    if not ops:
+        return ack, rejected
+
+    # Replays of operations that were already accepted
+    seen = db.session.query(AttendanceSyncOp.op_id).filter(AttendanceSyncOp.op_id.in_(list(ops)))
+    for op_id, in seen:
+        ack[op_id] = 'duplicate'
+        del ops[op_id]
+
+    # Unknown services are rejected as a whole
+    service_ids = {op['service_id'] for op in ops.values()}
+    known_services = {
+        service_id for service_id, in
+        db.session.query(Service.service_id).filter(Service.service_id.in_(service_ids))
+    } if service_ids else set()
+    for op_id, op in list(ops.items()):
+        if op['service_id'] not in known_services:
+            rejected[op_id] = 'unknown service'
+            del ops[op_id]
+
+    # Latest operation per mark wins, within the batch and against earlier batches
+    latest = {}
+    for op in sorted(ops.values(), key=lambda op: (op['client_ts'], op['op_id'])):
+        latest[(op['service_id'], op['person_id'])] = op
+
+    applied_ts = dict(
+        ((service_id, person_id), client_ts) for service_id, person_id, client_ts in
+        db.session.query(
+            AttendanceSyncOp.service_id, AttendanceSyncOp.person_id, func.max(AttendanceSyncOp.client_ts)
+        ).filter(
+            AttendanceSyncOp.result == 'applied',
+            tuple_(AttendanceSyncOp.service_id, AttendanceSyncOp.person_id).in_(list(latest))
+        ).group_by(AttendanceSyncOp.service_id, AttendanceSyncOp.person_id)
+    ) if latest else {}
+
+    # Marks written any other way count by their stored (local) time
+    if latest:
+        marked = db.session.query(
+            Attendance.service_id, Attendance.person_id,
+            func.coalesce(Attendance.updated_at, Attendance.check_in_time, Attendance.created_at)
+        ).filter(tuple_(Attendance.service_id, Attendance.person_id).in_(list(latest)))
+        for service_id, person_id, written_at in marked:
+            if written_at is None:
+                continue
+            written_at = local_to_utc(written_at)
+            key = (service_id, person_id)
+            if applied_ts.get(key) is None or written_at > applied_ts[key]:
+                applied_ts[key] = written_at
+
+    by_service = {}
+    marked_at = {}
+    for key, op in latest.items():
+        previous_ts = applied_ts.get(key)
+        if previous_ts is not None and previous_ts > op['client_ts']:
+            op['result'] = 'stale'
+        else:
+            op['result'] = 'applied'
+            by_service.setdefault(op['service_id'], {})[op['person_id']] = op['status']
+            marked_at.setdefault(op['service_id'], {})[op['person_id']] = utc_to_local(op['client_ts'])
+
+    # One set-based write per service; unknown people come back missing
+    for service_id, person_status in by_service.items():
+        updated_records, _ = apply_attendance(service_id, person_status, marked_at=marked_at[service_id])
+        written = {record['person_id'] for record in updated_records}
+        for person_id in person_status:
+            if person_id not in written:
+                op = latest.pop((service_id, person_id))
+                rejected[op['op_id']] = 'unknown person'
+                del ops[op['op_id']]
+
+    log = []
+    for op in ops.values():
+        if (op['service_id'], op['person_id']) not in latest:
+            rejected[op['op_id']] = 'unknown person'
+            continue
+        op.setdefault('result', 'superseded')
+        ack[op['op_id']] = op['result']
+        log.append(dict(op, device_id=device_id))
+
+    if log:
+        statement = insert(AttendanceSyncOp.__table__).values(log)
+        db.session.execute(statement.on_conflict_do_nothing(index_elements=['op_id']))
+        record_dirty_tags(db.session, AttendanceSyncOp.__tablename__)
+
+    return ack, rejected
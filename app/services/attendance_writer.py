@@ -0,0 +1,98 @@
+"""
+Set-based write path for attendance marks
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.people import Person
+from app.models.services import Attendance
+from app.services.cache_service import record_dirty_tags
+
+# Statuses stored as attendance rows; 'not-marked' removes the row instead
+ATTENDANCE_STATUSES = ('present', 'absent', 'watched_recording')
+
+# Rows per INSERT statement, well under Postgres' bind parameter limit
+UPSERT_BATCH_SIZE = 1000
+
+def service_tag(service_id):
+    """Cache tag bumped when a service's attendance is committed"""
+    return f"attendance:{service_id}"
+
+def current_statuses(service_id, person_ids):
+    """person_id -> current status (None when unmarked) for the people that exist
+
+    One query both validates the ids and returns their previous marks.
+    """
+    if not person_ids:
+        return {}
+    rows = db.session.query(Person.person_id, Attendance.status).outerjoin(
+        Attendance,
+        and_(Attendance.person_id == Person.person_id, Attendance.service_id == service_id)
+    ).filter(Person.person_id.in_(list(person_ids)))
+    return dict(rows)
+
+def apply_attendance(service_id, person_status, now=None, marked_at=None):
+    """Write a batch of attendance marks for a service without committing
+
+    ``person_status`` maps person_id to a status or 'not-marked'. Unknown
+    people and statuses are skipped. Marks are written with one
+    ``INSERT ... ON CONFLICT DO UPDATE`` per batch and clears with a single
+    DELETE, so the round trips do not grow with the number of people.
+    ``marked_at`` optionally maps person_id to when the mark was made (local
+    time), stored as its check-in and update time instead of ``now``.
+
+    Returns ``(updated_records, previous)`` where ``previous`` maps each
+    valid person_id to its status before the write.
+    """
+    now = now or datetime.now()
+    marked_at = marked_at or {}
+    previous = current_statuses(service_id, person_status.keys())
+
+    marks = []
+    cleared = []
+    updated_records = []
+    for person_id, status in person_status.items():
+        if person_id not in previous:
+            continue
+        if status == 'not-marked':
+            cleared.append(person_id)
+        elif status in ATTENDANCE_STATUSES:
+            mark_time = marked_at.get(person_id, now)
+            marks.append({
+                'service_id': service_id,
+                'person_id': person_id,
+                'status': status,
+                'check_in_time': mark_time if status == 'present' else None,
+                'updated_at': mark_time
+            })
+        else:
+            continue
+        updated_records.append({
+            'person_id': person_id,
+            'status': status
+        })
+
+    table = Attendance.__table__
+    for start in range(0, len(marks), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(marks[start:start + UPSERT_BATCH_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.service_id, table.c.person_id],
+            set_={
+                'status': statement.excluded.status,
+                'check_in_time': statement.excluded.check_in_time,
+                'updated_at': statement.excluded.updated_at
+            }
+        )
+        db.session.execute(statement)
+
+    if cleared:
+        db.session.execute(
+            delete(table).where(table.c.service_id == service_id, table.c.person_id.in_(cleared))
+        )
+
+    if updated_records:
+        record_dirty_tags(db.session, Attendance.__tablename__, service_tag(service_id))
+    return updated_records, previous
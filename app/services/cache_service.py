@@ -1,69 +1,542 @@
+"""
+Tag-versioned caching of views, queries and counts
+"""
 from functools import wraps
-from flask import request, current_app
+from flask import request, current_app, make_response
+from urllib.parse import urlencode
+from sqlalchemy import event
+from datetime import date
+from collections import OrderedDict
 from app import cache
+from app.services.cache_stats import cache_stats
 import hashlib
+import logging
+import pickle
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tags for the organisational hierarchy tables
+ORG_TAGS = ('regions', 'directions', 'departments', 'teams', 'cells')
+
+# Tables rewritten by database triggers when another table changes: moving
+# or renaming an org node updates its people's ancestor ids and sort names
+# (migrations 001 and 007) and every attendance write appends to the change
+# feed (migration 005)
+TRIGGER_TAGS = {
+    'regions': ('people',),
+    'directions': ('people',),
+    'departments': ('people',),
+    'teams': ('people',),
+    'cells': ('people',),
+    'attendance': ('attendance_changes',)
+}
+
+
+class LRUCache:
+    """Per-worker LRU cache bounded by entry count and total bytes
+
+    Values are kept pickled, so every hit returns a private copy and the
+    byte budget is a hard ceiling on the memory this cache holds. Each
+    entry may name its owner, which is passed to ``on_evict`` when the
+    entry is pushed out.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (expires_at, payload, owner)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the pickled payload for a key, or None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, payload, _ = item
+            if expires_at < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, key, payload, timeout, owner=None):
+        """Store a pickled payload, evicting the least recently used entries"""
+        if len(payload) > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + timeout, payload, owner)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                evicted.append(self._remove(oldest))
+                self.evictions += 1
+
+        if self.on_evict:
+            for owner in evicted:
+                self.on_evict(owner)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, payload, owner = self._entries.pop(key)
+        self._bytes -= len(payload)
+        return owner
+
+    def stats(self):
+        """Return the counters and current size of this cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+
+class TwoTierCache:
+    """In-process LRU (L1) in front of the shared Flask-Caching backend (L2)
+
+    L1 entries live for at most CACHE_L1_TIMEOUT seconds, so a key written
+    by another worker is picked up after that at the latest. Writes from
+    this worker go to both tiers immediately.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.local = LRUCache(on_evict=self._record_eviction)
+        self.local_timeout = 60
+        self.l2_hits = 0
+        self.l2_misses = 0
+
+    def init_app(self, app):
+        """Size the L1 tier from the app configuration"""
+        self.local = LRUCache(
+            max_entries=app.config['CACHE_L1_MAX_ENTRIES'],
+            max_bytes=app.config['CACHE_L1_MAX_BYTES'],
+            on_evict=self._record_eviction
+        )
+        self.local_timeout = app.config['CACHE_L1_TIMEOUT']
+
+    @staticmethod
+    def _record_eviction(owner):
+        if owner:
+            cache_stats.record_eviction(owner)
+
+    def _local_timeout(self, timeout, local_timeout):
+        if local_timeout is not None:
+            return local_timeout
+        if timeout:
+            return min(timeout, self.local_timeout)
+        return self.local_timeout
+
+    def get(self, key, local_timeout=None, name=None):
+        payload = self.local.get(key)
+        if payload is not None:
+            return pickle.loads(payload)
+
+        value = self.backend.get(key)
+        if value is None:
+            self.l2_misses += 1
+            return None
+
+        self.l2_hits += 1
+        self.local.set(key, pickle.dumps(value), self._local_timeout(None, local_timeout), owner=name)
+        return value
+
+    def get_many(self, *keys, local_timeout=None):
+        values = {}
+        missing = []
+        for key in keys:
+            payload = self.local.get(key)
+            if payload is not None:
+                values[key] = pickle.loads(payload)
+            else:
+                missing.append(key)
+
+        # Fetch everything L1 did not have in a single round trip
+        if missing:
+            for key, value in zip(missing, self.backend.get_many(*missing)):
+                if value is None:
+                    self.l2_misses += 1
+                    continue
+                self.l2_hits += 1
+                values[key] = value
+                self.local.set(key, pickle.dumps(value), self._local_timeout(None, local_timeout))
+
+        return [values.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None, local_timeout=None, name=None):
+        """Write to both tiers and return the pickled size of the value"""
+        self.backend.set(key, value, timeout=timeout)
+        payload = pickle.dumps(value)
+        self.local.set(key, payload, self._local_timeout(timeout, local_timeout), owner=name)
+        return len(payload)
+
+    def set_many(self, mapping, timeout=None, local_timeout=None):
+        self.backend.set_many(mapping, timeout=timeout)
+        for key, value in mapping.items():
+            self.local.set(key, pickle.dumps(value), self._local_timeout(timeout, local_timeout))
+
+    def add(self, key, value, timeout=None, local_timeout=None):
+        """Store a value only if the shared tier does not have it yet"""
+        added = self.backend.add(key, value, timeout=timeout)
+        if added:
+            self.local.set(key, pickle.dumps(value), self._local_timeout(timeout, local_timeout))
+        return added
+
+    def delete(self, key):
+        self.local.delete(key)
+        return self.backend.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        return self.backend.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters for both tiers"""
+        return {
+            'l1': self.local.stats(),
+            'l2': {'hits': self.l2_hits, 'misses': self.l2_misses}
+        }
+
+    def publish_stats(self, force=False):
+        """Share this worker's view and tier counters with the other workers"""
+        cache_stats.publish(self.stats, force=force)
+
+
+# Shared two-tier cache used by every helper in this module
+tiered_cache = TwoTierCache(cache)
 
 def cache_key_prefix():
     """Generate a prefix for cache keys"""
     return "churchops"
 
-def make_cache_key(*args, **kwargs):
-    """Create a key that includes querystring values"""
+def _tag_key(tag):
+    """Cache key holding the current version of a tag"""
+    return f"{cache_key_prefix()}:tag:{tag}"
+
+def _new_tag_version():
+    """Generate a version token that is unique across workers"""
+    return f"{time.time_ns():x}"
+
+def tag_versions(tags):
+    """Return the current version token of each tag, creating missing ones"""
+    if not tags:
+        return ()
+
+    # Versions are held in L1 only briefly so other workers' bumps show up fast
+    tag_timeout = current_app.config['CACHE_L1_TAG_TIMEOUT']
+    keys = [_tag_key(tag) for tag in tags]
+    versions = tiered_cache.get_many(*keys, local_timeout=tag_timeout)
+
+    # A tag that was never invalidated (or was evicted) gets a fresh token,
+    # so entries written under an older token can never be served again
+    for i, version in enumerate(versions):
+        if version is None:
+            version = _new_tag_version()
+            if not tiered_cache.add(keys[i], version, timeout=0, local_timeout=tag_timeout):
+                version = tiered_cache.get(keys[i], local_timeout=tag_timeout) or version
+            versions[i] = version
+
+    return tuple(versions)
+
+def canonical_query_string():
+    """Return the request's query string with parameters in a stable order"""
+    return urlencode(sorted(request.args.items(multi=True)))
+
+def make_cache_key(tags=()):
+    """Create a key that includes querystring values and tag versions
+
+    The key is derived from the sorted query string rather than Python's
+    per-process ``hash()``, so every worker computes the same key. Today's
+    date is included because most views filter relative to it.
+    """
     path = request.path
-    args = str(hash(frozenset(request.args.items())))
-    return f"{cache_key_prefix()}:{path}:{args}"
+    args = hashlib.sha1(canonical_query_string().encode()).hexdigest()
+    key = f"{cache_key_prefix()}:{path}:{date.today().isoformat()}:{args}"
+
+    # Embed tag versions so invalidating a tag orphans every dependent entry
+    if tags:
+        versions = tag_versions(tags)
+        key += ":" + ",".join(f"{tag}={version}" for tag, version in zip(tags, versions))
+
+    return key
+
+def _serialize_response(response):
+    """Convert a response into a plain dict that any backend can store"""
+    body = response.get_data()
+    return {
+        'body': body,
+        'status': response.status_code,
+        'mimetype': response.mimetype,
+        'headers': [
+            (name, value) for name, value in response.headers.items()
+            if name not in ('Content-Length', 'Content-Type', 'ETag')
+        ],
+        'etag': hashlib.sha1(body).hexdigest()
+    }
+
+def _build_response(entry):
+    """Rebuild a conditional response from a cached entry"""
+    response = current_app.response_class(
+        entry['body'],
+        status=entry['status'],
+        headers=entry['headers'],
+        mimetype=entry['mimetype']
+    )
+    response.set_etag(entry['etag'])
+    # Let browsers keep the page but revalidate it on every visit
+    response.headers['Cache-Control'] = 'public, no-cache'
+    # Answers If-None-Match with an empty 304 when the content is unchanged
+    return response.make_conditional(request)
+
+def _fill_entry(cache_key, view, args, kwargs, timeout, stale_ttl, name):
+    """Render the view and store it, keeping it past expiry for the stale window"""
+    started = time.perf_counter()
+    response = make_response(view(*args, **kwargs))
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    entry = _serialize_response(response)
+    entry['stored_at'] = time.time()
+    # Entries without a timeout live until their tags change; the backend
+    # timeout only garbage-collects keys orphaned by a version bump
+    backend_timeout = timeout + stale_ttl if timeout else current_app.config['CACHE_VERSIONED_TIMEOUT']
+    tiered_cache.set(cache_key, entry, timeout=backend_timeout, name=name)
+    cache_stats.record_fill(name, time.perf_counter() - started, len(entry['body']))
+    return _build_response(entry)
+
+def _wait_for_entry(cache_key, lock_key, lock_timeout, name):
+    """Wait for the request holding the lock to fill the entry"""
+    deadline = time.time() + lock_timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = tiered_cache.get(cache_key, name=name)
+        if entry:
+            return entry
+        if not cache.get(lock_key):
+            # The lock holder gave up without filling the entry
+            break
+    return None
 
-def cache_view(timeout=300):
-    """Decorator to cache a view function with request args"""
+def cache_view(timeout=300, tags=(), stale_ttl=None, lock_timeout=None):
+    """Decorator to cache a view function with request args
+
+    ``tags`` names the tables the view reads from; invalidating any of
+    them makes the cached entry unreachable. Cached responses carry an
+    ETag derived from their content, so clients revalidating with
+    If-None-Match get a 304 instead of the full page.
+
+    A ``timeout`` of 0 keeps the entry until one of its tags is
+    invalidated, which happens automatically when a commit touches the
+    tagged table (see ``register_invalidation_hooks``).
+
+    Regeneration is single-flight: when an entry expires only the request
+    holding the per-key lock re-renders it, while the others are served the
+    previous copy for up to ``stale_ttl`` seconds. Requests with nothing to
+    serve wait up to ``lock_timeout`` seconds for the lock holder. Both
+    default to CACHE_STALE_TTL and CACHE_LOCK_TIMEOUT.
+
+    Hits, misses, fill time and entry size are counted per view in
+    ``cache_stats``.
+    """
     def decorator(f):
+        name = f"{f.__module__.rsplit('.', 1)[-1]}.{f.__name__}"
+
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            cache_key = make_cache_key()
-            
-            # Try to get from cache
-            response = cache.get(cache_key)
-            if response:
-                return response
-            
-            # If not cached, generate response and cache it
-            response = f(*args, **kwargs)
-            cache.set(cache_key, response, timeout=timeout)
-            return response
+            stale = stale_ttl if stale_ttl is not None else current_app.config['CACHE_STALE_TTL']
+            lock_wait = lock_timeout if lock_timeout is not None else current_app.config['CACHE_LOCK_TIMEOUT']
+            cache_key = make_cache_key(tags)
+
+            # Serve fresh entries straight from cache
+            entry = tiered_cache.get(cache_key, name=name)
+            if entry and (not timeout or time.time() < entry.get('stored_at', 0) + timeout):
+                cache_stats.record_hit(name)
+                return _build_response(entry)
+
+            # Entry is missing or stale: only the lock holder regenerates it.
+            # Locks bypass L1 and live on the shared tier only
+            lock_key = f"{cache_key}:lock"
+            if cache.add(lock_key, 1, timeout=lock_wait):
+                cache_stats.record_miss(name)
+                try:
+                    return _fill_entry(cache_key, f, args, kwargs, timeout, stale, name)
+                finally:
+                    cache.delete(lock_key)
+
+            # Someone else is regenerating; the previous copy is good enough
+            if entry:
+                cache_stats.record_hit(name, stale=True)
+                return _build_response(entry)
+
+            cache_stats.record_miss(name)
+            entry = _wait_for_entry(cache_key, lock_key, lock_wait, name)
+            if entry:
+                return _build_response(entry)
+
+            # The lock holder failed or timed out, so render it ourselves
+            return _fill_entry(cache_key, f, args, kwargs, timeout, stale, name)
         return decorated_function
     return decorator
 
-def invalidate_cache(key_pattern=None):
-    """Clear cache keys matching a pattern"""
-    if key_pattern:
-        # Find all keys matching pattern and delete them
-        keys_to_delete = [
-            k for k in cache.cache._cache.keys() 
-            if key_pattern in k
-        ]
-        for key in keys_to_delete:
-            cache.delete(key)
+def invalidate_cache(*tags):
+    """Invalidate every cache entry tagged with any of the given tags
+
+    Each tag is a single version bump on the shared backend, so the cost
+    is O(tags) regardless of how many entries depend on them. With no
+    tags the whole cache is cleared.
+    """
+    if tags:
+        tiered_cache.set_many(
+            {_tag_key(tag): _new_tag_version() for tag in tags},
+            timeout=0,
+            local_timeout=current_app.config['CACHE_L1_TAG_TIMEOUT']
+        )
     else:
-        # Clear all cache if no pattern specified
-        cache.clear()
-        
+        # Clear all cache if no tag specified
+        tiered_cache.clear()
+
+_DIRTY_TABLES = 'churchops_dirty_tables'
+
+def _record_dirty_tables(session, tables):
+    """Remember which tables the current transaction has written to"""
+    if tables:
+        session.info.setdefault(_DIRTY_TABLES, set()).update(tables)
+
+def record_dirty_tags(session, *tags):
+    """Bump tags when the transaction commits
+
+    Writers that bypass the ORM unit of work (upserts, set-based updates,
+    COPY) name their tables here, as well as extra tags such as one per
+    service.
+    """
+    _record_dirty_tables(session, set(tags))
+
+def pending_tables(session):
+    """Tables written by the session's open transaction but not yet committed"""
+    return frozenset(session.info.get(_DIRTY_TABLES, ()))
+
+def _after_flush(session, flush_context):
+    """Collect the tables of every row written by the ORM unit of work"""
+    objects = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj)
+    ]
+    _record_dirty_tables(session, {
+        obj.__table__.name for obj in objects if hasattr(obj, '__table__')
+    })
+
+def _after_execute(orm_execute_state):
+    """Collect the target table of bulk INSERT/UPDATE/DELETE statements"""
+    statement = orm_execute_state.statement
+    if getattr(statement, 'is_dml', False):
+        table = getattr(statement, 'table', None)
+        name = getattr(table, 'name', None)
+        if name:
+            _record_dirty_tables(orm_execute_state.session, {name})
+
+def _after_commit(session):
+    """Bump the version of every table written by the committed transaction"""
+    tables = session.info.pop(_DIRTY_TABLES, None)
+    if not tables:
+        return
+    tables = set(tables)
+    for table in list(tables):
+        tables.update(TRIGGER_TAGS.get(table, ()))
+    # The data is committed either way; a cache outage must not fail the request
+    try:
+        invalidate_cache(*sorted(tables))
+    except Exception:
+        logger.exception("Could not invalidate cache tags %s", sorted(tables))
+
+def _after_rollback(session):
+    """Forget writes that never reached the database"""
+    session.info.pop(_DIRTY_TABLES, None)
+
+def register_invalidation_hooks(session):
+    """Invalidate cache tags automatically whenever a commit writes to a table
+
+    Every table name is its own tag, so views tagged with the tables they
+    read stay cached until the underlying data actually changes.
+    """
+    hooks = (
+        ('after_flush', _after_flush),
+        ('do_orm_execute', _after_execute),
+        ('after_commit', _after_commit),
+        ('after_rollback', _after_rollback)
+    )
+    for name, fn in hooks:
+        if not event.contains(session, name, fn):
+            event.listen(session, name, fn)
+
+def cached_count(query, tags, name='count'):
+    """Cache the row count of a query until one of its tags is invalidated"""
+    name = f"count.{name}"
+    statement = str(query.statement.compile(compile_kwargs={'literal_binds': True}))
+    versions = ",".join(tag_versions(tags))
+    key = f"{cache_key_prefix()}:count:{hashlib.sha1((statement + versions).encode()).hexdigest()}"
+
+    total = tiered_cache.get(key, name=name)
+    if total is not None:
+        cache_stats.record_hit(name)
+        return total
+
+    cache_stats.record_miss(name)
+    started = time.perf_counter()
+    total = query.order_by(None).count()
+    size = tiered_cache.set(key, total, timeout=current_app.config['CACHE_VERSIONED_TIMEOUT'], name=name)
+    cache_stats.record_fill(name, time.perf_counter() - started, size)
+    return total
+
 def cached_query(model, filters=None, timeout=300):
     """Cache database query results"""
-    # Create a cache key based on model and filters
-    key = f"{cache_key_prefix()}:query:{model.__name__}"
+    name = f"query.{model.__name__}"
+
+    # Create a cache key based on model, filters and the model's tag version
+    tag = model.__tablename__
+    version = tag_versions((tag,))[0]
+    key = f"{cache_key_prefix()}:query:{model.__name__}:{version}"
     if filters:
         key += ":" + hashlib.md5(str(filters).encode()).hexdigest()
-    
+
     # Try to get cached results
-    results = cache.get(key)
+    results = tiered_cache.get(key, name=name)
     if results is not None:
+        cache_stats.record_hit(name)
         return results
-    
+
     # Execute query if not cached
+    cache_stats.record_miss(name)
+    started = time.perf_counter()
     if filters:
         results = model.query.filter_by(**filters).all()
     else:
         results = model.query.all()
-    
+
     # Cache results
-    cache.set(key, results, timeout=timeout)
+    size = tiered_cache.set(key, results, timeout=timeout, name=name)
+    cache_stats.record_fill(name, time.perf_counter() - started, size)
     return results
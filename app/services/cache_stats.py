@@ -0,0 +1,180 @@
+"""
+Cache statistics collection and cross-worker aggregation
+"""
+from collections import defaultdict
+from app import cache
+import os
+import socket
+import threading
+import time
+
+# Counters tracked for every cached view or query
+VIEW_COUNTERS = ('hits', 'stale_hits', 'misses', 'fills', 'fill_seconds', 'entry_bytes', 'evictions')
+
+# How often a worker copies its counters to the shared cache
+PUBLISH_INTERVAL = 10
+
+# Workers that have not published for this long are left out of totals
+WORKER_TIMEOUT = 300
+
+# Registry slots a worker can claim; each is its own key with a TTL
+MAX_WORKER_SLOTS = 256
+
+def _stats_key(suffix):
+    return f"churchops:stats:{suffix}"
+
+def _new_view_counters():
+    return dict.fromkeys(VIEW_COUNTERS, 0)
+
+
+class CacheStats:
+    """Per-view cache counters for the current worker"""
+
+    def __init__(self):
+        self._views = defaultdict(_new_view_counters)
+        self._lock = threading.Lock()
+        self._published_at = 0
+        self._slot = None
+
+    @property
+    def worker_id(self):
+        # Computed per call so forked workers do not share their parent's id
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def record(self, view, counter, amount=1):
+        with self._lock:
+            self._views[view][counter] += amount
+
+    def record_hit(self, view, stale=False):
+        self.record(view, 'stale_hits' if stale else 'hits')
+
+    def record_miss(self, view):
+        self.record(view, 'misses')
+
+    def record_fill(self, view, seconds, size):
+        with self._lock:
+            counters = self._views[view]
+            counters['fills'] += 1
+            counters['fill_seconds'] += seconds
+            counters['entry_bytes'] += size
+
+    def record_eviction(self, view):
+        self.record(view, 'evictions')
+
+    def snapshot(self):
+        with self._lock:
+            return {view: dict(counters) for view, counters in self._views.items()}
+
+    def publish(self, tier_stats=None, force=False):
+        """Copy this worker's counters to the shared cache for aggregation
+
+        Publishing is throttled to once per PUBLISH_INTERVAL unless forced;
+        ``tier_stats`` is a callable returning per-tier counters.
+        """
+        now = time.time()
+        if not force and now - self._published_at < PUBLISH_INTERVAL:
+            return
+        self._published_at = now
+
+        cache.set(_stats_key(f"worker:{self.worker_id}"), {
+            'published_at': now,
+            'views': self.snapshot(),
+            'tiers': tier_stats() if tier_stats else {}
+        }, timeout=WORKER_TIMEOUT)
+
+        # Register this worker so the endpoint knows whose counters to read
+        self._claim_slot()
+
+    def _claim_slot(self):
+        """Hold a registry slot naming this worker, refreshing its TTL
+
+        Slots are claimed with an atomic add, so workers never overwrite
+        each other's registration; a dead worker's slot simply expires.
+        """
+        worker_id = self.worker_id
+        if self._slot is not None:
+            key = _stats_key(f"slot:{self._slot}")
+            if cache.get(key) == worker_id:
+                cache.set(key, worker_id, timeout=WORKER_TIMEOUT)
+                return
+        for slot in range(MAX_WORKER_SLOTS):
+            if cache.add(_stats_key(f"slot:{slot}"), worker_id, timeout=WORKER_TIMEOUT):
+                self._slot = slot
+                return
+        self._slot = None  # Every slot is taken; this worker is left out of totals
+
+
+# Counters for this worker
+cache_stats = CacheStats()
+
+def _add_counters(total, counters):
+    for name, value in counters.items():
+        total[name] = total.get(name, 0) + value
+
+def aggregate_stats():
+    """Sum the published counters of every live worker"""
+    slots = cache.get_many(*[_stats_key(f"slot:{slot}") for slot in range(MAX_WORKER_SLOTS)])
+    workers = sorted({worker for worker in slots if worker})
+    snapshots = cache.get_many(*[_stats_key(f"worker:{worker}") for worker in workers]) if workers else []
+
+    live_workers = []
+    views = defaultdict(_new_view_counters)
+    tiers = {}
+    for worker, snapshot in zip(workers, snapshots):
+        if not snapshot or time.time() - snapshot['published_at'] > WORKER_TIMEOUT:
+            continue
+        live_workers.append(worker)
+        for view, counters in snapshot['views'].items():
+            _add_counters(views[view], counters)
+        for tier, counters in snapshot['tiers'].items():
+            _add_counters(tiers.setdefault(tier, {}), counters)
+
+    for counters in views.values():
+        lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+        counters['hit_rate'] = round((counters['hits'] + counters['stale_hits']) / lookups, 4) if lookups else 0
+        counters['avg_fill_seconds'] = round(counters['fill_seconds'] / counters['fills'], 4) if counters['fills'] else 0
+        counters['avg_entry_bytes'] = counters['entry_bytes'] // counters['fills'] if counters['fills'] else 0
+
+    return {
+        'workers': live_workers,
+        'views': dict(views),
+        'tiers': tiers
+    }
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(stats):
+    """Render aggregated statistics in the Prometheus text exposition format"""
+    lines = [
+        '# HELP churchops_cache_workers Workers reporting cache statistics',
+        '# TYPE churchops_cache_workers gauge',
+        f"churchops_cache_workers {len(stats['workers'])}"
+    ]
+
+    view_metrics = (
+        ('hits', 'counter', 'Fresh cache hits per view'),
+        ('stale_hits', 'counter', 'Stale entries served while another request rebuilt them'),
+        ('misses', 'counter', 'Cache misses per view'),
+        ('fills', 'counter', 'Entries rendered and stored per view'),
+        ('fill_seconds', 'counter', 'Time spent rendering entries per view'),
+        ('entry_bytes', 'counter', 'Bytes stored per view'),
+        ('evictions', 'counter', 'Entries evicted from the in-process tier per view')
+    )
+    for name, metric_type, description in view_metrics:
+        metric = f"churchops_cache_{name}_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for view, counters in sorted(stats['views'].items()):
+            lines.append(f'{metric}{{view="{_escape_label(view)}"}} {counters[name]}')
+
+    for tier, counters in sorted(stats['tiers'].items()):
+        for name, value in sorted(counters.items()):
+            metric = f"churchops_cache_{tier}_{name}"
+            metric_type = 'gauge' if name in ('entries', 'bytes') else 'counter'
+            if metric_type == 'counter':
+                metric += '_total'
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.append(f"{metric} {value}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,176 @@
+"""
+Dry run of an assignments import: what it would create, move and update
+"""
+import csv
+
+import pandas as pd
+from sqlalchemy import tuple_
+
+from app import db
+from app.models.people import Person
+from app.services.import_service import (
+    ImportResult, ORG_LEVELS, existing_nodes, normalize_frame, read_chunks, validate_frame
+)
+from app.services.org_hierarchy import get_org_hierarchy
+
+CHANGE_FILE_HEADERS = ['Row', 'Change', 'First Name', 'Last Name', 'Person ID', 'From', 'To', 'Changed Fields']
+
+# Spreadsheet column -> person attribute compared for updates; blanks never count
+COMPARED_FIELDS = {
+    'Direction': 'direction',
+    'Email': 'email',
+    'Phone': 'phone',
+    'Country': 'country',
+    'Gender': 'gender',
+}
+
+NAME_COLUMNS = ['First Name', 'Last Name']
+PATH_SEPARATOR = ' / '
+
+
+class ImportPreview:
+    """Counts of the changes an import would make"""
+
+    def __init__(self):
+        self.errors = ImportResult()
+        self.rows_read = 0
+        self.create = 0
+        self.move = 0
+        self.update = 0
+        self.unchanged = 0
+        self.new_nodes = {column: set() for column, _, _, _, _ in ORG_LEVELS}
+
+    def summary(self):
+        return {
+            'rows_read': self.rows_read,
+            'people_to_create': self.create,
+            'people_to_move': self.move,
+            'people_to_update': self.update,
+            'people_unchanged': self.unchanged,
+            'nodes_to_create': {column: len(paths) for column, paths in self.new_nodes.items()},
+            'error_count': self.errors.error_count,
+            'error_messages': self.errors.error_messages[:100]
+        }
+
+
+def _last_rows(path):
+    """Row number of the last valid row for each name, as the import keeps it"""
+    frames = [
+        validate_frame(normalize_frame(chunk), ImportResult())[NAME_COLUMNS + ['row_no']]
+        for chunk in read_chunks(path)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=NAME_COLUMNS + ['row_no'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(subset=NAME_COLUMNS, keep='last')
+
+def plan_org_nodes(frame, preview, writer):
+    """Add existing node ids to frame; nodes the import would create get NA
+
+    A node under a parent that does not exist yet is new as well.
+    """
+    for depth, (column, model, name_attr, parent_key, id_key) in enumerate(ORG_LEVELS):
+        keys = [column] + ([parent_key] if parent_key else [])
+        wanted = frame[keys].drop_duplicates()
+        if parent_key:
+            wanted = wanted.dropna(subset=[parent_key])
+        existing = existing_nodes(wanted, column, model, name_attr, parent_key, id_key, id_type='Int64')
+        frame = frame.merge(existing, on=keys, how='left')
+        frame[id_key] = frame[id_key].astype('Int64')
+
+        path_columns = [level[0] for level in ORG_LEVELS[:depth + 1]]
+        missing = frame.loc[frame[id_key].isna(), path_columns].drop_duplicates()
+        for names in missing.itertuples(index=False, name=None):
+            if names not in preview.new_nodes[column]:
+                preview.new_nodes[column].add(names)
+                writer.writerow(['', f'new {column.lower()}', '', '', '', '', PATH_SEPARATOR.join(names), ''])
+    return frame
+
+def _current_people(frame):
+    """Stored values of the person each row matches (the oldest with that name)"""
+    names = list(frame[NAME_COLUMNS].drop_duplicates().itertuples(index=False, name=None))
+    columns = ['person_id', 'first_name', 'last_name', 'cell_id'] + list(COMPARED_FIELDS.values())
+    rows = db.session.query(*[getattr(Person, column) for column in columns]).filter(
+        tuple_(Person.first_name, Person.last_name).in_(names)
+    ).distinct(Person.first_name, Person.last_name).order_by(
+        Person.first_name, Person.last_name, Person.person_id
+    ).all() if names else []
+    current = pd.DataFrame(rows, columns=columns).rename(columns={'first_name': 'First Name', 'last_name': 'Last Name'})
+    current['person_id'] = current['person_id'].astype('Int64')
+    current['cell_id'] = current['cell_id'].astype('Int64')
+    return current.rename(columns={attr: f'current_{attr}' for attr in COMPARED_FIELDS.values()})
+
+def _cell_paths(cell_ids):
+    org = get_org_hierarchy()
+    paths = {}
+    for cell_id in cell_ids:
+        path = org.path(int(cell_id))
+        if path:
+            paths[cell_id] = PATH_SEPARATOR.join(
+                path[level]['name'] for level in ('region', 'direction', 'department', 'team', 'cell')
+            )
+    return paths
+
+def preview_chunk(chunk, last_rows, preview, writer):
+    """Classify one chunk's rows against the database and write their changes"""
+    frame = validate_frame(normalize_frame(chunk), preview.errors)
+    # Only a name's last row takes effect; earlier ones are overwritten
+    frame = frame.merge(last_rows, on=NAME_COLUMNS + ['row_no'], how='inner')
+    if frame.empty:
+        return
+
+    frame = plan_org_nodes(frame, preview, writer)
+    frame = frame.merge(_current_people(frame), on=NAME_COLUMNS, how='left')
+
+    is_new = frame['person_id'].isna()
+    moved = ~is_new & (frame['cell_id'] != frame['current_cell_id']).fillna(True)
+
+    changed_fields = pd.Series('', index=frame.index)
+    for column, attr in COMPARED_FIELDS.items():
+        differs = (frame[column] != '') & (frame[column] != frame[f'current_{attr}'].fillna(''))
+        changed_fields += differs.map({True: f'{column}, ', False: ''})
+    frame['changed_fields'] = changed_fields.str.rstrip(', ')
+    updated = ~is_new & ~moved & (frame['changed_fields'] != '')
+
+    preview.create += int(is_new.sum())
+    preview.move += int(moved.sum())
+    preview.update += int(updated.sum())
+    preview.unchanged += int((~is_new & ~moved & ~updated).sum())
+
+    frame['change'] = ''
+    frame.loc[is_new, 'change'] = 'create'
+    frame.loc[moved, 'change'] = 'move'
+    frame.loc[updated, 'change'] = 'update'
+    changes = frame[frame['change'] != ''].copy()
+    if changes.empty:
+        return
+
+    from_paths = _cell_paths(changes['current_cell_id'].dropna().unique())
+    changes['from_path'] = changes['current_cell_id'].map(from_paths).fillna('')
+    changes['to_path'] = changes['Region']
+    for column, _, _, _, _ in ORG_LEVELS[1:]:
+        changes['to_path'] += PATH_SEPARATOR + changes[column]
+    changes.loc[changes['change'] == 'update', 'to_path'] = ''
+    changes['person_id'] = changes['person_id'].astype(object).where(changes['person_id'].notna(), '')
+
+    writer.writerows(changes[[
+        'row_no', 'change', 'First Name', 'Last Name', 'person_id', 'from_path', 'to_path', 'changed_fields'
+    ]].itertuples(index=False, name=None))
+
+def preview_file(path, output, progress=None):
+    """Write the changes importing ``path`` would make to ``output`` as CSV
+
+    Works chunk by chunk with a few set-based queries per chunk and never
+    writes to the database.
+    """
+    preview = ImportPreview()
+    writer = csv.writer(output)
+    writer.writerow(CHANGE_FILE_HEADERS)
+
+    last_rows = _last_rows(path)
+    for chunk in read_chunks(path):
+        preview_chunk(chunk, last_rows, preview, writer)
+        preview.rows_read += len(chunk)
+        if progress:
+            progress(preview)
+    db.session.rollback()
+    return preview
@@ -0,0 +1,372 @@
+"""
+Set-based import of people and their assignments from a spreadsheet
+"""
+import csv
+import io
+
+from openpyxl import load_workbook
+import pandas as pd
+from sqlalchemy import Column, Integer, MetaData, Table, Text, and_, exists, func, select, true, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.people import Person
+from app.models.organization import Region, Direction, Department, Team, Cell
+from app.services.cache_service import record_dirty_tags
+
+REQUIRED_COLUMNS = ['First Name', 'Last Name', 'Region', 'Direction', 'Department', 'Team', 'Cell']
+OPTIONAL_COLUMNS = ['Email', 'Phone', 'Country', 'Gender']
+
+# (spreadsheet column, model, name attribute, parent id attribute, id attribute)
+ORG_LEVELS = (
+    ('Region', Region, 'region_name', None, 'region_id'),
+    ('Direction', Direction, 'direction_name', 'region_id', 'direction_id'),
+    ('Department', Department, 'department_name', 'direction_id', 'department_id'),
+    ('Team', Team, 'team_name', 'department_id', 'team_id'),
+    ('Cell', Cell, 'cell_name', 'team_id', 'cell_id'),
+)
+
+# Spreadsheet column -> staged person column
+PERSON_COLUMNS = {
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Email': 'email',
+    'Phone': 'phone',
+    'Country': 'country',
+    'Gender': 'gender',
+}
+
+# Rows per multi-row INSERT when creating org nodes
+INSERT_BATCH_SIZE = 1000
+
+# Spreadsheet rows read, validated and committed at a time
+IMPORT_CHUNK_ROWS = 5000
+
+# Row errors kept for reporting; later ones are only counted
+MAX_ERROR_MESSAGES = 1000
+
+# Staging table for one import, dropped when the transaction ends
+_stage_metadata = MetaData()
+people_stage = Table(
+    'import_people_stage', _stage_metadata,
+    Column('row_no', Integer, primary_key=True),
+    Column('first_name', Text),
+    Column('last_name', Text),
+    Column('email', Text),
+    Column('phone', Text),
+    Column('country', Text),
+    Column('gender', Text),
+    Column('cell_id', Integer),
+    Column('direction', Text),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP'
+)
+STAGE_COLUMNS = [column.name for column in people_stage.columns]
+
+
+class ImportResult:
+    """Outcome of an import, in the shape the assignments page reports"""
+
+    def __init__(self):
+        self.success_count = 0
+        self.error_count = 0
+        self.error_messages = []
+        self.inserted = 0
+        self.updated = 0
+        self.created_nodes = {}
+
+    def add_errors(self, row_numbers, message):
+        for row_no in row_numbers[:MAX_ERROR_MESSAGES - len(self.error_messages)]:
+            self.error_messages.append(f"Error in row {row_no}: {message}")
+        self.error_count += len(row_numbers)
+
+
+def _cell_text(value):
+    """Spreadsheet cell as import text; whole numbers lose their '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def read_columns(path):
+    """Header row of an uploaded CSV or XLSX file"""
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            return [column.strip() for column in next(csv.reader(handle), [])]
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        return [_cell_text(value).strip() for value in header]
+    finally:
+        workbook.close()
+
+def count_rows(path):
+    """Data rows in an uploaded file, for progress reporting; None if unknown
+
+    A streaming pass over the CSV, or the sheet dimensions an XLSX records.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            return max(sum(1 for _ in csv.reader(handle)) - 1, 0)
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        max_row = workbook.active.max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        workbook.close()
+
+def read_chunks(path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """DataFrames of at most ``chunk_rows`` rows, every value a string
+
+    CSV goes through the chunked pandas reader and XLSX through openpyxl's
+    read-only mode, so memory use does not grow with the file. The index
+    runs on across chunks, keeping spreadsheet row numbers in error messages.
+    """
+    columns = read_columns(path)
+    if path.endswith('.csv'):
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows,
+                             encoding='utf-8-sig', header=0, names=columns)
+        for chunk in reader:
+            yield chunk
+        return
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        # Index by position in the sheet, so skipped blank rows keep later
+        # rows' numbers
+        positions, rows = [], []
+        for position, values in enumerate(workbook.active.iter_rows(min_row=2, values_only=True)):
+            if all(value is None for value in values):
+                continue
+            row = [_cell_text(value) for value in values[:len(columns)]]
+            rows.append(row + [''] * (len(columns) - len(row)))
+            positions.append(position)
+            if len(rows) == chunk_rows:
+                yield pd.DataFrame(rows, columns=columns, index=positions)
+                positions, rows = [], []
+        if rows:
+            yield pd.DataFrame(rows, columns=columns, index=positions)
+    finally:
+        workbook.close()
+
+
+def missing_columns(columns):
+    return [col for col in REQUIRED_COLUMNS if col not in columns]
+
+def normalize_frame(df):
+    """Every import column as a string, blanks for missing cells
+
+    ``row_no`` is the spreadsheet row number (header is row 1).
+    """
+    frame = pd.DataFrame({'row_no': (df.index + 2).values})
+    for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS:
+        if column in df.columns:
+            values = df[column]
+            frame[column] = values.where(values.notna(), '').astype(str).values
+        else:
+            frame[column] = ''
+    return frame
+
+def _column_lengths():
+    """Spreadsheet column -> maximum length allowed by the database"""
+    lengths = {column: getattr(model, name_attr).type.length for column, model, name_attr, _, _ in ORG_LEVELS}
+    for column, attr in PERSON_COLUMNS.items():
+        lengths[column] = getattr(Person, attr).type.length
+    return lengths
+
+def validate_frame(frame, result):
+    """Drop rows whose values cannot be stored, recording an error for each
+
+    Blank required values are rejected here: COPY would load them as NULL
+    and fail the whole chunk on a NOT NULL column.
+    """
+    invalid = pd.Series(False, index=frame.index)
+    for column in REQUIRED_COLUMNS:
+        blank = frame[column].str.strip() == ''
+        if blank.any():
+            result.add_errors(frame.loc[blank & ~invalid, 'row_no'].tolist(), f"{column} is required")
+            invalid |= blank
+    for column, length in _column_lengths().items():
+        if not length:
+            continue
+        too_long = frame[column].str.len() > length
+        if too_long.any():
+            result.add_errors(frame.loc[too_long & ~invalid, 'row_no'].tolist(),
+                              f"{column} is longer than {length} characters")
+            invalid |= too_long
+    return frame[~invalid]
+
+def existing_nodes(wanted, column, model, name_attr, parent_key, id_key, id_type='int64'):
+    """Ids of the nodes named in ``wanted`` that already exist, as a DataFrame
+
+    The oldest node wins where names repeat under one parent.
+    """
+    keys = [column] + ([parent_key] if parent_key else [])
+    name_col = getattr(model, name_attr)
+    id_col = getattr(model, id_key)
+    parent_col = getattr(model, parent_key) if parent_key else None
+    group_cols = [name_col] + ([parent_col] if parent_key else [])
+
+    query = db.session.query(func.min(id_col), *group_cols).filter(name_col.in_(wanted[column].unique().tolist()))
+    if parent_key:
+        query = query.filter(parent_col.in_([int(parent_id) for parent_id in wanted[parent_key].unique()]))
+    id_types = {id_key: id_type, **({parent_key: id_type} if parent_key else {})}
+    return pd.DataFrame(query.group_by(*group_cols).all(), columns=[id_key] + keys).astype(id_types)
+
+def _resolve_level(frame, column, model, name_attr, parent_key, id_key, result):
+    """Add ``id_key`` to frame, creating the distinct nodes that do not exist yet"""
+    keys = [column] + ([parent_key] if parent_key else [])
+    wanted = frame[keys].drop_duplicates()
+
+    name_col = getattr(model, name_attr)
+    id_col = getattr(model, id_key)
+    parent_col = getattr(model, parent_key) if parent_key else None
+    group_cols = [name_col] + ([parent_col] if parent_key else [])
+    id_types = {id_key: 'int64', **({parent_key: 'int64'} if parent_key else {})}
+    existing = existing_nodes(wanted, column, model, name_attr, parent_key, id_key)
+
+    merged = wanted.merge(existing, on=keys, how='left')
+    missing = merged[merged[id_key].isna()]
+    created = []
+    if not missing.empty:
+        values = [
+            {name_attr: row[column], **({parent_key: int(row[parent_key])} if parent_key else {})}
+            for row in missing[keys].to_dict('records')
+        ]
+        for start in range(0, len(values), INSERT_BATCH_SIZE):
+            statement = insert(model.__table__).values(values[start:start + INSERT_BATCH_SIZE])
+            created.extend(db.session.execute(statement.returning(id_col, *group_cols)).all())
+        record_dirty_tags(db.session, model.__tablename__)
+    result.created_nodes[column] = result.created_nodes.get(column, 0) + len(created)
+
+    created = pd.DataFrame(created, columns=[id_key] + keys).astype(id_types)
+    resolved = pd.concat([existing, created], ignore_index=True)
+    return frame.merge(resolved, on=keys, how='left')
+
+def resolve_org_nodes(frame, result):
+    """Resolve every row's region..cell path to ids, one level at a time"""
+    for column, model, name_attr, parent_key, id_key in ORG_LEVELS:
+        frame = _resolve_level(frame, column, model, name_attr, parent_key, id_key, result)
+    return frame
+
+def stage_people(frame):
+    """Create the staging table and load the rows with COPY
+
+    Rows naming the same person are collapsed to the last one, as the
+    row-by-row import would have left them.
+    """
+    stage = frame.drop_duplicates(subset=['First Name', 'Last Name'], keep='last')
+    stage = stage.rename(columns=PERSON_COLUMNS).rename(columns={'Direction': 'direction'})[STAGE_COLUMNS]
+
+    connection = db.session.connection()
+    people_stage.create(connection)
+
+    buffer = io.StringIO()
+    stage.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY import_people_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return len(stage)
+
+def apply_staged_people():
+    """Update matched people and insert the rest; returns (updated, inserted)
+
+    A staged row matches the oldest person with the same first and last
+    name. Blank optional values keep what is already stored.
+    """
+    people = Person.__table__
+    stage = people_stage.c
+
+    matches = select(
+        func.min(people.c.person_id).label('person_id'), people.c.first_name, people.c.last_name
+    ).select_from(
+        people.join(people_stage, and_(
+            people.c.first_name == stage.first_name, people.c.last_name == stage.last_name
+        ))
+    ).group_by(people.c.first_name, people.c.last_name).subquery()
+
+    def keep_if_blank(column):
+        return func.coalesce(func.nullif(getattr(stage, column), ''), people.c[column])
+
+    updated = db.session.execute(
+        update(people).where(
+            people.c.person_id == matches.c.person_id,
+            matches.c.first_name == stage.first_name,
+            matches.c.last_name == stage.last_name
+        ).values(
+            cell_id=stage.cell_id,
+            direction=stage.direction,
+            email=keep_if_blank('email'),
+            phone=keep_if_blank('phone'),
+            country=keep_if_blank('country'),
+            gender=keep_if_blank('gender'),
+            updated_at=func.now()
+        )
+    ).rowcount
+
+    inserted = db.session.execute(
+        insert(people).from_select(
+            ['first_name', 'last_name', 'email', 'phone', 'country', 'gender', 'cell_id', 'direction', 'is_active'],
+            select(
+                stage.first_name, stage.last_name, stage.email, stage.phone, stage.country,
+                stage.gender, stage.cell_id, stage.direction, true()
+            ).where(~exists().where(and_(
+                people.c.first_name == stage.first_name, people.c.last_name == stage.last_name
+            )))
+        )
+    ).rowcount
+
+    if updated or inserted:
+        record_dirty_tags(db.session, Person.__tablename__)
+    return updated, inserted
+
+def import_people(df, result=None):
+    """Import a spreadsheet of people and assignments in the current transaction
+
+    Org nodes are resolved per level from the distinct names in the file,
+    people are staged with COPY and written with one UPDATE and one INSERT,
+    so the number of round trips does not depend on the number of rows.
+    Counts are added to ``result`` when importing a file in chunks. The
+    caller commits.
+    """
+    result = result or ImportResult()
+    frame = validate_frame(normalize_frame(df), result)
+    if frame.empty:
+        return result
+
+    frame = resolve_org_nodes(frame, result)
+    stage_people(frame)
+    updated, inserted = apply_staged_people()
+    result.updated += updated
+    result.inserted += inserted
+    result.success_count += len(frame)
+    return result
+
+def import_file(path, progress=None):
+    """Import an uploaded CSV or XLSX file chunk by chunk, committing each
+
+    A later chunk naming a person already imported updates them, so the
+    last row for a name still wins. If a chunk fails, the chunks before it
+    stay committed and the error says how many rows were imported.
+    """
+    result = ImportResult()
+    rows_read = 0
+    for chunk in read_chunks(path):
+        try:
+            import_people(chunk, result)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise RuntimeError(
+                f"Import stopped at row {rows_read + 2} after {result.success_count} rows were imported: {e}"
+            ) from e
+        rows_read += len(chunk)
+        if progress:
+            progress(rows_read, result)
+    return result
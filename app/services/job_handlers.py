@@ -0,0 +1,86 @@
+"""
+Handlers for background jobs
+"""
+from datetime import datetime
+
+from werkzeug.datastructures import MultiDict
+
+from app.services.import_preview import preview_file
+from app.services.import_service import count_rows, import_file, missing_columns, read_columns
+from app.services.jobs import job_handler
+from app.services.report_service import build_detailed_report, write_detailed_report_csv
+
+def chunk_percent(rows_read, total):
+    """Progress between 10 and 95 percent while a file is processed in chunks"""
+    if not total:
+        return 10
+    return 10 + int(85 * min(rows_read / total, 1))
+
+@job_handler('import_assignments')
+def import_assignments_job(job):
+    """Import an uploaded assignments spreadsheet"""
+    path = job.path(job.params['filename'])
+    job.progress(5, 'Reading file')
+
+    missing = missing_columns(read_columns(path))
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    total = count_rows(path)
+    job.progress(10, f"{total} rows to process" if total is not None else 'Processing rows')
+
+    # Rows are read, imported and committed chunk by chunk
+    def progress(rows_read, result):
+        job.progress(chunk_percent(rows_read, total), f"Imported {result.success_count} of {rows_read} rows read")
+
+    result = import_file(path, progress)
+
+    return {
+        'summary': {
+            'success_count': result.success_count,
+            'error_count': result.error_count,
+            'error_messages': result.error_messages[:100],
+            'inserted': result.inserted,
+            'updated': result.updated,
+            'created_nodes': result.created_nodes
+        }
+    }
+
+@job_handler('preview_assignments')
+def preview_assignments_job(job):
+    """Dry run of an assignments import, with a CSV of every change"""
+    path = job.path(job.params['filename'])
+    job.progress(5, 'Reading file')
+
+    missing = missing_columns(read_columns(path))
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    total = count_rows(path)
+    job.progress(10, f"{total} rows to process" if total is not None else 'Processing rows')
+
+    def progress(preview):
+        job.progress(chunk_percent(preview.rows_read, total), f"Compared {preview.rows_read} rows")
+
+    with open(job.result_path, 'w', newline='', encoding='utf-8') as output:
+        preview = preview_file(path, output, progress)
+
+    return {
+        'summary': preview.summary(),
+        'result': (f'import_changes_{datetime.now().strftime("%Y%m%d")}.csv', 'text/csv')
+    }
+
+@job_handler('detailed_report_csv')
+def detailed_report_job(job):
+    """Export the detailed attendance report as CSV"""
+    job.progress(10, 'Running report')
+    results_list, total_services = build_detailed_report(MultiDict(job.params.get('args', {})))
+
+    job.progress(70, f"Writing {len(results_list)} rows")
+    with open(job.result_path, 'w', newline='', encoding='utf-8') as output:
+        write_detailed_report_csv(results_list, output)
+
+    return {
+        'summary': {'rows': len(results_list), 'total_services': total_services},
+        'result': (f'attendance_report_{datetime.now().strftime("%Y%m%d")}.csv', 'text/csv')
+    }
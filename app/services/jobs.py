@@ -0,0 +1,334 @@
+"""
+Local background job runner for imports and exports
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from sqlalchemy import delete, func, text, update
+
+from app import db
+from app.models.jobs import Job
+
+logger = logging.getLogger(__name__)
+
+# kind -> handler(job_context), filled by app.services.job_handlers
+JOB_HANDLERS = {}
+
+# Advisory lock keys JOB_LOCK_BASE .. + JOB_MAX_CONCURRENT act as global job slots
+JOB_LOCK_BASE = 72_001_000
+
+# Seconds between attempts to take a free slot
+SLOT_POLL_INTERVAL = 2
+
+UNFINISHED = ('queued', 'running')
+
+# Seconds between sweeps of finished jobs' files
+CLEANUP_INTERVAL = 3600
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind"""
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+def job_directory(app, job_id):
+    return os.path.join(app.config['JOB_DIR'], job_id)
+
+
+class JobContext:
+    """What a handler sees: its parameters, working directory and progress reporting"""
+
+    RESULT_FILE = 'result'
+
+    def __init__(self, job_id, params, directory):
+        self.job_id = job_id
+        self.params = params
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, os.path.basename(name))
+
+    @property
+    def result_path(self):
+        return self.path(self.RESULT_FILE)
+
+    def progress(self, percent, message=None):
+        """Record progress on its own connection, outside the handler's transaction"""
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Job.__table__).where(Job.__table__.c.job_id == self.job_id)
+                .values(progress=int(percent), message=message)
+            )
+
+
+class JobRunner:
+    """Submit jobs to a process pool and track them in church.jobs
+
+    Each web worker owns a small spawn-based pool (JOB_MAX_WORKERS); across
+    all workers at most JOB_MAX_CONCURRENT jobs run at once, enforced with
+    Postgres advisory locks. Handlers report progress to the job row and
+    leave downloadable output in the job's directory under JOB_DIR.
+
+    A thread in each web worker refreshes the heartbeat of the jobs it
+    owns, fails jobs whose owner stopped refreshing theirs and removes the
+    files of jobs older than JOB_RETENTION_DAYS.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._active = set()  # Unfinished jobs submitted by this worker
+        self._thread_pid = None
+
+    def init_app(self, app):
+        self.app = app
+        from app.services import job_handlers  # noqa: F401  (registers handlers)
+
+    def _get_executor(self):
+        # A pool does not survive a fork, so each worker creates its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._thread_pid != os.getpid():
+                        self._active = set()
+                        threading.Thread(target=self._run, name='job-heartbeat', daemon=True).start()
+                        self._thread_pid = os.getpid()
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.app.config['JOB_MAX_WORKERS'],
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, kind, params, files=None):
+        """Queue a job; ``files`` maps names to uploads or paths copied as its inputs"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = str(uuid.uuid4())
+        directory = job_directory(self.app, job_id)
+        os.makedirs(directory, exist_ok=True)
+        for name, upload in (files or {}).items():
+            destination = os.path.join(directory, os.path.basename(name))
+            if isinstance(upload, str):
+                shutil.copyfile(upload, destination)  # Input of an earlier job
+            else:
+                upload.save(destination)
+
+        job = Job(
+            job_id=job_id, kind=kind, status='queued', params=json.dumps(params),
+            progress=0, heartbeat_at=datetime.now()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        try:
+            future = self._get_executor().submit(run_job, job_id)
+        except BrokenProcessPool:
+            self._pid = None  # A pool process died; start a fresh pool
+            future = self._get_executor().submit(run_job, job_id)
+        with self._lock:
+            self._active.add(job_id)
+        future.add_done_callback(lambda future: self._job_done(job_id, future))
+        return job
+
+    def _job_done(self, job_id, future):
+        with self._lock:
+            self._active.discard(job_id)
+        error = future.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            self._pid = None
+        # run_job records handler errors itself; this is a crashed process
+        logger.error("Job %s did not complete: %r", job_id, error)
+        with self.app.app_context():
+            fail_jobs([job_id], 'The job process stopped unexpectedly')
+
+    def _run(self):
+        interval = self.app.config['JOB_HEARTBEAT_INTERVAL']
+        last_cleanup = 0
+        while True:
+            time.sleep(interval)
+            try:
+                with self.app.app_context():
+                    with self._lock:
+                        active = list(self._active)
+                    if active:
+                        with db.engine.begin() as connection:
+                            connection.execute(
+                                update(Job.__table__).where(
+                                    Job.__table__.c.job_id.in_(active), Job.__table__.c.status.in_(UNFINISHED)
+                                ).values(heartbeat_at=datetime.now())
+                            )
+                    fail_stale_jobs(self.app.config['JOB_STALE_AFTER'])
+                    if time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                        remove_expired_jobs(self.app)
+                        last_cleanup = time.monotonic()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+    def expire_if_stale(self, job):
+        """Fail ``job`` if its owner stopped refreshing it; True if it did"""
+        last_seen = job.heartbeat_at or job.created_at
+        stale_after = timedelta(seconds=self.app.config['JOB_STALE_AFTER'])
+        if job.is_finished or last_seen is None or datetime.now() - last_seen < stale_after:
+            return False
+        fail_jobs([job.job_id], 'The job was interrupted (its worker stopped)')
+        db.session.refresh(job)
+        return True
+
+    def result_file(self, job):
+        return os.path.join(job_directory(self.app, job.job_id), JobContext.RESULT_FILE)
+
+    def input_file(self, job, name):
+        return os.path.join(job_directory(self.app, job.job_id), os.path.basename(name))
+
+
+def fail_jobs(job_ids, error):
+    """Mark unfinished jobs failed, on a connection of their own"""
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(Job.__table__).where(
+                Job.__table__.c.job_id.in_(job_ids), Job.__table__.c.status.in_(UNFINISHED)
+            ).values(status='failed', error=error, message='Failed', finished_at=datetime.now())
+        )
+
+def fail_stale_jobs(stale_after):
+    """Fail every unfinished job whose heartbeat is older than ``stale_after`` seconds"""
+    cutoff = datetime.now() - timedelta(seconds=stale_after)
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table).where(
+                table.c.status.in_(UNFINISHED),
+                func.coalesce(table.c.heartbeat_at, table.c.created_at) < cutoff
+            ).values(
+                status='failed', error='The job was interrupted (its worker stopped)',
+                message='Failed', finished_at=datetime.now()
+            )
+        )
+
+def remove_expired_jobs(app):
+    """Delete jobs finished more than JOB_RETENTION_DAYS ago, with their files"""
+    cutoff = datetime.now() - timedelta(days=app.config['JOB_RETENTION_DAYS'])
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        expired = [job_id for job_id, in connection.execute(
+            delete(table).where(table.c.finished_at < cutoff).returning(table.c.job_id)
+        )]
+    for job_id in expired:
+        shutil.rmtree(job_directory(app, job_id), ignore_errors=True)
+
+    # Directories left without a job row, e.g. when the insert failed
+    root = app.config['JOB_DIR']
+    names = [
+        name for name in (os.listdir(root) if os.path.isdir(root) else [])
+        if os.path.getmtime(os.path.join(root, name)) < cutoff.timestamp()
+    ]
+    if names:
+        known = {job_id for job_id, in db.session.query(Job.job_id).filter(Job.job_id.in_(names))}
+        db.session.rollback()
+        for name in names:
+            if name not in known:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# Runner shared by all requests in this worker
+job_runner = JobRunner()
+
+# Application used by pool processes
+_worker_app = None
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(job_worker=True)
+
+@contextmanager
+def _job_slot(limit):
+    """Hold one of ``limit`` global slots (session advisory locks) while running
+
+    No connection is kept while waiting; the one that took the lock is held
+    until the job ends.
+    """
+    connection = None
+    slot = None
+    try:
+        while slot is None:
+            connection = db.engine.connect()
+            for candidate in range(limit):
+                if connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': JOB_LOCK_BASE + candidate}).scalar():
+                    slot = candidate
+                    connection.commit()
+                    break
+            else:
+                connection.close()
+                connection = None
+                time.sleep(SLOT_POLL_INTERVAL)
+        yield slot
+    finally:
+        if connection is not None:
+            if slot is not None:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': JOB_LOCK_BASE + slot})
+                connection.commit()
+            connection.close()
+
+def _finish(job_id, **values):
+    values['finished_at'] = datetime.now()
+    with db.engine.begin() as connection:
+        connection.execute(update(Job.__table__).where(Job.__table__.c.job_id == job_id).values(**values))
+
+def run_job(job_id):
+    """Run a queued job inside a pool process"""
+    app = _worker_app
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None or job.status != 'queued':
+            return
+        params = json.loads(job.params or '{}')
+        handler = JOB_HANDLERS[job.kind]
+        db.session.rollback()
+
+        with _job_slot(app.config['JOB_MAX_CONCURRENT']):
+            with db.engine.begin() as connection:
+                started = connection.execute(
+                    update(Job.__table__).where(Job.__table__.c.job_id == job_id, Job.__table__.c.status == 'queued')
+                    .values(status='running', started_at=datetime.now())
+                ).rowcount
+            if not started:
+                return  # Failed as stale while waiting for a slot
+
+            context = JobContext(job_id, params, job_directory(app, job_id))
+            try:
+                outcome = handler(context) or {}
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Job %s (%s) failed", job_id, job.kind)
+                _finish(job_id, status='failed', error=str(e), message='Failed')
+                return
+
+            result_name, result_mimetype = outcome.get('result') or (None, None)
+            _finish(
+                job_id,
+                status='succeeded',
+                progress=100,
+                message='Done',
+                summary=json.dumps(outcome.get('summary')) if outcome.get('summary') is not None else None,
+                result_name=result_name,
+                result_mimetype=result_mimetype
+            )
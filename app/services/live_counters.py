@@ -0,0 +1,205 @@
+"""
+Live attendance counters per service, maintained from the change feed
+"""
+from collections import Counter
+import json
+import threading
+import time
+
+from sqlalchemy import func
+
+from app import db
+from app.models.people import Person
+from app.models.services import Attendance, AttendanceChange
+from app.services.attendance_changes import changes_since, latest_seq
+from app.services.attendance_writer import ATTENDANCE_STATUSES
+from app.services.cache_service import tag_versions
+from app.services.org_hierarchy import get_org_hierarchy
+
+# Recount from scratch this often, bounding drift from any missed change
+FULL_RECOUNT_INTERVAL = 300
+
+# Services whose counters are kept in memory
+MAX_SERVICES = 32
+
+
+class ServiceCounters:
+    """Status counts for one service, overall and per region and department"""
+
+    def __init__(self, service_id):
+        self.service_id = service_id
+        self.seq = 0
+        self.totals = Counter()
+        self.regions = {}
+        self.departments = {}
+        self.counted_at = 0
+        self.attendance_version = None
+        self.payload = None  # Serialised snapshot, rebuilt after the counts change
+        self.lock = threading.Lock()  # Held while this service's counts are refreshed
+
+    def _bucket(self, region_id, department_id, status, amount):
+        if status not in ATTENDANCE_STATUSES:
+            return
+        self.totals[status] += amount
+        self.regions.setdefault(region_id, Counter())[status] += amount
+        self.departments.setdefault(department_id, Counter())[status] += amount
+
+    def recount(self):
+        """Rebuild all counts with one grouped query
+
+        The feed position is read in the same statement, so the counts and
+        ``seq`` come from one snapshot and no change is counted twice.
+        """
+        feed_seq = db.session.query(func.coalesce(func.max(AttendanceChange.seq), 0)).filter(
+            AttendanceChange.service_id == self.service_id
+        ).scalar_subquery()
+        rows = db.session.query(
+            Person.region_id, Person.department_id, Attendance.status,
+            func.count(Attendance.attendance_id), feed_seq
+        ).join(Person, Person.person_id == Attendance.person_id).filter(
+            Attendance.service_id == self.service_id
+        ).group_by(Person.region_id, Person.department_id, Attendance.status).all()
+
+        self.totals, self.regions, self.departments = Counter(), {}, {}
+        for region_id, department_id, status, count, _ in rows:
+            self._bucket(region_id, department_id, status, count)
+        self.seq = rows[0][4] if rows else latest_seq(self.service_id)
+        self.counted_at = time.time()
+        self.payload = None
+
+    def apply_changes(self):
+        """Apply feed entries after ``seq`` as deltas; True if anything changed"""
+        changed = False
+        while True:
+            changes, more = changes_since(self.service_id, self.seq)
+            if not changes:
+                return changed
+
+            person_ids = {person_id for _, person_id, _, _ in changes}
+            placement = {
+                person_id: (region_id, department_id) for person_id, region_id, department_id in
+                db.session.query(Person.person_id, Person.region_id, Person.department_id)
+                .filter(Person.person_id.in_(person_ids))
+            }
+            for seq, person_id, status, previous_status in changes:
+                region_id, department_id = placement.get(person_id, (None, None))
+                self._bucket(region_id, department_id, previous_status, -1)
+                self._bucket(region_id, department_id, status, 1)
+                self.seq = seq
+            changed = True
+            self.payload = None
+            if not more:
+                return changed
+
+    def snapshot(self):
+        org = get_org_hierarchy()
+
+        def rows(counters, node_name):
+            result = []
+            for node_id, counts in counters.items():
+                if not any(counts.values()):
+                    continue
+                row = {'id': node_id, 'name': node_name(node_id)}
+                row.update({status: counts[status] for status in ATTENDANCE_STATUSES})
+                result.append(row)
+            return sorted(result, key=lambda row: row['name'] or '')
+
+        def region_name(region_id):
+            node = org.region(region_id)
+            return node.region_name if node else None
+
+        def department_name(department_id):
+            node = org.department(department_id)
+            return node.label if node else None
+
+        return {
+            'service_id': self.service_id,
+            'seq': self.seq,
+            'totals': {status: self.totals[status] for status in ATTENDANCE_STATUSES},
+            'regions': rows(self.regions, region_name),
+            'departments': rows(self.departments, department_name)
+        }
+
+
+class LiveCounterBroker:
+    """In-process broker sharing one set of counters among all viewers
+
+    Viewers wait on a condition that attendance writes in this worker
+    signal after committing; writes from other workers are picked up
+    through the attendance cache tag. Counts are only ever adjusted by the
+    deltas in the change feed, never recomputed per viewer.
+    """
+
+    def __init__(self):
+        self._services = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+
+    def notify(self):
+        """Wake every viewer after an attendance commit"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait(self, timeout):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _counters(self, service_id):
+        with self._lock:
+            counters = self._services.pop(service_id, None) or ServiceCounters(service_id)
+            self._services[service_id] = counters
+            while len(self._services) > MAX_SERVICES:
+                self._services.pop(next(iter(self._services)))
+            return counters
+
+    def refresh(self, service_id):
+        """Bring a service's counters up to date and return their JSON snapshot
+
+        Only the service's own lock is held while querying, so viewers of
+        different services never wait on each other.
+        """
+        version = tag_versions(('attendance',))
+        counters = self._counters(service_id)
+        with counters.lock:
+            if time.time() - counters.counted_at >= FULL_RECOUNT_INTERVAL:
+                counters.recount()
+            elif counters.attendance_version != version:
+                counters.apply_changes()
+            counters.attendance_version = version
+            if counters.payload is None:
+                counters.payload = json.dumps(counters.snapshot(), separators=(',', ':'))
+            seq, payload = counters.seq, counters.payload
+
+        # Release the connection; viewers may hold the stream open for minutes
+        db.session.rollback()
+        return seq, payload
+
+    def stream(self, service_id, duration=300, keepalive=15, poll=2, retry=None):
+        """Server-Sent Events with the service's counts whenever they change
+
+        The stream ends after ``duration`` seconds; EventSource clients
+        reconnect on their own, which also returns the worker to the pool.
+        With ``duration=0`` one snapshot is sent and the stream closes, and
+        ``retry`` (milliseconds) sets how soon the client reconnects.
+        """
+        if retry:
+            yield f"retry: {int(retry)}\n\n"
+        deadline = time.monotonic() + duration
+        last_payload = None
+        last_sent = 0
+        while True:
+            seq, payload = self.refresh(service_id)
+            if payload is not last_payload:
+                last_payload = payload
+                last_sent = time.monotonic()
+                yield f"id: {seq}\nevent: counts\ndata: {payload}\n\n"
+            elif time.monotonic() - last_sent >= keepalive:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            if time.monotonic() >= deadline:
+                return
+            self.wait(min(poll, max(deadline - time.monotonic(), 0)))
+
+
+# Counters shared by all viewers in this worker
+live_counters = LiveCounterBroker()
@@ -0,0 +1,72 @@
+"""
+Name search over church.people
+"""
+from sqlalchemy import and_, case, func, literal, true
+
+from app.models.people import Person
+
+def _normalize(expr):
+    """Lower-case, accent-free form of an expression (church.search_normalize)"""
+    return func.church.search_normalize(expr)
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def full_name_expr():
+    """Normalised "first last" name, matching the trigram index expression
+
+    Missing parts read as '' so people without a last name are still found.
+    """
+    return _normalize(
+        func.coalesce(Person.first_name, literal('')) + literal(' ') + func.coalesce(Person.last_name, literal(''))
+    )
+
+def name_filter(text):
+    """Predicate matching people whose full name contains every word of ``text``
+
+    Each word becomes a LIKE '%word%' on the normalised full name, which the
+    trigram index serves without a sequential scan. Text without any words
+    matches everyone.
+    """
+    words = text.split()
+    if not words:
+        return true()
+    full_name = full_name_expr()
+    return and_(*[
+        full_name.like(func.concat('%', _normalize(_escape_like(word)), '%'), escape='\\')
+        for word in words
+    ])
+
+def name_rank(text):
+    """ORDER BY clauses putting the best matches first
+
+    Whole-name prefixes rank above last-name prefixes, which rank above
+    matches at the start of any word; ties are broken by trigram similarity.
+    """
+    full_name = full_name_expr()
+    last_name = _normalize(Person.last_name)
+    needle = _normalize(' '.join(text.split()))
+    prefix = func.concat(_normalize(_escape_like(' '.join(text.split()))), '%')
+
+    match_quality = case(
+        (full_name.like(prefix, escape='\\'), 3),
+        (last_name.like(prefix, escape='\\'), 2),
+        (full_name.like(func.concat('% ', prefix), escape='\\'), 1),
+        else_=0
+    )
+    return [
+        match_quality.desc(),
+        func.similarity(full_name, needle).desc(),
+        Person.last_name,
+        Person.first_name
+    ]
+
+def search_people(text, limit=20, active_only=True, query=None):
+    """Return up to ``limit`` people matching ``text``, best matches first"""
+    if not text.split():
+        return []
+    if query is None:
+        query = Person.query
+    if active_only:
+        query = query.filter(Person.is_active == True)
+    return query.filter(name_filter(text)).order_by(*name_rank(text)).limit(limit).all()
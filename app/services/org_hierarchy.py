@@ -0,0 +1,402 @@
+"""
+In-memory index of the organisational hierarchy
+"""
+from array import array
+from collections import namedtuple, Counter
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+
+from app import db
+from app.models.organization import Region, Direction, Department, Team, Cell
+from app.services.cache_service import tag_versions, pending_tables, ORG_TAGS
+
+
+class RegionNode(namedtuple('RegionNode', 'region_id region_name')):
+    __slots__ = ()
+
+
+class DirectionNode(namedtuple('DirectionNode', 'direction_id direction_name region')):
+    __slots__ = ()
+
+    @property
+    def region_id(self):
+        return self.region.region_id
+
+    @property
+    def region_name(self):
+        return self.region.region_name
+
+
+class DepartmentNode(namedtuple('DepartmentNode', 'department_id department_name direction label')):
+    """``label`` disambiguates departments sharing a name with their direction"""
+    __slots__ = ()
+
+    @property
+    def direction_id(self):
+        return self.direction.direction_id
+
+    @property
+    def direction_name(self):
+        return self.direction.direction_name
+
+
+class TeamNode(namedtuple('TeamNode', 'team_id team_name department')):
+    __slots__ = ()
+
+    @property
+    def department_id(self):
+        return self.department.department_id
+
+    @property
+    def department_name(self):
+        return self.department.department_name
+
+
+class CellNode(namedtuple('CellNode', 'cell_id cell_name team')):
+    __slots__ = ()
+
+    @property
+    def team_id(self):
+        return self.team.team_id
+
+    @property
+    def team_name(self):
+        return self.team.team_name
+
+
+class OrgHierarchy:
+    """Immutable, array-backed index over the five organisation tables
+
+    Every level is stored as parallel arrays (ids, names, parent position)
+    and each node's ancestors are resolved once at build time, so parent,
+    child and ancestor lookups are O(1) dictionary/array accesses.
+    """
+
+    def __init__(self, version, regions, directions, departments, teams, cells):
+        self.version = version
+
+        # Regions: (region_id, region_name)
+        self.region_ids = array('l', (r[0] for r in regions))
+        self.region_names = tuple(r[1] for r in regions)
+        self._region_pos = {region_id: i for i, region_id in enumerate(self.region_ids)}
+
+        # Directions: (direction_id, direction_name, region_id)
+        directions = [d for d in directions if d[2] in self._region_pos]
+        self.direction_ids = array('l', (d[0] for d in directions))
+        self.direction_names = tuple(d[1] for d in directions)
+        self.direction_region = array('l', (self._region_pos[d[2]] for d in directions))
+        self._direction_pos = {direction_id: i for i, direction_id in enumerate(self.direction_ids)}
+
+        # Departments: (department_id, department_name, direction_id)
+        departments = [d for d in departments if d[2] in self._direction_pos]
+        self.department_ids = array('l', (d[0] for d in departments))
+        self.department_names = tuple(d[1] for d in departments)
+        self.department_direction = array('l', (self._direction_pos[d[2]] for d in departments))
+        self._department_pos = {department_id: i for i, department_id in enumerate(self.department_ids)}
+
+        # Teams: (team_id, team_name, department_id)
+        teams = [t for t in teams if t[2] in self._department_pos]
+        self.team_ids = array('l', (t[0] for t in teams))
+        self.team_names = tuple(t[1] for t in teams)
+        self.team_department = array('l', (self._department_pos[t[2]] for t in teams))
+        self._team_pos = {team_id: i for i, team_id in enumerate(self.team_ids)}
+
+        # Cells: (cell_id, cell_name, team_id)
+        cells = [c for c in cells if c[2] in self._team_pos]
+        self.cell_ids = array('l', (c[0] for c in cells))
+        self.cell_names = tuple(c[1] for c in cells)
+        self.cell_team = array('l', (self._team_pos[c[2]] for c in cells))
+        self._cell_pos = {cell_id: i for i, cell_id in enumerate(self.cell_ids)}
+
+        # Departments that share a name are labelled with their direction
+        name_counts = Counter(self.department_names)
+        self.department_labels = tuple(
+            f"{name} ({self.direction_names[self.department_direction[i]]})" if name_counts[name] > 1 else name
+            for i, name in enumerate(self.department_names)
+        )
+
+        # Materialise node objects once, in display order
+        region_nodes = [RegionNode(self.region_ids[i], self.region_names[i]) for i in range(len(self.region_ids))]
+        direction_nodes = [
+            DirectionNode(self.direction_ids[i], self.direction_names[i], region_nodes[self.direction_region[i]])
+            for i in range(len(self.direction_ids))
+        ]
+        department_nodes = [
+            DepartmentNode(self.department_ids[i], self.department_names[i],
+                           direction_nodes[self.department_direction[i]], self.department_labels[i])
+            for i in range(len(self.department_ids))
+        ]
+        team_nodes = [
+            TeamNode(self.team_ids[i], self.team_names[i], department_nodes[self.team_department[i]])
+            for i in range(len(self.team_ids))
+        ]
+        cell_nodes = [
+            CellNode(self.cell_ids[i], self.cell_names[i], team_nodes[self.cell_team[i]])
+            for i in range(len(self.cell_ids))
+        ]
+        self._region_nodes = tuple(region_nodes)
+        self._direction_nodes = tuple(direction_nodes)
+        self._department_nodes = tuple(department_nodes)
+        self._team_nodes = tuple(team_nodes)
+        self._cell_nodes = tuple(cell_nodes)
+
+        # Child lists keyed by (level, parent id), in display order
+        children = {}
+        for node in sorted(direction_nodes, key=lambda n: n.direction_name):
+            children.setdefault(('region', node.region_id), []).append(node)
+        for node in sorted(department_nodes, key=lambda n: n.label):
+            children.setdefault(('direction', node.direction_id), []).append(node)
+        for node in sorted(team_nodes, key=lambda n: n.team_name):
+            children.setdefault(('department', node.department_id), []).append(node)
+        for node in sorted(cell_nodes, key=lambda n: n.cell_name):
+            children.setdefault(('team', node.team_id), []).append(node)
+        self._children = {key: tuple(nodes) for key, nodes in children.items()}
+
+        # Hierarchy path of every cell, shared read-only by all callers
+        self._paths = {}
+        for cell in cell_nodes:
+            team = cell.team
+            department = team.department
+            direction = department.direction
+            self._paths[cell.cell_id] = MappingProxyType({
+                'cell': MappingProxyType({'id': cell.cell_id, 'name': cell.cell_name}),
+                'team': MappingProxyType({'id': team.team_id, 'name': team.team_name}),
+                'department': MappingProxyType({'id': department.department_id, 'name': department.department_name}),
+                'direction': MappingProxyType({'id': direction.direction_id, 'name': direction.direction_name}),
+                'region': MappingProxyType({'id': direction.region_id, 'name': direction.region_name})
+            })
+
+        self._tree_json = None
+        self._sorted_regions = tuple(sorted(region_nodes, key=lambda n: n.region_name))
+        self._sorted_directions = tuple(sorted(direction_nodes, key=lambda n: n.direction_name))
+        self._sorted_departments = tuple(sorted(department_nodes, key=lambda n: n.label))
+        self._sorted_teams = tuple(sorted(team_nodes, key=lambda n: n.team_name))
+        self._sorted_cells = tuple(sorted(cell_nodes, key=lambda n: n.cell_name))
+
+    # Node lookups
+
+    def region(self, region_id):
+        pos = self._region_pos.get(region_id)
+        return self._region_nodes[pos] if pos is not None else None
+
+    def direction(self, direction_id):
+        pos = self._direction_pos.get(direction_id)
+        return self._direction_nodes[pos] if pos is not None else None
+
+    def department(self, department_id):
+        pos = self._department_pos.get(department_id)
+        return self._department_nodes[pos] if pos is not None else None
+
+    def team(self, team_id):
+        pos = self._team_pos.get(team_id)
+        return self._team_nodes[pos] if pos is not None else None
+
+    def cell(self, cell_id):
+        pos = self._cell_pos.get(cell_id)
+        return self._cell_nodes[pos] if pos is not None else None
+
+    def ancestors(self, cell_id):
+        """Return (region_id, direction_id, department_id, team_id) for a cell"""
+        cell = self.cell(cell_id)
+        if cell is None:
+            return None
+        team = cell.team
+        department = team.department
+        direction = department.direction
+        return direction.region_id, direction.direction_id, department.department_id, team.team_id
+
+    def children(self, level, node_id):
+        """Return the direct children of a node, e.g. children('team', 7) -> cells"""
+        return self._children.get((level, node_id), ())
+
+    def path(self, cell_id):
+        """Read-only hierarchy path of a cell in the ``Person.hierarchy_path`` format"""
+        return self._paths.get(cell_id)
+
+    # Filtered listings for dropdowns, each already sorted by display name
+
+    def regions(self):
+        return list(self._sorted_regions)
+
+    def directions(self, region_id=None):
+        return [d for d in self._sorted_directions if not region_id or d.region_id == region_id]
+
+    def departments(self, region_id=None, direction_id=None):
+        return [
+            d for d in self._sorted_departments
+            if (not region_id or d.direction.region_id == region_id)
+            and (not direction_id or d.direction_id == direction_id)
+        ]
+
+    def teams(self, region_id=None, direction_id=None, department_id=None):
+        return [
+            t for t in self._sorted_teams
+            if (not region_id or t.department.direction.region_id == region_id)
+            and (not direction_id or t.department.direction_id == direction_id)
+            and (not department_id or t.department_id == department_id)
+        ]
+
+    def cells(self, region_id=None, direction_id=None, department_id=None, team_id=None):
+        return [
+            c for c in self._sorted_cells
+            if (not region_id or c.team.department.direction.region_id == region_id)
+            and (not direction_id or c.team.department.direction_id == direction_id)
+            and (not department_id or c.team.department_id == department_id)
+            and (not team_id or c.team_id == team_id)
+        ]
+
+    def to_tree(self):
+        """Nested region -> direction -> department -> team -> cell structure
+
+        Built in a single pass over the precomputed child lists, so the cost
+        is linear in the number of nodes and no query is issued.
+        """
+        def build_team(team):
+            return {
+                'id': team.team_id,
+                'name': team.team_name,
+                'cells': [{'id': c.cell_id, 'name': c.cell_name} for c in self.children('team', team.team_id)]
+            }
+
+        def build_department(department):
+            return {
+                'id': department.department_id,
+                'name': department.department_name,
+                'teams': [build_team(t) for t in self.children('department', department.department_id)]
+            }
+
+        def build_direction(direction):
+            return {
+                'id': direction.direction_id,
+                'name': direction.direction_name,
+                'departments': [build_department(d) for d in self.children('direction', direction.direction_id)]
+            }
+
+        return [
+            {
+                'id': region.region_id,
+                'name': region.region_name,
+                'directions': [build_direction(d) for d in self.children('region', region.region_id)]
+            }
+            for region in self._sorted_regions
+        ]
+
+    def tree_json(self):
+        """Serialised tree and its ETag, computed once per index"""
+        if self._tree_json is None:
+            body = json.dumps(self.to_tree(), separators=(',', ':')).encode('utf-8')
+            self._tree_json = (body, hashlib.sha1(body).hexdigest())
+        return self._tree_json
+
+    def to_dict(self):
+        """Flat parent-linked listing used by the cascading dropdowns"""
+        return {
+            'regions': [
+                {'region_id': r.region_id, 'region_name': r.region_name}
+                for r in self._region_nodes
+            ],
+            'directions': [
+                {'direction_id': d.direction_id, 'direction_name': d.direction_name, 'region_id': d.region_id}
+                for d in self._direction_nodes
+            ],
+            'departments': [
+                {'department_id': d.department_id, 'department_name': d.department_name, 'direction_id': d.direction_id}
+                for d in self._department_nodes
+            ],
+            'teams': [
+                {'team_id': t.team_id, 'team_name': t.team_name, 'department_id': t.department_id}
+                for t in self._team_nodes
+            ],
+            'cells': [
+                {'cell_id': c.cell_id, 'cell_name': c.cell_name, 'team_id': c.team_id}
+                for c in self._cell_nodes
+            ]
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def load_org_hierarchy(version=None):
+    """Build a new index with one projected query per organisation table"""
+    return OrgHierarchy(
+        version,
+        db.session.query(Region.region_id, Region.region_name).all(),
+        db.session.query(Direction.direction_id, Direction.direction_name, Direction.region_id).all(),
+        db.session.query(Department.department_id, Department.department_name, Department.direction_id).all(),
+        db.session.query(Team.team_id, Team.team_name, Team.department_id).all(),
+        db.session.query(Cell.cell_id, Cell.cell_name, Cell.team_id).all()
+    )
+
+def get_org_hierarchy():
+    """Return the current index, rebuilding it only when an org table changed"""
+    global _index
+    version = tag_versions(ORG_TAGS)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    # Uncommitted org changes in this session must not leak into the shared index
+    if pending_tables(db.session).intersection(ORG_TAGS):
+        return load_org_hierarchy(version)
+
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = load_org_hierarchy(version)
+        return _index
+
+def _query_hierarchy_paths(cell_ids):
+    """Resolve paths for cells missing from the index with one joined query"""
+    rows = db.session.query(
+        Cell.cell_id, Cell.cell_name,
+        Team.team_id, Team.team_name,
+        Department.department_id, Department.department_name,
+        Direction.direction_id, Direction.direction_name,
+        Region.region_id, Region.region_name
+    ).join(
+        Team, Cell.team_id == Team.team_id
+    ).join(
+        Department, Team.department_id == Department.department_id
+    ).join(
+        Direction, Department.direction_id == Direction.direction_id
+    ).join(
+        Region, Direction.region_id == Region.region_id
+    ).filter(
+        Cell.cell_id.in_(cell_ids)
+    ).all()
+
+    return {
+        row.cell_id: {
+            'cell': {'id': row.cell_id, 'name': row.cell_name},
+            'team': {'id': row.team_id, 'name': row.team_name},
+            'department': {'id': row.department_id, 'name': row.department_name},
+            'direction': {'id': row.direction_id, 'name': row.direction_name},
+            'region': {'id': row.region_id, 'name': row.region_name}
+        }
+        for row in rows
+    }
+
+def resolve_hierarchy_paths(people_or_cell_ids):
+    """Resolve hierarchy paths for many people (or cell ids) at once
+
+    Returns a dict keyed by cell_id. Paths come from the in-memory index;
+    cells it does not know yet are fetched together in a single query, so
+    the cost never grows with the number of people.
+    """
+    org = get_org_hierarchy()
+    cell_ids = {getattr(item, 'cell_id', item) for item in people_or_cell_ids}
+
+    paths = {}
+    missing = []
+    for cell_id in cell_ids:
+        path = org.path(cell_id)
+        if path is None:
+            missing.append(cell_id)
+        else:
+            paths[cell_id] = path
+
+    if missing:
+        paths.update(_query_hierarchy_paths(missing))
+    return paths
@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+from sqlalchemy import ARRAY, Integer, String, func, tuple_
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    """A cursor token that was not produced by ``encode_cursor`` for this sort"""
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque URL-safe token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, types):
+    """Decode a cursor token whose values have the given Python ``types``
+
+    Returns None when the token is missing and raises InvalidCursor when it
+    is malformed, so a tampered cursor never reaches the database.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(values, list) or len(values) != len(types):
+        raise InvalidCursor('Malformed cursor')
+    for value, expected in zip(values, types):
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise InvalidCursor('Malformed cursor')
+        if expected is list and not all(isinstance(item, str) for item in value):
+            raise InvalidCursor('Malformed cursor')
+    return values
+
+def _sort_key(column):
+    """Sort expression and cursor value type for a column
+
+    Row-value comparisons never match NULL, so every column except a
+    primary key sorts with NULL read as '' or 0. Imported people can lack
+    a last name even though the model declares it required. Text arrays
+    compare element by element and must be NOT NULL.
+    """
+    expression = getattr(column, 'expression', column)
+    if isinstance(expression.type, ARRAY):
+        return column, list
+    if isinstance(expression.type, String):
+        python_type, empty = str, ''
+    elif isinstance(expression.type, Integer):
+        python_type, empty = int, 0
+    else:
+        raise TypeError(f"Unsupported keyset sort column: {column}")
+    if not getattr(expression, 'primary_key', False):
+        column = func.coalesce(column, empty)
+    return column, python_type
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, per_page, has_prev, has_next, prev_cursor, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.total = total
+
+    def to_dict(self):
+        return {
+            'per_page': self.per_page,
+            'total': self.total,
+            'has_prev': self.has_prev,
+            'has_next': self.has_next,
+            'prev_cursor': self.prev_cursor,
+            'next_cursor': self.next_cursor
+        }
+
+
+def keyset_paginate(query, sort_columns, per_page, after=None, before=None, total=None):
+    """Return the page of ``query`` after (or before) a cursor
+
+    ``sort_columns`` must make the order total, e.g. end with a primary key.
+    The cursor is a row-value comparison on those columns, so fetching any
+    page costs the same as the first one instead of scanning an OFFSET.
+    Raises InvalidCursor for a cursor that does not match the columns.
+    """
+    sort_columns, types = zip(*[_sort_key(column) for column in sort_columns])
+    after_values = decode_cursor(after, types)
+    before_values = decode_cursor(before, types)
+    key = tuple_(*sort_columns)
+    query = query.add_columns(*sort_columns)
+
+    if before_values is not None:
+        # Walk backwards from the cursor, then restore display order
+        rows = query.filter(key < tuple_(*before_values)).order_by(
+            *[column.desc() for column in sort_columns]
+        ).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after_values is not None:
+            query = query.filter(key > tuple_(*after_values))
+        rows = query.order_by(*sort_columns).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after_values is not None
+
+    prev_cursor = encode_cursor(rows[0][1:]) if rows and has_prev else None
+    next_cursor = encode_cursor(rows[-1][1:]) if rows and has_next else None
+
+    return KeysetPage(
+        [row[0] for row in rows], per_page,
+        has_prev and prev_cursor is not None,
+        has_next and next_cursor is not None,
+        prev_cursor, next_cursor, total
+    )
@@ -0,0 +1,57 @@
+"""
+Set-based reassignment of people to a cell
+"""
+from sqlalchemy import Integer, any_, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import db
+from app.models.people import Person
+from app.models.organization import Direction, Department, Team, Cell
+from app.services.cache_service import record_dirty_tags
+
+
+def _direction_name(cell_id):
+    """Name of the direction above a cell, as stored on ``Person.direction``"""
+    return select(Direction.direction_name).select_from(Cell).join(
+        Team, Cell.team_id == Team.team_id
+    ).join(
+        Department, Team.department_id == Department.department_id
+    ).join(
+        Direction, Department.direction_id == Direction.direction_id
+    ).where(Cell.cell_id == cell_id).scalar_subquery()
+
+def reassign_people(cell_id, person_ids=None, from_cell_id=None, from_team_id=None):
+    """Move people to ``cell_id`` with one UPDATE; returns the number moved
+
+    People are chosen by exactly one of ``person_ids``, every member of
+    ``from_cell_id`` or every member of ``from_team_id``. The direction
+    name is set in the same statement, and the ancestor id columns follow
+    through the people triggers. The caller commits.
+    """
+    selectors = [value for value in (person_ids, from_cell_id, from_team_id) if value is not None]
+    if len(selectors) != 1:
+        raise ValueError('Choose people by ids, by cell or by team')
+    if db.session.get(Cell, cell_id) is None:
+        raise ValueError(f'Cell {cell_id} does not exist')
+
+    people = Person.__table__
+    statement = update(people).values(
+        cell_id=cell_id,
+        direction=_direction_name(cell_id),
+        updated_at=func.now()
+    ).where(people.c.cell_id != cell_id)
+
+    if person_ids is not None:
+        ids = sorted({int(person_id) for person_id in person_ids})
+        if not ids:
+            return 0
+        statement = statement.where(people.c.person_id == any_(bindparam('ids', ids, type_=ARRAY(Integer))))
+    elif from_cell_id is not None:
+        statement = statement.where(people.c.cell_id == from_cell_id)
+    else:
+        statement = statement.where(people.c.team_id == from_team_id)
+
+    moved = db.session.execute(statement).rowcount
+    if moved:
+        record_dirty_tags(db.session, Person.__tablename__)
+    return moved
@@ -0,0 +1,192 @@
+"""
+Detailed attendance report, shared by the report page and export jobs
+"""
+import csv
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case
+
+from app import db
+from app.models.services import Service, Attendance
+from app.models.people import Person
+from app.models.organization import Region, Direction, Department, Team, Cell
+
+DETAILED_REPORT_HEADERS = [
+    'First Name', 'Last Name', 'Gender', 'Cell', 'Team', 
+    'Department', 'Zone', 'Region', 'Present Count', 
+    'Watched Recording Count', 'Absent Count', 'Total Marked',
+    'Total Services', 'Attendance Percentage'
+]
+
+def build_detailed_report(args):
+    """Rows of the detailed report for the filters in ``args`` (a MultiDict)
+
+    Returns ``(results_list, total_services)``.
+    """
+    # Parse date range parameters
+    days = args.get('days', 30, type=int)
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days)
+    
+    # Get filters
+    service_type_id = args.get('service_type_id', type=int)
+    region_id = args.get('region_id', type=int)
+    direction_id = args.get('direction_id', type=int)
+    department_id = args.get('department_id', type=int)
+    team_id = args.get('team_id', type=int)
+    cell_id = args.get('cell_id', type=int)
+    gender = args.get('gender')
+
+    # Build base query for person data
+    query = db.session.query(
+        Person.person_id,
+        Person.first_name,
+        Person.last_name,
+        Person.gender,
+        Cell.cell_name,
+        Team.team_name,
+        Department.department_name,
+        Direction.direction_name,
+        Region.region_name
+    ).select_from(Person).join(
+        Cell, Person.cell_id == Cell.cell_id
+    ).join(
+        Team, Cell.team_id == Team.team_id
+    ).join(
+        Department, Team.department_id == Department.department_id
+    ).join(
+        Direction, Department.direction_id == Direction.direction_id
+    ).join(
+        Region, Direction.region_id == Region.region_id
+    )
+    
+    # Build subquery for attendance data within date range
+    attendance_subquery = db.session.query(
+        Attendance.person_id,
+        func.sum(case(
+            (Attendance.status == 'present', 1),
+            (Attendance.status == 'watched_recording', 0.5),
+            else_=0
+        )).label('attendance_points'),
+        func.count(Attendance.attendance_id).label('marked_services'),
+        func.sum(case(
+            (Attendance.status == 'present', 1),
+            else_=0
+        )).label('present_count'),
+        func.sum(case(
+            (Attendance.status == 'watched_recording', 1),
+            else_=0
+        )).label('watched_recording_count'),
+        func.sum(case(
+            (Attendance.status == 'absent', 1),
+            else_=0
+        )).label('absent_count')
+    ).join(
+        Service, Attendance.service_id == Service.service_id
+    ).filter(
+        Service.service_date.between(start_date, end_date)
+    )
+    
+    # Apply service type filter to the subquery if provided
+    if service_type_id:
+        attendance_subquery = attendance_subquery.filter(Service.service_type_id == service_type_id)
+    
+    # Group the attendance data by person
+    attendance_subquery = attendance_subquery.group_by(Attendance.person_id).subquery()
+    
+    # Get the total number of services in the date range
+    service_count_query = db.session.query(func.count(Service.service_id))
+    service_count_query = service_count_query.filter(Service.service_date.between(start_date, end_date))
+    if service_type_id:
+        service_count_query = service_count_query.filter(Service.service_type_id == service_type_id)
+    total_services = service_count_query.scalar() or 0
+    
+    # Join with the attendance data and add columns from subquery
+    query = query.add_columns(
+        attendance_subquery.c.attendance_points,
+        attendance_subquery.c.marked_services,
+        attendance_subquery.c.present_count,
+        attendance_subquery.c.watched_recording_count,
+        attendance_subquery.c.absent_count
+    ).outerjoin(
+        attendance_subquery,
+        Person.person_id == attendance_subquery.c.person_id
+    )
+
+    # Apply filters
+    if region_id:
+        query = query.filter(Person.region_id == region_id)
+    if direction_id:
+        query = query.filter(Person.direction_id == direction_id)
+    if department_id:
+        query = query.filter(Person.department_id == department_id)
+    if team_id:
+        query = query.filter(Person.team_id == team_id)
+    if cell_id:
+        query = query.filter(Person.cell_id == cell_id)
+    if gender:
+        query = query.filter(Person.gender == gender)
+
+    # Order results
+    query = query.order_by(
+        Region.region_name,
+        Direction.direction_name,
+        Department.department_name,
+        Team.team_name,
+        Cell.cell_name,
+        Person.first_name,
+        Person.last_name
+    )
+
+    # Process results
+    results_list = []
+    for person_data in query.all():
+        # Get attendance stats, defaulting to 0 if None
+        attendance_points = float(person_data.attendance_points or 0)
+        marked_services = int(person_data.marked_services or 0)
+        present_count = int(person_data.present_count or 0)
+        watched_recording_count = int(person_data.watched_recording_count or 0)
+        absent_count = int(person_data.absent_count or 0)
+        
+        # Calculate percentage based on points
+        # Present = 1 point, Watched Recording = 0.5 points
+        max_possible_points = total_services * 1.0  # Maximum points if present at all services
+        attendance_percentage = (attendance_points / max_possible_points * 100) if max_possible_points > 0 else 0
+        
+        # Create result object
+        result = {
+            'first_name': person_data.first_name,
+            'last_name': person_data.last_name,
+            'gender': person_data.gender,
+            'cell_name': person_data.cell_name,
+            'team_name': person_data.team_name,
+            'department_name': person_data.department_name,
+            'direction_name': person_data.direction_name,
+            'region_name': person_data.region_name,
+            'present_count': present_count,
+            'watched_recording_count': watched_recording_count,
+            'absent_count': absent_count,
+            'marked_services': marked_services,
+            'total_services': total_services,
+            'attendance_percentage': attendance_percentage
+        }
+        results_list.append(result)
+
+    return results_list, total_services
+
+def write_detailed_report_csv(results_list, output):
+    """Write report rows as CSV to a text stream"""
+    writer = csv.writer(output)
+    
+    # Write headers
+    writer.writerow(DETAILED_REPORT_HEADERS)
+    
+    # Write data
+    for row in results_list:
+        writer.writerow([
+            row['first_name'], row['last_name'], row['gender'] or 'Not specified',
+            row['cell_name'], row['team_name'], row['department_name'],
+            row['direction_name'], row['region_name'], row['present_count'],
+            row['watched_recording_count'], row['absent_count'], row['marked_services'],
+            row['total_services'], f"{row['attendance_percentage']:.1f}%"
+        ])
@@ -0,0 +1,317 @@
+"""
+In-process typeahead search over active people
+"""
+from array import array
+from collections import namedtuple, OrderedDict
+from datetime import timedelta
+import logging
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models.people import Person
+from app.models.services import Attendance
+from app.services.attendance_changes import changes_since, latest_seq
+from app.services.attendance_writer import service_tag
+from app.services.cache_service import tag_versions, ORG_TAGS
+from app.services.org_hierarchy import resolve_hierarchy_paths
+
+logger = logging.getLogger(__name__)
+
+# Rebuild from scratch this often to drop deleted people and stale postings
+FULL_REBUILD_INTERVAL = 600
+
+# Services whose marked-person sets are kept in memory
+MARKED_SERVICES = 32
+
+# Check a service's change feed at least this often, in case a write
+# bypassed the attendance writer and its per-service tag
+MARKED_RECHECK_INTERVAL = 5
+
+# Incremental refreshes look this far behind the watermark, so rows from
+# transactions that started earlier but committed later are not missed
+WATERMARK_MARGIN = timedelta(seconds=120)
+
+PersonEntry = namedtuple('PersonEntry', 'person_id first_name last_name full_name last_key cell_id path')
+
+def normalize(text):
+    """Lower-case, accent-free form of text (mirrors church.search_normalize)"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _prefixes(text):
+    """One and two character prefixes of every word, for very short queries"""
+    return {word[:n] for word in text.split() for n in (1, 2) if len(word) >= n}
+
+
+class TypeaheadIndex:
+    """Trigram inverted index over active people, refreshed incrementally
+
+    Each entry carries its hierarchy path, so a search is answered from
+    memory. Changes are picked up from ``updated_at``/``created_at`` when
+    the ``people`` cache tag moves; a periodic full rebuild drops deleted
+    people and postings left behind by renames. Only the first build runs
+    in a request; later rebuilds run in a background thread while the
+    current index keeps answering.
+    """
+
+    def __init__(self):
+        self._people = {}
+        self._grams = {}
+        self._short = {}
+        self._lock = threading.Lock()
+        self._people_version = None
+        self._org_version = None
+        self._watermark = None
+        self._built_at = 0
+        self._rebuilding = False
+        self._marked = OrderedDict()  # service_id -> MarkedSet
+
+    # Index maintenance
+
+    def _index_entry(self, entry, grams, short):
+        for gram in _trigrams(entry.full_name):
+            grams.setdefault(gram, array('l')).append(entry.person_id)
+        for prefix in _prefixes(entry.full_name):
+            short.setdefault(prefix, array('l')).append(entry.person_id)
+
+    def _load_rows(self, changed_since=None):
+        updated = func.coalesce(Person.updated_at, Person.created_at)
+        query = db.session.query(
+            Person.person_id, Person.first_name, Person.last_name,
+            Person.cell_id, Person.is_active, updated.label('changed_at')
+        )
+        if changed_since is None:
+            query = query.filter(Person.is_active == True)
+        else:
+            query = query.filter(updated >= changed_since)
+        return query.all()
+
+    def _make_entries(self, rows):
+        """Index entries for rows; people whose cell has no hierarchy path are left out"""
+        paths = resolve_hierarchy_paths(row.cell_id for row in rows)
+        return [
+            PersonEntry(
+                row.person_id, row.first_name, row.last_name,
+                normalize(f"{row.first_name or ''} {row.last_name or ''}"), normalize(row.last_name),
+                row.cell_id, paths[row.cell_id]
+            )
+            for row in rows
+            if paths.get(row.cell_id) is not None
+        ]
+
+    def _load_index(self):
+        """A complete index as (people, grams, short, watermark), without installing it"""
+        rows = self._load_rows()
+        people, grams, short = {}, {}, {}
+        for entry in self._make_entries(rows):
+            people[entry.person_id] = entry
+            self._index_entry(entry, grams, short)
+        watermark = max((row.changed_at for row in rows if row.changed_at), default=None)
+        return people, grams, short, watermark
+
+    def _install(self, index, people_version, org_version):
+        # Swap the structures in one go so readers never see a partial index
+        self._people, self._grams, self._short, self._watermark = index
+        self._people_version = people_version
+        self._org_version = org_version
+        self._built_at = time.time()
+
+    def _rebuild(self, app, people_version, org_version):
+        """Background full rebuild; the versions are the ones seen before loading"""
+        try:
+            with app.app_context():
+                index = self._load_index()
+            with self._lock:
+                self._install(index, people_version, org_version)
+        except Exception:
+            logger.exception("Typeahead index rebuild failed")
+        finally:
+            self._rebuilding = False
+
+    def _apply_changes(self):
+        if self._watermark is None:
+            self._people, self._grams, self._short, self._watermark = self._load_index()
+            return
+
+        rows = self._load_rows(changed_since=self._watermark - WATERMARK_MARGIN)
+        active = [row for row in rows if row.is_active]
+        for row in rows:
+            if not row.is_active:
+                self._people.pop(row.person_id, None)
+
+        for entry in self._make_entries(active):
+            previous = self._people.get(entry.person_id)
+            self._people[entry.person_id] = entry
+            if previous is None or previous.full_name != entry.full_name:
+                self._index_entry(entry, self._grams, self._short)
+
+        self._watermark = max([self._watermark] + [row.changed_at for row in rows if row.changed_at])
+
+    def _relabel(self):
+        """Re-resolve every entry's hierarchy path after an org change"""
+        paths = resolve_hierarchy_paths(entry.cell_id for entry in self._people.values())
+        self._people = {
+            person_id: entry._replace(path=paths[entry.cell_id])
+            for person_id, entry in self._people.items()
+            if paths.get(entry.cell_id) is not None
+        }
+
+    def refresh(self):
+        """Bring the index up to date with the people and org tables"""
+        people_version = tag_versions(('people',))
+        org_version = tag_versions(ORG_TAGS)
+
+        def is_current():
+            return self._people_version == people_version and self._org_version == org_version
+
+        if self._built_at and time.time() - self._built_at >= FULL_REBUILD_INTERVAL:
+            self._start_rebuild(people_version, org_version)
+
+        if is_current():
+            return
+
+        with self._lock:
+            if is_current():
+                return
+            if not self._built_at:
+                self._install(self._load_index(), people_version, org_version)
+                return
+            if self._people_version != people_version:
+                self._apply_changes()
+            if self._org_version != org_version:
+                self._relabel()
+            self._people_version = people_version
+            self._org_version = org_version
+
+    def _start_rebuild(self, people_version, org_version):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(
+            target=self._rebuild, args=(current_app._get_current_object(), people_version, org_version),
+            name='typeahead-rebuild', daemon=True
+        ).start()
+
+    # Queries
+
+    def _candidates(self, words):
+        """Smallest posting list among the query's trigrams and prefixes"""
+        best = None
+        for word in words:
+            if len(word) >= 3:
+                postings = [self._grams.get(gram) for gram in _trigrams(word)]
+            else:
+                postings = [self._short.get(word)]
+            for posting in postings:
+                if posting is None:
+                    return ()
+                if best is None or len(posting) < len(best):
+                    best = posting
+        return set(best) if best is not None else ()
+
+    @staticmethod
+    def _matches(entry, words):
+        tokens = entry.full_name.split()
+        return all(
+            word in entry.full_name if len(word) >= 3
+            else any(token.startswith(word) for token in tokens)
+            for word in words
+        )
+
+    @staticmethod
+    def _rank(entry, needle):
+        if entry.full_name.startswith(needle):
+            quality = 3
+        elif entry.last_key.startswith(needle):
+            quality = 2
+        elif f" {needle}" in entry.full_name:
+            quality = 1
+        else:
+            quality = 0
+        return (-quality, abs(len(entry.full_name) - len(needle)), entry.last_key, normalize(entry.first_name))
+
+    def search(self, text, limit=20):
+        """Return up to ``limit`` active people matching ``text``, best first"""
+        self.refresh()
+
+        needle = ' '.join(normalize(text).split())
+        words = needle.split()
+        if not words:
+            return []
+
+        people = self._people
+        matches = []
+        for person_id in self._candidates(words):
+            entry = people.get(person_id)
+            if entry is not None and self._matches(entry, words):
+                matches.append(entry)
+
+        matches.sort(key=lambda entry: self._rank(entry, needle))
+        return matches[:limit]
+
+    def marked_ids(self, service_id):
+        """Person ids already marked for a service
+
+        Loaded once per service, then kept current from the service's
+        change feed whenever its own attendance tag moves, so marks for
+        other services never cause a reload.
+        """
+        version = tag_versions((service_tag(service_id),))
+        with self._lock:
+            marked = self._marked.get(service_id)
+            if marked is None:
+                marked = self._marked[service_id] = MarkedSet()
+            self._marked.move_to_end(service_id)
+            while len(self._marked) > MARKED_SERVICES:
+                self._marked.popitem(last=False)
+
+        with marked.lock:
+            if marked.version != version or time.monotonic() - marked.checked_at >= MARKED_RECHECK_INTERVAL:
+                marked.refresh(service_id)
+                marked.version = version
+            return marked.ids
+
+
+class MarkedSet:
+    """Marked person ids of one service and the feed position they reflect"""
+
+    def __init__(self):
+        self.ids = frozenset()
+        self.seq = None
+        self.version = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, service_id):
+        if self.seq is None:
+            # Feed position first; changes replayed below are idempotent
+            self.seq = latest_seq(service_id)
+            self.ids = frozenset(
+                person_id for person_id, in
+                db.session.query(Attendance.person_id).filter(Attendance.service_id == service_id)
+            )
+        ids = set(self.ids)
+        more = True
+        while more:
+            changes, more = changes_since(service_id, self.seq)
+            for seq, person_id, status, _ in changes:
+                if status is None:
+                    ids.discard(person_id)
+                else:
+                    ids.add(person_id)
+                self.seq = seq
+        self.ids = frozenset(ids)
+        self.checked_at = time.monotonic()
+
+
+# Index shared by all requests in this worker
+people_typeahead = TypeaheadIndex()
@@ -0,0 +1,198 @@
+"""
+Write-behind buffer for attendance marks
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from app import db
+from app.models.services import Service
+from app.services.attendance_sync import utc_to_local
+from app.services.attendance_writer import apply_attendance
+from app.services.live_counters import live_counters
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = 'attendance-*.wal'
+
+
+class Segment:
+    """One append-only log file, exclusively locked by the process writing it"""
+
+    def __init__(self, path, handle):
+        self.path = path
+        self.handle = handle
+
+    @classmethod
+    def create(cls, directory):
+        name = f"attendance-{time.time_ns():020d}-{socket.gethostname()}-{os.getpid()}.wal"
+        path = os.path.join(directory, name)
+        handle = open(path, 'ab')
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return cls(path, handle)
+
+    def append(self, records):
+        """Append records and fsync before returning"""
+        data = b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records)
+        self.handle.write(data)
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def remove(self):
+        os.unlink(self.path)
+        self.handle.close()
+
+
+def read_segment(handle):
+    """Records of a segment; a torn final line from a crash is ignored"""
+    handle.seek(0)
+    records = []
+    for line in handle:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records
+
+
+class WriteBehindBuffer:
+    """Acknowledge attendance marks once fsynced to a local log; flush in batches
+
+    Each process appends to its own log segment. A background thread swaps
+    in a fresh segment, coalesces the buffered marks to the last status per
+    (service, person), writes them with the set-based attendance writer in
+    one transaction and then deletes the old segment. On start, segments
+    whose owning process is gone (their lock is free) are replayed first.
+
+    Live counters are computed from Postgres, so viewers are only notified
+    after a flush; they lag accepted marks by up to the flush interval.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._segments = []  # Unflushed segments, oldest first; the last is current
+        self._pid = None
+        self._wake = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        if app.config.get('ATTENDANCE_WRITE_BEHIND'):
+            self._ensure_started()
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config.get('ATTENDANCE_WRITE_BEHIND'))
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            directory = self.app.config['ATTENDANCE_WAL_DIR']
+            os.makedirs(directory, exist_ok=True)
+            self._pending = []
+            self._segments = [Segment.create(directory)]
+            self._pid = os.getpid()
+            self._recover(directory)
+            threading.Thread(target=self._run, name='attendance-write-behind', daemon=True).start()
+
+    def _recover(self, directory):
+        """Adopt the segments of processes that died before flushing"""
+        current = self._segments[-1].path
+        for path in sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN))):
+            if path == current:
+                continue
+            handle = open(path, 'a+b')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()  # Still owned by a live process
+                continue
+            records = read_segment(handle)
+            if not records:
+                Segment(path, handle).remove()  # Nothing to replay
+                continue
+            logger.info("Replaying %d attendance marks from %s", len(records), path)
+            self._pending.extend(records)
+            self._segments.insert(len(self._segments) - 1, Segment(path, handle))
+
+    def enqueue(self, service_id, person_status):
+        """Durably log marks for a service; they reach Postgres on the next flush"""
+        self._ensure_started()
+        now = time.time()
+        records = [
+            {'service_id': service_id, 'person_id': person_id, 'status': status, 'ts': now}
+            for person_id, status in person_status.items()
+        ]
+        with self._lock:
+            self._segments[-1].append(records)
+            self._pending.extend(records)
+            if len(self._pending) >= self.app.config['ATTENDANCE_FLUSH_BATCH']:
+                self._wake.set()
+
+    def _run(self):
+        interval = self.app.config['ATTENDANCE_FLUSH_INTERVAL']
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Attendance write-behind flush failed; retrying")
+                time.sleep(interval)
+
+    def flush(self):
+        """Write buffered marks to Postgres and drop the segments holding them"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            records, self._pending = self._pending, []
+            flushed_segments = self._segments
+            self._segments = [Segment.create(self.app.config['ATTENDANCE_WAL_DIR'])]
+
+        # Last mark per person wins, as if the requests had run in order, and
+        # keeps the time it was accepted rather than the time of the flush
+        by_service = {}
+        marked_at = {}
+        for record in records:
+            by_service.setdefault(record['service_id'], {})[record['person_id']] = record['status']
+            marked_at.setdefault(record['service_id'], {})[record['person_id']] = utc_to_local(
+                datetime.utcfromtimestamp(record['ts'])
+            )
+
+        try:
+            with self.app.app_context():
+                # Marks for a service deleted since they were logged are dropped
+                known_services = {
+                    service_id for service_id, in
+                    db.session.query(Service.service_id).filter(Service.service_id.in_(list(by_service)))
+                }
+                for service_id, person_status in by_service.items():
+                    if service_id in known_services:
+                        apply_attendance(service_id, person_status, marked_at=marked_at[service_id])
+                db.session.commit()
+        except Exception:
+            # Keep the old segments and records ahead of anything newer
+            with self._lock:
+                self._pending = records + self._pending
+                self._segments = flushed_segments + self._segments
+            raise
+
+        for segment in flushed_segments:
+            segment.remove()
+        live_counters.notify()
+        return len(records)
+
+
+# Buffer shared by all requests in this worker
+write_behind = WriteBehindBuffer()
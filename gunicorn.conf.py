@@ -0,0 +1,14 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+
+# Threaded workers, so a request that waits (attendance long-polls when
+# ATTENDANCE_LONG_POLL is set) holds one thread rather than a whole process.
+# Keep threads well above the number of attendance forms open per worker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+timeout = 60
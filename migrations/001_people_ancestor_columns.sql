@@ -0,0 +1,113 @@
+-- Denormalised ancestor ids on church.people
+--
+-- Listings filter people by region/direction/department/team. Keeping the
+-- ancestor ids on the row turns each of those filters into one indexed
+-- predicate instead of a join through cells -> teams -> departments ->
+-- directions -> regions. Triggers keep the columns correct when a person
+-- moves to another cell or an org node is moved under a new parent.
+
+BEGIN;
+
+-- Ancestors of every cell, resolved once
+CREATE OR REPLACE VIEW church.cell_ancestors AS
+SELECT c.cell_id,
+       t.team_id,
+       d.department_id,
+       dr.direction_id,
+       dr.region_id
+  FROM church.cells c
+  JOIN church.teams t ON t.team_id = c.team_id
+  JOIN church.departments d ON d.department_id = t.department_id
+  JOIN church.directions dr ON dr.direction_id = d.direction_id;
+
+ALTER TABLE church.people
+    ADD COLUMN IF NOT EXISTS team_id integer,
+    ADD COLUMN IF NOT EXISTS department_id integer,
+    ADD COLUMN IF NOT EXISTS direction_id integer,
+    ADD COLUMN IF NOT EXISTS region_id integer;
+
+UPDATE church.people p
+   SET team_id = a.team_id,
+       department_id = a.department_id,
+       direction_id = a.direction_id,
+       region_id = a.region_id
+  FROM church.cell_ancestors a
+ WHERE a.cell_id = p.cell_id;
+
+CREATE INDEX IF NOT EXISTS people_cell_id_idx ON church.people (cell_id);
+CREATE INDEX IF NOT EXISTS people_team_id_idx ON church.people (team_id);
+CREATE INDEX IF NOT EXISTS people_department_id_idx ON church.people (department_id);
+CREATE INDEX IF NOT EXISTS people_direction_id_idx ON church.people (direction_id);
+CREATE INDEX IF NOT EXISTS people_region_id_idx ON church.people (region_id);
+
+-- Fill the ancestor ids whenever a person is created or changes cell
+CREATE OR REPLACE FUNCTION church.people_set_ancestors() RETURNS trigger AS $$
+BEGIN
+    SELECT a.team_id, a.department_id, a.direction_id, a.region_id
+      INTO NEW.team_id, NEW.department_id, NEW.direction_id, NEW.region_id
+      FROM church.cell_ancestors a
+     WHERE a.cell_id = NEW.cell_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_set_ancestors ON church.people;
+CREATE TRIGGER people_set_ancestors
+    BEFORE INSERT OR UPDATE OF cell_id ON church.people
+    FOR EACH ROW EXECUTE FUNCTION church.people_set_ancestors();
+
+-- Re-resolve the people below an org node that moved to a new parent
+CREATE OR REPLACE FUNCTION church.org_refresh_people_ancestors() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'cells' THEN
+        UPDATE church.people p
+           SET team_id = a.team_id, department_id = a.department_id,
+               direction_id = a.direction_id, region_id = a.region_id
+          FROM church.cell_ancestors a
+         WHERE a.cell_id = p.cell_id AND p.cell_id = NEW.cell_id;
+    ELSIF TG_TABLE_NAME = 'teams' THEN
+        UPDATE church.people p
+           SET team_id = a.team_id, department_id = a.department_id,
+               direction_id = a.direction_id, region_id = a.region_id
+          FROM church.cell_ancestors a
+         WHERE a.cell_id = p.cell_id AND p.team_id = NEW.team_id;
+    ELSIF TG_TABLE_NAME = 'departments' THEN
+        UPDATE church.people p
+           SET team_id = a.team_id, department_id = a.department_id,
+               direction_id = a.direction_id, region_id = a.region_id
+          FROM church.cell_ancestors a
+         WHERE a.cell_id = p.cell_id AND p.department_id = NEW.department_id;
+    ELSIF TG_TABLE_NAME = 'directions' THEN
+        UPDATE church.people p
+           SET region_id = NEW.region_id
+         WHERE p.direction_id = NEW.direction_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cells_refresh_people_ancestors ON church.cells;
+CREATE TRIGGER cells_refresh_people_ancestors
+    AFTER UPDATE OF team_id ON church.cells
+    FOR EACH ROW WHEN (OLD.team_id IS DISTINCT FROM NEW.team_id)
+    EXECUTE FUNCTION church.org_refresh_people_ancestors();
+
+DROP TRIGGER IF EXISTS teams_refresh_people_ancestors ON church.teams;
+CREATE TRIGGER teams_refresh_people_ancestors
+    AFTER UPDATE OF department_id ON church.teams
+    FOR EACH ROW WHEN (OLD.department_id IS DISTINCT FROM NEW.department_id)
+    EXECUTE FUNCTION church.org_refresh_people_ancestors();
+
+DROP TRIGGER IF EXISTS departments_refresh_people_ancestors ON church.departments;
+CREATE TRIGGER departments_refresh_people_ancestors
+    AFTER UPDATE OF direction_id ON church.departments
+    FOR EACH ROW WHEN (OLD.direction_id IS DISTINCT FROM NEW.direction_id)
+    EXECUTE FUNCTION church.org_refresh_people_ancestors();
+
+DROP TRIGGER IF EXISTS directions_refresh_people_ancestors ON church.directions;
+CREATE TRIGGER directions_refresh_people_ancestors
+    AFTER UPDATE OF region_id ON church.directions
+    FOR EACH ROW WHEN (OLD.region_id IS DISTINCT FROM NEW.region_id)
+    EXECUTE FUNCTION church.org_refresh_people_ancestors();
+
+COMMIT;
@@ -0,0 +1,28 @@
+-- Trigram index for people name search
+--
+-- Typeahead searches match anywhere in a person's full name, ignoring case
+-- and accents. A GIN trigram index over the normalised full name lets
+-- Postgres answer those LIKE '%...%' predicates without scanning the table.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() is only STABLE; this wrapper pins the dictionary so it can be
+-- used in an index expression
+CREATE OR REPLACE FUNCTION church.search_normalize(value text) RETURNS text AS $$
+    SELECT lower(public.unaccent('public.unaccent'::regdictionary, value))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Missing name parts read as '' (concat_ws is not immutable, so coalesce);
+-- app.services.name_search.full_name_expr must build the same expression.
+CREATE INDEX IF NOT EXISTS people_full_name_trgm_idx
+    ON church.people
+    USING gin (church.search_normalize(coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS people_last_name_trgm_idx
+    ON church.people
+    USING gin (church.search_normalize(last_name) gin_trgm_ops);
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- One attendance mark per person per service
+--
+-- The bulk write path upserts marks with
+-- INSERT ... ON CONFLICT (service_id, person_id) DO UPDATE, which needs a
+-- unique constraint on those columns. Duplicate marks left by the old
+-- per-row path are collapsed to the most recent one first.
+
+BEGIN;
+
+DELETE FROM church.attendance a
+USING church.attendance newer
+WHERE a.service_id = newer.service_id
+  AND a.person_id = newer.person_id
+  AND a.attendance_id < newer.attendance_id;
+
+ALTER TABLE church.attendance
+    ADD CONSTRAINT attendance_service_person_key UNIQUE (service_id, person_id);
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- Operation log for offline attendance sync
+--
+-- Devices queue attendance marks while offline and replay them through
+-- /api/attendance/sync. Every accepted operation id is recorded here so a
+-- replayed batch is acknowledged without being applied twice, and the
+-- client timestamp of the latest operation per mark lets older operations
+-- from another device be recognised as stale.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS church.attendance_sync_ops (
+    op_id varchar(64) PRIMARY KEY,
+    device_id varchar(64),
+    service_id integer NOT NULL REFERENCES church.services (service_id),
+    person_id integer NOT NULL REFERENCES church.people (person_id),
+    status varchar(20) NOT NULL,
+    client_ts timestamp NOT NULL,
+    result varchar(20) NOT NULL,
+    received_at timestamp DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS attendance_sync_ops_mark_idx
+    ON church.attendance_sync_ops (service_id, person_id, client_ts);
+
+COMMIT;
@@ -0,0 +1,72 @@
+-- Per-service attendance change feed
+--
+-- Every insert, status change or delete on church.attendance is appended
+-- to church.attendance_changes with a sequence number that is monotonic
+-- per service. The sequence comes from a per-service counter row rather
+-- than a global sequence: incrementing it locks the row until the writing
+-- transaction ends, so changes to one service become visible in sequence
+-- order and a reader holding cursor N can never miss a later commit with a
+-- smaller number.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS church.attendance_change_seq (
+    service_id integer PRIMARY KEY REFERENCES church.services (service_id) ON DELETE CASCADE,
+    last_seq bigint NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS church.attendance_changes (
+    service_id integer NOT NULL REFERENCES church.services (service_id) ON DELETE CASCADE,
+    seq bigint NOT NULL,
+    person_id integer NOT NULL,
+    status varchar(20),            -- NULL when the mark was removed
+    previous_status varchar(20),   -- NULL when the person was unmarked
+    changed_at timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (service_id, seq)
+);
+
+CREATE OR REPLACE FUNCTION church.attendance_record_change() RETURNS trigger AS $$
+DECLARE
+    next_seq bigint;
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.service_id = OLD.service_id AND NEW.person_id = OLD.person_id THEN
+        RETURN NULL;
+    END IF;
+
+    -- A row moved to another service or person is a removal plus an addition
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (NEW.service_id <> OLD.service_id OR NEW.person_id <> OLD.person_id)) THEN
+        INSERT INTO church.attendance_change_seq AS s (service_id, last_seq)
+        VALUES (OLD.service_id, 1)
+        ON CONFLICT (service_id) DO UPDATE SET last_seq = s.last_seq + 1
+        RETURNING last_seq INTO next_seq;
+
+        INSERT INTO church.attendance_changes (service_id, seq, person_id, status, previous_status)
+        VALUES (OLD.service_id, next_seq, OLD.person_id, NULL, OLD.status);
+
+        IF TG_OP = 'DELETE' THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    INSERT INTO church.attendance_change_seq AS s (service_id, last_seq)
+    VALUES (NEW.service_id, 1)
+    ON CONFLICT (service_id) DO UPDATE SET last_seq = s.last_seq + 1
+    RETURNING last_seq INTO next_seq;
+
+    INSERT INTO church.attendance_changes (service_id, seq, person_id, status, previous_status)
+    VALUES (
+        NEW.service_id, next_seq, NEW.person_id, NEW.status,
+        CASE WHEN TG_OP = 'UPDATE' AND NEW.service_id = OLD.service_id AND NEW.person_id = OLD.person_id
+             THEN OLD.status END
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS attendance_record_change ON church.attendance;
+CREATE TRIGGER attendance_record_change
+    AFTER INSERT OR UPDATE OR DELETE ON church.attendance
+    FOR EACH ROW EXECUTE FUNCTION church.attendance_record_change();
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- Background jobs
+--
+-- Imports and large exports run in a local process pool instead of the
+-- web request. Each job's state and progress live here so any web worker
+-- can report on it; result files are kept under JOB_DIR. The web worker
+-- that owns a job refreshes heartbeat_at; a queued or running job whose
+-- heartbeat stops is marked failed.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS church.jobs (
+    job_id varchar(36) PRIMARY KEY,
+    kind varchar(50) NOT NULL,
+    status varchar(20) NOT NULL DEFAULT 'queued',
+    params text,
+    progress integer NOT NULL DEFAULT 0,
+    message text,
+    summary text,
+    result_name varchar(255),
+    result_mimetype varchar(100),
+    error text,
+    created_at timestamp DEFAULT now(),
+    started_at timestamp,
+    finished_at timestamp,
+    heartbeat_at timestamp
+);
+
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON church.jobs (status, created_at);
+
+COMMIT;
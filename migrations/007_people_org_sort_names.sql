@@ -0,0 +1,117 @@
+-- Denormalised org names on church.people for the saints listing order
+--
+-- The saints list is ordered by region, direction, department, team and
+-- cell name, then by the person's name. Those names come from five joined
+-- tables, so no index could serve the order and every page sorted the
+-- whole filtered set. The names are copied onto the person as one text[]
+-- (arrays compare element by element), kept current by triggers, and one
+-- index covers the full keyset order.
+
+BEGIN;
+
+-- Org names above every cell, in listing order
+CREATE OR REPLACE VIEW church.cell_sort_names AS
+SELECT c.cell_id,
+       ARRAY[coalesce(r.region_name, ''), coalesce(dr.direction_name, ''),
+             coalesce(d.department_name, ''), coalesce(t.team_name, ''),
+             coalesce(c.cell_name, '')]::text[] AS org_sort_names
+  FROM church.cells c
+  JOIN church.teams t ON t.team_id = c.team_id
+  JOIN church.departments d ON d.department_id = t.department_id
+  JOIN church.directions dr ON dr.direction_id = d.direction_id
+  JOIN church.regions r ON r.region_id = dr.region_id;
+
+ALTER TABLE church.people
+    ADD COLUMN IF NOT EXISTS org_sort_names text[] NOT NULL DEFAULT '{}';
+
+UPDATE church.people p
+   SET org_sort_names = n.org_sort_names
+  FROM church.cell_sort_names n
+ WHERE n.cell_id = p.cell_id;
+
+-- Same expressions as app.services.pagination builds for the saints order
+CREATE INDEX IF NOT EXISTS people_org_sort_idx
+    ON church.people (org_sort_names, (coalesce(last_name, '')), (coalesce(first_name, '')), person_id);
+
+-- Fill the names whenever a person is created or changes cell
+CREATE OR REPLACE FUNCTION church.people_set_sort_names() RETURNS trigger AS $$
+BEGIN
+    SELECT n.org_sort_names
+      INTO NEW.org_sort_names
+      FROM church.cell_sort_names n
+     WHERE n.cell_id = NEW.cell_id;
+    NEW.org_sort_names := coalesce(NEW.org_sort_names, '{}');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS people_set_sort_names ON church.people;
+CREATE TRIGGER people_set_sort_names
+    BEFORE INSERT OR UPDATE OF cell_id ON church.people
+    FOR EACH ROW EXECUTE FUNCTION church.people_set_sort_names();
+
+-- Re-resolve the names of the people below an org node that was renamed
+-- or moved to a new parent
+CREATE OR REPLACE FUNCTION church.org_refresh_people_sort_names() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'cells' THEN
+        UPDATE church.people p
+           SET org_sort_names = n.org_sort_names
+          FROM church.cell_sort_names n
+         WHERE n.cell_id = p.cell_id AND p.cell_id = NEW.cell_id;
+    ELSIF TG_TABLE_NAME = 'teams' THEN
+        UPDATE church.people p
+           SET org_sort_names = n.org_sort_names
+          FROM church.cell_sort_names n
+         WHERE n.cell_id = p.cell_id AND p.team_id = NEW.team_id;
+    ELSIF TG_TABLE_NAME = 'departments' THEN
+        UPDATE church.people p
+           SET org_sort_names = n.org_sort_names
+          FROM church.cell_sort_names n
+         WHERE n.cell_id = p.cell_id AND p.department_id = NEW.department_id;
+    ELSIF TG_TABLE_NAME = 'directions' THEN
+        UPDATE church.people p
+           SET org_sort_names = n.org_sort_names
+          FROM church.cell_sort_names n
+         WHERE n.cell_id = p.cell_id AND p.direction_id = NEW.direction_id;
+    ELSIF TG_TABLE_NAME = 'regions' THEN
+        UPDATE church.people p
+           SET org_sort_names = n.org_sort_names
+          FROM church.cell_sort_names n
+         WHERE n.cell_id = p.cell_id AND p.region_id = NEW.region_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cells_refresh_people_sort_names ON church.cells;
+CREATE TRIGGER cells_refresh_people_sort_names
+    AFTER UPDATE OF cell_name, team_id ON church.cells
+    FOR EACH ROW WHEN (OLD.cell_name IS DISTINCT FROM NEW.cell_name OR OLD.team_id IS DISTINCT FROM NEW.team_id)
+    EXECUTE FUNCTION church.org_refresh_people_sort_names();
+
+DROP TRIGGER IF EXISTS teams_refresh_people_sort_names ON church.teams;
+CREATE TRIGGER teams_refresh_people_sort_names
+    AFTER UPDATE OF team_name, department_id ON church.teams
+    FOR EACH ROW WHEN (OLD.team_name IS DISTINCT FROM NEW.team_name OR OLD.department_id IS DISTINCT FROM NEW.department_id)
+    EXECUTE FUNCTION church.org_refresh_people_sort_names();
+
+DROP TRIGGER IF EXISTS departments_refresh_people_sort_names ON church.departments;
+CREATE TRIGGER departments_refresh_people_sort_names
+    AFTER UPDATE OF department_name, direction_id ON church.departments
+    FOR EACH ROW WHEN (OLD.department_name IS DISTINCT FROM NEW.department_name OR OLD.direction_id IS DISTINCT FROM NEW.direction_id)
+    EXECUTE FUNCTION church.org_refresh_people_sort_names();
+
+DROP TRIGGER IF EXISTS directions_refresh_people_sort_names ON church.directions;
+CREATE TRIGGER directions_refresh_people_sort_names
+    AFTER UPDATE OF direction_name, region_id ON church.directions
+    FOR EACH ROW WHEN (OLD.direction_name IS DISTINCT FROM NEW.direction_name OR OLD.region_id IS DISTINCT FROM NEW.region_id)
+    EXECUTE FUNCTION church.org_refresh_people_sort_names();
+
+DROP TRIGGER IF EXISTS regions_refresh_people_sort_names ON church.regions;
+CREATE TRIGGER regions_refresh_people_sort_names
+    AFTER UPDATE OF region_name ON church.regions
+    FOR EACH ROW WHEN (OLD.region_name IS DISTINCT FROM NEW.region_name)
+    EXECUTE FUNCTION church.org_refresh_people_sort_names();
+
+COMMIT;
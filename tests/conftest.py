@@ -0,0 +1,125 @@
+"""
+Shared test fixtures
+
+Tests that use ``db_session`` need a disposable Postgres database named by
+TEST_DATABASE_URL, with the pg_trgm and unaccent extensions available. Its
+church schema is dropped and rebuilt by running migrations/ over the
+tables that predate them, and every test runs in a transaction that is
+rolled back. Without the variable those tests are skipped.
+"""
+import glob
+import os
+from datetime import date, time
+
+import pytest
+from sqlalchemy import text
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app.config import Config
+    if TEST_DATABASE_URL:
+        Config.SQLALCHEMY_DATABASE_URI = TEST_DATABASE_URL
+    Config.SQLALCHEMY_ECHO = False
+
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True)
+    return app
+
+@pytest.fixture(scope='session')
+def _schema(app):
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    from app import db
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP SCHEMA IF EXISTS church CASCADE'))
+            connection.execute(text('CREATE SCHEMA church'))
+        # Tables that predate migrations/ come from the models, without what
+        # the migrations add, then every migration runs in order
+        created = {'attendance_sync_ops', 'attendance_changes', 'jobs'}
+        db.metadata.create_all(db.engine, tables=[
+            table for table in db.metadata.sorted_tables if table.name not in created
+        ])
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE church.attendance DROP CONSTRAINT attendance_service_person_key'))
+
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+                with open(path) as handle:
+                    cursor.execute(handle.read())
+            connection.commit()
+        finally:
+            connection.close()
+
+@pytest.fixture
+def db_session(app, _schema):
+    from app import db
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        db.session.remove()
+
+@pytest.fixture
+def org(db_session):
+    """One region with two directions, each with a department, team and cell"""
+    from app.models.organization import Region, Direction, Department, Team, Cell
+
+    region = Region(region_name='North')
+    db_session.add(region)
+    db_session.flush()
+
+    nodes = {'region': region}
+    for key, name in (('a', 'Youth'), ('b', 'Music')):
+        direction = Direction(direction_name=name, region_id=region.region_id)
+        db_session.add(direction)
+        db_session.flush()
+        department = Department(department_name=f'{name} Dept', direction_id=direction.direction_id)
+        db_session.add(department)
+        db_session.flush()
+        team = Team(team_name=f'{name} Team', department_id=department.department_id)
+        db_session.add(team)
+        db_session.flush()
+        cell = Cell(cell_name=f'{name} Cell', team_id=team.team_id)
+        db_session.add(cell)
+        db_session.flush()
+        nodes.update({
+            f'direction_{key}': direction, f'department_{key}': department,
+            f'team_{key}': team, f'cell_{key}': cell
+        })
+    return nodes
+
+@pytest.fixture
+def make_person(db_session, org):
+    from app.models.people import Person
+
+    def make(first_name, last_name, cell=None, **values):
+        cell = cell or org['cell_a']
+        person = Person(
+            first_name=first_name, last_name=last_name, cell_id=cell.cell_id,
+            direction=cell.team.department.direction.direction_name, **values
+        )
+        db_session.add(person)
+        db_session.flush()
+        return person
+    return make
+
+@pytest.fixture
+def service(db_session):
+    from app.models.services import Service, ServiceType
+
+    service_type = ServiceType(service_name='Sunday Service')
+    db_session.add(service_type)
+    db_session.flush()
+    service = Service(service_type_id=service_type.service_type_id, service_date=date(2026, 1, 4), service_time=time(10))
+    db_session.add(service)
+    db_session.flush()
+    return service
@@ -0,0 +1,34 @@
+from app.services.attendance_changes import changes_since, latest_seq
+from app.services.attendance_writer import apply_attendance
+
+
+def test_every_mark_is_appended_to_the_service_feed(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    bob = make_person('Bob', 'Baker')
+    assert latest_seq(service.service_id) == 0
+
+    apply_attendance(service.service_id, {ann.person_id: 'present', bob.person_id: 'absent'})
+    db_session.flush()
+    seen = latest_seq(service.service_id)
+    apply_attendance(service.service_id, {ann.person_id: 'absent', bob.person_id: 'not-marked'})
+    db_session.flush()
+
+    changes, more = changes_since(service.service_id, seen)
+    assert not more
+    assert sorted(change[1:] for change in changes) == sorted([
+        (ann.person_id, 'absent', 'present'),
+        (bob.person_id, None, 'absent'),
+    ])
+    assert [change[0] for change in changes] == [seen + 1, seen + 2]
+    assert latest_seq(service.service_id) == seen + 2
+
+def test_feed_is_read_in_pages(db_session, service, make_person):
+    people = [make_person(f'Person {i}', 'Able') for i in range(3)]
+    apply_attendance(service.service_id, {person.person_id: 'present' for person in people})
+    db_session.flush()
+
+    first, more = changes_since(service.service_id, 0, limit=2)
+    assert more
+    rest, more = changes_since(service.service_id, first[-1][0], limit=2)
+    assert not more
+    assert len(first + rest) == 3
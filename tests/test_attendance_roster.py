@@ -0,0 +1,43 @@
+from werkzeug.datastructures import MultiDict
+
+from app.services.attendance_roster import load_roster, load_roster_cells, roster_filters
+from app.services.attendance_writer import apply_attendance
+
+
+def test_roster_filters_from_request_args():
+    filters = roster_filters(MultiDict({'team_id': '7', 'cell_id': 'x', 'is_active': 'false', 'name_search': 'ann'}))
+
+    assert filters['team_id'] == 7
+    assert filters['cell_id'] is None
+    assert filters['is_active'] is False
+    assert filters['name_search'] == 'ann'
+    assert roster_filters(MultiDict())['is_active'] is None
+
+
+def test_small_rosters_are_loaded_inline(db_session, service, org, make_person):
+    ann = make_person('Ann', 'Able')
+    make_person('Bob', 'Baker', cell=org['cell_b'])
+    make_person('Cy', 'Cole', cell=org['cell_b'])
+    apply_attendance(service.service_id, {ann.person_id: 'present'})
+
+    cells, total = load_roster(service.service_id, {}, inline_limit=10)
+
+    assert total == 3
+    # Music sorts before Youth
+    assert [cell.cell_id for cell in cells] == [org['cell_b'].cell_id, org['cell_a'].cell_id]
+    assert [entry.name for entry in cells[0].people] == ['Bob Baker', 'Cy Cole']
+    assert cells[1].people[0].status == 'present'
+    assert cells[1].people[0].marked
+
+def test_large_rosters_load_cells_on_demand(db_session, service, org, make_person):
+    make_person('Ann', 'Able')
+    make_person('Bob', 'Baker', cell=org['cell_b'])
+
+    cells, total = load_roster(service.service_id, {}, inline_limit=1)
+
+    assert total == 2
+    assert [(cell.count, cell.people) for cell in cells] == [(1, None), (1, None)]
+
+    loaded = load_roster_cells(service.service_id, {'cell_id': org['cell_b'].cell_id})
+    assert [[entry.name for entry in cell.people] for cell in loaded] == [['Bob Baker']]
+    assert loaded[0].people[0].status == 'not-marked'
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.services import Attendance, AttendanceSyncOp
+from app.services.attendance_sync import _parse_op, parse_client_ts, sync_attendance
+from app.services.attendance_writer import apply_attendance
+
+
+def _op(op_id, service_id, person_id, status='present', client_ts='2026-01-04T10:00:00Z'):
+    return {'op_id': op_id, 'service_id': service_id, 'person_id': person_id, 'status': status, 'client_ts': client_ts}
+
+def test_parse_client_ts():
+    expected = datetime(2026, 1, 4, 10, 0)
+    assert parse_client_ts('2026-01-04T10:00:00Z') == expected
+    assert parse_client_ts('2026-01-04T12:00:00+02:00') == expected
+    assert parse_client_ts(1767520800000) == expected
+    with pytest.raises(ValueError):
+        parse_client_ts(True)
+
+def test_parse_op_normalizes_status():
+    op = _parse_op(_op('a', '3', 7, status='watched-recording'))
+    assert op['status'] == 'watched_recording'
+    assert (op['service_id'], op['person_id']) == (3, 7)
+
+@pytest.mark.parametrize('raw, reason', [
+    ('nope', 'malformed'),
+    (_op('', 1, 1), 'invalid op_id'),
+    (_op('x' * 65, 1, 1), 'invalid op_id'),
+    (_op('a', 1, 1, status='late'), 'invalid status'),
+    (_op('a', 'one', 1), 'invalid service_id or person_id'),
+    (_op('a', 1, 1, client_ts='yesterday'), 'invalid client_ts'),
+])
+def test_parse_op_rejects(raw, reason):
+    with pytest.raises(ValueError, match=reason):
+        _parse_op(raw)
+
+def test_ops_without_usable_ids_are_rejected_individually(app):
+    with app.app_context():
+        ack, rejected = sync_attendance(['nope', _op(None, 1, 1), _op('a', 1, 1, status='late'), _op('a', 1, 1, status='late')])
+    assert ack == {}
+    assert rejected == {
+        'ops[0]': 'malformed',
+        'ops[1]': 'invalid op_id',
+        'a': 'invalid status',
+        'ops[3]': 'invalid status',
+    }
+
+
+def test_replayed_ops_are_acknowledged_once(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    ops = [_op('op-1', service.service_id, ann.person_id)]
+
+    assert sync_attendance(ops) == ({'op-1': 'applied'}, {})
+    assert sync_attendance(ops) == ({'op-1': 'duplicate'}, {})
+    assert db_session.query(AttendanceSyncOp).count() == 1
+
+def test_latest_op_in_a_batch_wins(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    ack, rejected = sync_attendance([
+        _op('late', service.service_id, ann.person_id, 'absent', '2026-01-04T10:05:00Z'),
+        _op('early', service.service_id, ann.person_id, 'present', '2026-01-04T10:00:00Z'),
+    ])
+
+    assert ack == {'late': 'applied', 'early': 'superseded'}
+    assert rejected == {}
+    mark = db_session.query(Attendance).filter_by(service_id=service.service_id, person_id=ann.person_id).one()
+    assert mark.status == 'absent'
+
+def test_ops_older_than_an_earlier_batch_are_stale(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    sync_attendance([_op('new', service.service_id, ann.person_id, 'absent', '2026-01-04T10:05:00Z')])
+
+    ack, _ = sync_attendance([_op('old', service.service_id, ann.person_id, 'present', '2026-01-04T10:00:00Z')])
+
+    assert ack == {'old': 'stale'}
+    assert db_session.query(Attendance.status).filter_by(service_id=service.service_id, person_id=ann.person_id).scalar() == 'absent'
+
+def test_ops_older_than_a_form_mark_are_stale(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    apply_attendance(service.service_id, {ann.person_id: 'absent'}, now=datetime.now())
+    client_ts = (datetime.utcnow() - timedelta(hours=1)).isoformat() + 'Z'
+
+    ack, _ = sync_attendance([_op('offline', service.service_id, ann.person_id, 'present', client_ts)])
+
+    assert ack == {'offline': 'stale'}
+
+def test_ops_newer_than_a_form_mark_are_applied(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    apply_attendance(service.service_id, {ann.person_id: 'absent'}, now=datetime.now() - timedelta(hours=1))
+    client_ts = datetime.utcnow().isoformat() + 'Z'
+
+    ack, _ = sync_attendance([_op('offline', service.service_id, ann.person_id, 'not-marked', client_ts)])
+
+    assert ack == {'offline': 'applied'}
+    assert db_session.query(Attendance).filter_by(service_id=service.service_id).count() == 0
+
+def test_unknown_service_and_person_are_rejected(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    ack, rejected = sync_attendance([
+        _op('ok', service.service_id, ann.person_id),
+        _op('no-service', 999999, ann.person_id),
+        _op('no-person', service.service_id, 999999),
+    ])
+
+    assert ack == {'ok': 'applied'}
+    assert rejected == {'no-service': 'unknown service', 'no-person': 'unknown person'}
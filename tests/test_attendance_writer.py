@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from app.models.services import Attendance
+from app.services.attendance_writer import apply_attendance, service_tag
+from app.services.cache_service import pending_tables
+
+
+def _marks(db_session, service):
+    rows = db_session.query(Attendance.person_id, Attendance.status).filter(
+        Attendance.service_id == service.service_id
+    )
+    return dict(rows)
+
+def test_inserts_new_marks(db_session, service, make_person):
+    ann, bob = make_person('Ann', 'Able'), make_person('Bob', 'Baker')
+    now = datetime(2026, 1, 4, 10, 5)
+
+    updated, previous = apply_attendance(service.service_id, {ann.person_id: 'present', bob.person_id: 'absent'}, now=now)
+
+    assert {record['person_id'] for record in updated} == {ann.person_id, bob.person_id}
+    assert previous == {ann.person_id: None, bob.person_id: None}
+    assert _marks(db_session, service) == {ann.person_id: 'present', bob.person_id: 'absent'}
+
+    present = db_session.query(Attendance).filter_by(service_id=service.service_id, person_id=ann.person_id).one()
+    absent = db_session.query(Attendance).filter_by(service_id=service.service_id, person_id=bob.person_id).one()
+    assert present.check_in_time == now
+    assert absent.check_in_time is None
+
+def test_upserts_existing_marks(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    apply_attendance(service.service_id, {ann.person_id: 'present'})
+
+    updated, previous = apply_attendance(service.service_id, {ann.person_id: 'watched_recording'})
+
+    assert previous == {ann.person_id: 'present'}
+    assert updated == [{'person_id': ann.person_id, 'status': 'watched_recording'}]
+    assert _marks(db_session, service) == {ann.person_id: 'watched_recording'}
+    assert db_session.query(Attendance).filter_by(service_id=service.service_id).count() == 1
+
+def test_not_marked_deletes_the_mark(db_session, service, make_person):
+    ann, bob = make_person('Ann', 'Able'), make_person('Bob', 'Baker')
+    apply_attendance(service.service_id, {ann.person_id: 'present', bob.person_id: 'present'})
+
+    updated, previous = apply_attendance(service.service_id, {ann.person_id: 'not-marked'})
+
+    assert updated == [{'person_id': ann.person_id, 'status': 'not-marked'}]
+    assert previous == {ann.person_id: 'present'}
+    assert _marks(db_session, service) == {bob.person_id: 'present'}
+
+def test_skips_unknown_people_and_statuses(db_session, service, make_person):
+    ann, bob = make_person('Ann', 'Able'), make_person('Bob', 'Baker')
+
+    updated, previous = apply_attendance(
+        service.service_id, {ann.person_id: 'present', bob.person_id: 'late', 999999: 'present'}
+    )
+
+    assert updated == [{'person_id': ann.person_id, 'status': 'present'}]
+    assert 999999 not in previous
+    assert _marks(db_session, service) == {ann.person_id: 'present'}
+
+def test_marked_at_overrides_the_mark_time(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    marked_at = datetime(2026, 1, 4, 9, 58)
+
+    apply_attendance(service.service_id, {ann.person_id: 'present'}, now=datetime(2026, 1, 4, 11), marked_at={ann.person_id: marked_at})
+
+    mark = db_session.query(Attendance).filter_by(service_id=service.service_id, person_id=ann.person_id).one()
+    assert mark.check_in_time == marked_at
+    assert mark.updated_at == marked_at
+
+def test_records_the_service_tag(db_session, service, make_person):
+    ann = make_person('Ann', 'Able')
+    apply_attendance(service.service_id, {ann.person_id: 'present'})
+    assert service_tag(service.service_id) in pending_tables(db_session)
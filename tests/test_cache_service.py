@@ -0,0 +1,157 @@
+import pickle
+
+from sqlalchemy.orm import Session
+
+from app import cache
+from app.services.cache_service import (
+    LRUCache, cache_view, invalidate_cache, make_cache_key, pending_tables, record_dirty_tags,
+    register_invalidation_hooks, tag_versions, tiered_cache
+)
+
+
+def _counting_view(tags=(), **options):
+    """A cached view that records how often it actually renders"""
+    calls = []
+
+    @cache_view(tags=tags, **options)
+    def view():
+        calls.append(1)
+        return f'render {len(calls)}'
+    return view, calls
+
+
+def test_invalidating_a_tag_changes_only_its_version(app):
+    with app.app_context():
+        people, cells = tag_versions(('people', 'cells'))
+        assert tag_versions(('people', 'cells')) == (people, cells)
+
+        invalidate_cache('people')
+
+        new_people, new_cells = tag_versions(('people', 'cells'))
+        assert new_people != people
+        assert new_cells == cells
+
+def test_cache_keys_follow_tag_versions(app):
+    with app.test_request_context('/saints/?b=2&a=1'):
+        key = make_cache_key(('people',))
+        assert make_cache_key(('people',)) == key
+        invalidate_cache('people')
+        assert make_cache_key(('people',)) != key
+
+    # Parameter order does not matter
+    with app.test_request_context('/saints/?a=1&b=2'):
+        assert make_cache_key(('people',)).rsplit(':', 1)[0] == key.rsplit(':', 1)[0]
+
+def test_cached_responses_revalidate_with_etag(app):
+    view, calls = _counting_view(tags=('services',))
+    with app.test_request_context('/etag-test'):
+        first = view()
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'public, no-cache'
+    etag = first.headers['ETag']
+
+    with app.test_request_context('/etag-test', headers={'If-None-Match': etag}):
+        revalidated = view()
+    assert revalidated.status_code == 304
+    assert len(calls) == 1
+
+    with app.app_context():
+        invalidate_cache('services')
+    with app.test_request_context('/etag-test', headers={'If-None-Match': etag}):
+        changed = view()
+    assert changed.status_code == 200
+    assert changed.get_data() == b'render 2'
+
+def _age_entry(key, seconds):
+    entry = tiered_cache.get(key)
+    entry['stored_at'] -= seconds
+    tiered_cache.set(key, entry, timeout=3600)
+
+def test_expired_entries_are_served_stale_while_another_request_rebuilds(app):
+    view, calls = _counting_view(timeout=60)
+    with app.test_request_context('/swr-test'):
+        view()
+        key = make_cache_key()
+        _age_entry(key, 120)
+
+        # Another request holds the rebuild lock
+        cache.add(f'{key}:lock', 1, timeout=10)
+        assert view().get_data() == b'render 1'
+        assert len(calls) == 1
+
+        # Once the lock is released the next request rebuilds
+        cache.delete(f'{key}:lock')
+        assert view().get_data() == b'render 2'
+        assert view().get_data() == b'render 2'
+    assert len(calls) == 2
+
+def test_missing_entry_renders_after_waiting_for_a_stuck_lock_holder(app):
+    view, calls = _counting_view(timeout=60, lock_timeout=1)
+    with app.test_request_context('/single-flight-test'):
+        cache.add(f'{make_cache_key()}:lock', 1, timeout=10)
+        assert view().get_data() == b'render 1'
+    assert len(calls) == 1
+
+def _hooked_session():
+    session = Session()
+    register_invalidation_hooks(session)
+    session.begin()
+    return session
+
+def test_commit_bumps_written_tables_and_their_trigger_targets(app):
+    with app.app_context():
+        before = tag_versions(('teams', 'people', 'services'))
+        session = _hooked_session()
+        record_dirty_tags(session, 'teams')
+        assert pending_tables(session) == {'teams'}
+
+        session.commit()
+
+        after = tag_versions(('teams', 'people', 'services'))
+        assert after[0] != before[0]
+        assert after[1] != before[1]  # Moving a team rewrites its people
+        assert after[2] == before[2]
+        assert pending_tables(session) == frozenset()
+
+def test_rollback_forgets_written_tables(app):
+    with app.app_context():
+        before = tag_versions(('people',))
+        session = _hooked_session()
+        record_dirty_tags(session, 'people')
+        session.rollback()
+        session.commit()
+        assert tag_versions(('people',)) == before
+
+def test_cache_outage_does_not_fail_the_commit(app, monkeypatch, caplog):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('cache down')
+
+    with app.app_context():
+        session = _hooked_session()
+        record_dirty_tags(session, 'people')
+        monkeypatch.setattr(tiered_cache, 'set_many', unavailable)
+        session.commit()
+    assert 'Could not invalidate cache tags' in caplog.text
+
+def test_lru_evicts_least_recently_used_within_its_budgets():
+    evicted = []
+    lru = LRUCache(max_entries=2, max_bytes=1000, on_evict=evicted.append)
+    lru.set('a', pickle.dumps('a'), 60, owner='view.a')
+    lru.set('b', pickle.dumps('b'), 60, owner='view.b')
+    assert lru.get('a') is not None
+
+    lru.set('c', pickle.dumps('c'), 60, owner='view.c')
+
+    assert lru.get('b') is None
+    assert evicted == ['view.b']
+    assert lru.stats()['entries'] == 2
+
+    # A payload over the byte budget is never stored
+    lru.set('big', b'x' * 1001, 60)
+    assert lru.get('big') is None
+
+def test_lru_entries_expire():
+    lru = LRUCache()
+    lru.set('a', pickle.dumps('a'), -1)
+    assert lru.get('a') is None
+    assert lru.stats()['entries'] == 0
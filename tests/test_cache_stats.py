@@ -0,0 +1,31 @@
+from app.services.cache_stats import CacheStats, aggregate_stats, render_prometheus
+
+
+def test_published_counters_are_aggregated_with_hit_rates(app):
+    stats = CacheStats()
+    stats.record_hit('saints.saints_list')
+    stats.record_hit('saints.saints_list', stale=True)
+    stats.record_miss('saints.saints_list')
+    stats.record_fill('saints.saints_list', 0.5, 2000)
+
+    with app.app_context():
+        stats.publish(force=True)
+        totals = aggregate_stats()
+
+    assert stats.worker_id in totals['workers']
+    view = totals['views']['saints.saints_list']
+    assert (view['hits'], view['stale_hits'], view['misses']) == (1, 1, 1)
+    assert view['hit_rate'] == round(2 / 3, 4)
+    assert view['avg_entry_bytes'] == 2000
+    assert 'churchops_cache_hits_total{view="saints.saints_list"} 1' in render_prometheus(totals)
+
+def test_stats_endpoint_needs_the_internal_token(app, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setitem(app.config, 'INTERNAL_API_TOKEN', None)
+    assert client.get('/api/internal/cache-stats').status_code == 403
+
+    monkeypatch.setitem(app.config, 'INTERNAL_API_TOKEN', 'secret')
+    assert client.get('/api/internal/cache-stats', headers={'X-Internal-Token': 'wrong'}).status_code == 403
+    response = client.get('/api/internal/cache-stats', headers={'X-Internal-Token': 'secret'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-store'
@@ -0,0 +1,55 @@
+import csv
+import io
+
+import pandas as pd
+
+from app.services.import_preview import CHANGE_FILE_HEADERS, preview_file
+from app.services.import_service import REQUIRED_COLUMNS
+
+HEADER = REQUIRED_COLUMNS + ['Email']
+
+
+def _row(first_name, last_name, direction='Youth', cell=None, email=''):
+    return [
+        first_name, last_name, 'North', direction, f'{direction} Dept', f'{direction} Team',
+        cell or f'{direction} Cell', email
+    ]
+
+def test_rows_are_classified_against_the_database(db_session, org, make_person, tmp_path):
+    make_person('Ann', 'Able', email='ann@example.org')
+    make_person('Bob', 'Baker', cell=org['cell_b'])
+    make_person('Cy', 'Cole', email='cy@example.org')
+
+    path = tmp_path / 'people.csv'
+    pd.DataFrame([
+        _row('Ann', 'Able', email='ann@example.org'),  # unchanged
+        _row('Bob', 'Baker'),                          # moves from Music to Youth
+        _row('Cy', 'Cole', email='old@example.org'),   # overwritten by the next row
+        _row('Cy', 'Cole', email='new@example.org'),   # email update
+        _row('Dee', 'Dunn'),                           # new person
+        _row('Eve', 'Early', cell='New Cell'),         # new person in a new cell
+        _row('Fay', ''),                               # invalid
+    ], columns=HEADER).to_csv(path, index=False)
+
+    output = io.StringIO()
+    preview = preview_file(str(path), output)
+
+    summary = preview.summary()
+    assert summary['rows_read'] == 7
+    assert (summary['people_to_create'], summary['people_to_move'], summary['people_to_update'],
+            summary['people_unchanged']) == (2, 1, 1, 1)
+    assert summary['nodes_to_create']['Cell'] == 1
+    assert summary['nodes_to_create']['Region'] == 0
+    assert summary['error_messages'] == ['Error in row 8: Last Name is required']
+
+    rows = list(csv.reader(io.StringIO(output.getvalue())))
+    assert rows[0] == CHANGE_FILE_HEADERS
+    changes = {(row[2], row[3]): row for row in rows[1:] if row[2]}
+    assert set(changes) == {('Bob', 'Baker'), ('Cy', 'Cole'), ('Dee', 'Dunn'), ('Eve', 'Early')}
+    assert changes[('Bob', 'Baker')][1] == 'move'
+    assert changes[('Bob', 'Baker')][5] == 'North / Music / Music Dept / Music Team / Music Cell'
+    assert changes[('Bob', 'Baker')][6] == 'North / Youth / Youth Dept / Youth Team / Youth Cell'
+    assert changes[('Cy', 'Cole')][0] == '5'
+    assert changes[('Cy', 'Cole')][1:2] + changes[('Cy', 'Cole')][7:] == ['update', 'Email']
+    assert changes[('Dee', 'Dunn')][1] == 'create'
+    assert ['', 'new cell', '', '', '', '', 'North / Youth / Youth Dept / Youth Team / New Cell', ''] in rows
@@ -0,0 +1,120 @@
+import io
+
+from openpyxl import Workbook
+import pandas as pd
+
+from app.models.people import Person
+from app.services.import_service import (
+    ImportResult, REQUIRED_COLUMNS, count_rows, import_people, normalize_frame, read_chunks, read_columns,
+    validate_frame
+)
+
+HEADER = REQUIRED_COLUMNS + ['Email']
+
+
+def _row(first_name, last_name, cell='Youth Cell', email=''):
+    return [first_name, last_name, 'North', 'Youth', 'Youth Dept', 'Youth Team', cell, email]
+
+def _write_csv(path, rows):
+    pd.DataFrame(rows, columns=HEADER).to_csv(path, index=False)
+    return str(path)
+
+def test_template_rows_import_cleanly(app):
+    response = app.test_client().get('/assignments/template')
+    frame = normalize_frame(pd.read_csv(io.BytesIO(response.data), dtype=str))
+    result = ImportResult()
+
+    assert len(validate_frame(frame, result)) == 1
+    assert result.error_messages == []
+
+def test_blank_required_values_are_rejected():
+    frame = normalize_frame(pd.DataFrame([
+        _row('Ann', 'Able'),
+        _row('Bob', '  '),
+        _row('', 'Baker', cell=''),
+    ], columns=HEADER))
+    result = ImportResult()
+
+    valid = validate_frame(frame, result)
+
+    assert valid['First Name'].tolist() == ['Ann']
+    assert result.error_count == 2
+    assert result.error_messages == [
+        'Error in row 4: First Name is required',
+        'Error in row 3: Last Name is required',
+    ]
+
+def test_overlong_values_are_rejected():
+    frame = normalize_frame(pd.DataFrame([_row('A' * 51, 'Able')], columns=HEADER))
+    result = ImportResult()
+
+    assert validate_frame(frame, result).empty
+    assert result.error_messages == ['Error in row 2: First Name is longer than 50 characters']
+
+def test_chunks_keep_spreadsheet_row_numbers(tmp_path):
+    path = _write_csv(tmp_path / 'people.csv', [_row(f'Person {i}', 'Able') for i in range(5)])
+
+    chunks = list(read_chunks(path, chunk_rows=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert normalize_frame(chunks[-1])['row_no'].tolist() == [6]
+    assert (chunks[0]['Email'] == '').all()
+
+def test_xlsx_chunks_are_streamed_as_text(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER + ['Phone'])
+    sheet.append(_row('Ann', 'Able') + [9876543210.0])
+    sheet.append([None] * (len(HEADER) + 1))
+    sheet.append(_row('Bob', 'Baker', email='bob@example.org'))
+    sheet.append(['Cy', 'Cole', 'North'])
+    path = str(tmp_path / 'people.xlsx')
+    workbook.save(path)
+
+    chunks = list(read_chunks(path, chunk_rows=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[0]['Phone'].tolist() == ['9876543210', '']
+    assert chunks[0]['Email'].tolist() == ['', 'bob@example.org']
+    assert chunks[1].iloc[0].tolist() == ['Cy', 'Cole', 'North'] + [''] * (len(HEADER) - 2)
+    # The blank row 3 is skipped without renumbering the rows after it
+    assert normalize_frame(chunks[1])['row_no'].tolist() == [5]
+    assert count_rows(path) == 4
+
+def test_csv_header_and_row_count_ignore_a_byte_order_mark(tmp_path):
+    path = tmp_path / 'people.csv'
+    path.write_text(','.join(HEADER) + '\n' + ','.join(_row('Ann', 'Able')) + '\n', encoding='utf-8-sig')
+
+    assert read_columns(str(path)) == HEADER
+    assert count_rows(str(path)) == 1
+
+
+def test_import_skips_blank_rows_and_loads_the_rest(db_session, org):
+    df = pd.DataFrame([
+        _row('Ann', 'Able', email='ann@example.org'),
+        _row('Bob', ''),
+        _row('Cy', 'Cole', cell='New Cell'),
+    ], columns=HEADER)
+
+    result = import_people(df)
+
+    assert result.error_messages == ['Error in row 3: Last Name is required']
+    assert (result.success_count, result.inserted, result.updated) == (2, 2, 0)
+    people = {person.first_name: person for person in db_session.query(Person)}
+    assert set(people) == {'Ann', 'Cy'}
+    assert people['Ann'].cell_id == org['cell_a'].cell_id
+    assert people['Ann'].email == 'ann@example.org'
+    assert people['Cy'].cell.cell_name == 'New Cell'
+    assert people['Cy'].team_id == org['team_a'].team_id
+
+def test_import_updates_people_and_keeps_blank_optional_values(db_session, org, make_person):
+    ann = make_person('Ann', 'Able', cell=org['cell_b'], email='ann@example.org')
+
+    result = import_people(pd.DataFrame([_row('Ann', 'Able'), _row('Ann', 'Able')], columns=HEADER))
+
+    assert (result.inserted, result.updated) == (0, 1)
+    db_session.expire_all()
+    ann = db_session.get(Person, ann.person_id)
+    assert ann.cell_id == org['cell_a'].cell_id
+    assert ann.direction == 'Youth'
+    assert ann.email == 'ann@example.org'
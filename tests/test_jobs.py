@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+from app.models.jobs import Job
+from app.services import jobs
+from app.services.job_handlers import chunk_percent
+from app.services.jobs import JOB_HANDLERS, job_runner
+
+
+def test_chunk_progress_stays_between_10_and_95_percent():
+    assert chunk_percent(0, None) == 10
+    assert chunk_percent(50, 100) == 52
+    assert chunk_percent(150, 100) == 95
+
+def test_unknown_job_kinds_are_refused(app):
+    with app.app_context():
+        with pytest.raises(ValueError, match='Unknown job kind'):
+            job_runner.submit('no_such_job', {})
+
+
+def _echo_job(job):
+    job.progress(50, 'Halfway')
+    with open(job.result_path, 'w') as handle:
+        handle.write(job.params['text'])
+    return {'summary': {'length': len(job.params['text'])}, 'result': ('echo.txt', 'text/plain')}
+
+def _failing_job(job):
+    raise ValueError('Bad input')
+
+@pytest.fixture
+def runner(app, db_session, monkeypatch, tmp_path):
+    """job_runner running jobs on a thread pool in this process"""
+    monkeypatch.setitem(app.config, 'JOB_DIR', str(tmp_path))
+    monkeypatch.setitem(JOB_HANDLERS, 'echo', _echo_job)
+    monkeypatch.setitem(JOB_HANDLERS, 'fail', _failing_job)
+    monkeypatch.setattr(jobs, '_worker_app', app)
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(job_runner, '_get_executor', lambda: executor)
+    yield job_runner
+    executor.shutdown(wait=True)
+
+def _wait(db_session, job):
+    job_runner._get_executor().submit(lambda: None).result(timeout=30)
+    db_session.expire_all()
+    return db_session.get(Job, job.job_id)
+
+def test_job_runs_to_completion_and_its_result_downloads(app, db_session, runner):
+    job = _wait(db_session, runner.submit('echo', {'text': 'hello'}))
+
+    assert (job.status, job.progress, job.message) == ('succeeded', 100, 'Done')
+    assert job.to_dict()['summary'] == {'length': 5}
+    assert job.to_dict()['has_result']
+
+    client = app.test_client()
+    response = client.get(f'/jobs/{job.job_id}/download')
+    assert response.status_code == 200
+    assert response.data == b'hello'
+
+    # Results removed with expired job directories are gone, not an error
+    os.remove(runner.result_file(job))
+    assert client.get(f'/jobs/{job.job_id}/download').status_code == 410
+
+def test_failed_jobs_record_the_error(app, db_session, runner):
+    job = _wait(db_session, runner.submit('fail', {}))
+
+    assert (job.status, job.error) == ('failed', 'Bad input')
+    assert app.test_client().get(f'/jobs/{job.job_id}/download').status_code == 404
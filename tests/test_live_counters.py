@@ -0,0 +1,44 @@
+from app.services.attendance_writer import apply_attendance
+from app.services.live_counters import ServiceCounters
+
+
+def _nonzero(counts):
+    return {status: count for status, count in counts.items() if count}
+
+def test_feed_deltas_match_a_full_recount(db_session, service, org, make_person):
+    ann = make_person('Ann', 'Able')
+    bob = make_person('Bob', 'Baker', cell=org['cell_b'])
+    cy = make_person('Cy', 'Cole', cell=org['cell_b'])
+    apply_attendance(service.service_id, {ann.person_id: 'present', bob.person_id: 'present'})
+
+    counters = ServiceCounters(service.service_id)
+    counters.recount()
+    assert counters.totals['present'] == 2
+
+    apply_attendance(service.service_id, {
+        ann.person_id: 'absent', bob.person_id: 'not-marked', cy.person_id: 'watched_recording'
+    })
+    assert counters.apply_changes()
+    assert not counters.apply_changes()
+
+    recounted = ServiceCounters(service.service_id)
+    recounted.recount()
+    assert _nonzero(counters.totals) == _nonzero(recounted.totals) == {'absent': 1, 'watched_recording': 1}
+    assert {
+        department_id: _nonzero(counts) for department_id, counts in counters.departments.items()
+    } == {
+        department_id: _nonzero(counts) for department_id, counts in recounted.departments.items()
+    }
+    assert counters.seq == recounted.seq
+
+def test_snapshot_lists_departments_with_marks(db_session, service, org, make_person):
+    ann = make_person('Ann', 'Able')
+    apply_attendance(service.service_id, {ann.person_id: 'present'})
+
+    counters = ServiceCounters(service.service_id)
+    counters.recount()
+    snapshot = counters.snapshot()
+
+    assert snapshot['totals'] == {'present': 1, 'absent': 0, 'watched_recording': 0}
+    assert [(row['name'], row['present']) for row in snapshot['departments']] == [('Youth Dept', 1)]
+    assert [row['name'] for row in snapshot['regions']] == ['North']
@@ -0,0 +1,45 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app.models.people import Person
+from app.services.name_search import full_name_expr, name_filter, search_people
+
+
+def _sql(expression):
+    return str(expression.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+def test_full_name_matches_the_index_expression():
+    assert _sql(full_name_expr()) == (
+        "church.search_normalize(coalesce(church.people.first_name, '') || ' ' || "
+        "coalesce(church.people.last_name, ''))"
+    )
+
+def test_like_wildcards_in_the_search_text_are_escaped():
+    params = name_filter('50%_off').compile(dialect=postgresql.dialect()).params
+    assert '50\\%\\_off' in params.values()
+
+def test_blank_search_matches_everyone():
+    assert _sql(name_filter('   ')) == 'true'
+
+
+def test_search_ignores_case_and_accents(db_session, make_person):
+    zoe = make_person('Zoé', 'Ándres')
+    make_person('Bob', 'Baker')
+
+    assert search_people('zoe andres') == [zoe]
+
+def test_people_without_a_last_name_are_found(db_session, make_person):
+    # Imported people can lack a last name despite the model's NOT NULL
+    db_session.execute(text('ALTER TABLE church.people ALTER COLUMN last_name DROP NOT NULL'))
+    fay = make_person('Fay', 'Unknown')
+    db_session.execute(Person.__table__.update().where(Person.person_id == fay.person_id).values(last_name=None))
+    db_session.expire_all()
+
+    assert search_people('fay') == [fay]
+
+def test_name_prefixes_rank_first(db_session, make_person):
+    inside = make_person('Ann', 'Johansen')
+    last_name = make_person('Bob', 'Johnson')
+    full_name = make_person('John', 'Smith')
+
+    assert search_people('joh') == [full_name, last_name, inside]
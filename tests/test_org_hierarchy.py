@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+from app.services import org_hierarchy
+from app.services.cache_service import ORG_TAGS, tag_versions
+from app.services.org_hierarchy import OrgHierarchy, _query_hierarchy_paths, resolve_hierarchy_paths
+
+REGIONS = [(1, 'North'), (2, 'East')]
+DIRECTIONS = [(10, 'Youth', 1), (11, 'Music', 1), (12, 'Adults', 2), (13, 'Orphan', 99)]
+DEPARTMENTS = [(100, 'Choir', 10), (101, 'Choir', 11), (102, 'Ushers', 12)]
+TEAMS = [(1000, 'Team B', 100), (1001, 'Team A', 100), (1002, 'Team C', 102)]
+CELLS = [(5000, 'Cell 1', 1000), (5001, 'Cell 2', 1002), (5002, 'Lost', 9999)]
+
+
+def _hierarchy(version=None):
+    return OrgHierarchy(version, REGIONS, DIRECTIONS, DEPARTMENTS, TEAMS, CELLS)
+
+def test_nodes_know_their_ancestors():
+    org = _hierarchy()
+
+    assert org.ancestors(5000) == (1, 10, 100, 1000)
+    assert org.cell(5000).team.department.direction.region_name == 'North'
+    assert org.ancestors(404) is None
+    path = org.path(5001)
+    assert {level: node['name'] for level, node in path.items()} == {
+        'cell': 'Cell 2', 'team': 'Team C', 'department': 'Ushers', 'direction': 'Adults', 'region': 'East'
+    }
+
+def test_nodes_under_missing_parents_are_dropped():
+    org = _hierarchy()
+
+    assert org.direction(13) is None
+    assert org.cell(5002) is None
+    assert org.path(5002) is None
+
+def test_listings_are_sorted_and_filtered():
+    org = _hierarchy()
+
+    assert [d.direction_name for d in org.directions()] == ['Adults', 'Music', 'Youth']
+    assert [d.direction_name for d in org.directions(region_id=1)] == ['Music', 'Youth']
+    assert [t.team_name for t in org.children('department', 100)] == ['Team A', 'Team B']
+    assert [c.cell_id for c in org.cells(region_id=2)] == [5001]
+
+def test_departments_sharing_a_name_are_labelled_with_their_direction():
+    org = _hierarchy()
+
+    assert org.department(100).label == 'Choir (Youth)'
+    assert org.department(101).label == 'Choir (Music)'
+    assert org.department(102).label == 'Ushers'
+
+def test_tree_nests_every_level_in_display_order():
+    tree = _hierarchy().to_tree()
+
+    assert [region['name'] for region in tree] == ['East', 'North']
+    north = tree[1]
+    assert [direction['name'] for direction in north['directions']] == ['Music', 'Youth']
+    youth = north['directions'][1]
+    assert [team['name'] for team in youth['departments'][0]['teams']] == ['Team A', 'Team B']
+    assert youth['departments'][0]['teams'][1]['cells'] == [{'id': 5000, 'name': 'Cell 1'}]
+
+def test_organization_endpoint_revalidates_with_etag(app, monkeypatch):
+    with app.app_context():
+        monkeypatch.setattr(org_hierarchy, '_index', _hierarchy(tag_versions(ORG_TAGS)))
+    client = app.test_client()
+
+    response = client.get('/api/organization')
+    assert response.status_code == 200
+    assert response.get_json() == _hierarchy().to_tree()
+
+    response = client.get('/api/organization', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+def test_paths_are_resolved_from_the_index(app, monkeypatch):
+    with app.app_context():
+        monkeypatch.setattr(org_hierarchy, '_index', _hierarchy(tag_versions(ORG_TAGS)))
+        people = [SimpleNamespace(cell_id=5000), SimpleNamespace(cell_id=5000), SimpleNamespace(cell_id=5001)]
+
+        paths = resolve_hierarchy_paths(people)
+
+    assert set(paths) == {5000, 5001}
+    assert paths[5000]['team']['name'] == 'Team B'
+
+def test_query_fallback_matches_the_index_format(db_session, org):
+    cell_id = org['cell_b'].cell_id
+    index = org_hierarchy.load_org_hierarchy()
+
+    assert _query_hierarchy_paths([cell_id]) == {
+        cell_id: {level: dict(node) for level, node in index.path(cell_id).items()}
+    }
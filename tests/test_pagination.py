@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import text
+
+from app.models.people import Person
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(['Smith', 'Ann', 42])
+    assert decode_cursor(token, (str, str, int)) == ['Smith', 'Ann', 42]
+
+def test_missing_cursor_is_first_page():
+    assert decode_cursor(None, (str, int)) is None
+    assert decode_cursor('', (str, int)) is None
+
+@pytest.mark.parametrize('token', [
+    'not a cursor!',
+    encode_cursor(['Smith']),
+    encode_cursor(['Smith', 'Ann', '42']),
+    encode_cursor(['Smith', 'Ann', True]),
+    encode_cursor(['Smith', None, 42]),
+    encode_cursor({'last_name': 'Smith'}),
+])
+def test_tampered_cursor_is_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, (str, str, int))
+
+
+def _walk(query, sort_columns, per_page):
+    """Every page from the first, following next cursors"""
+    pages, after = [], None
+    while True:
+        page = keyset_paginate(query, sort_columns, per_page, after=after)
+        pages.append(page)
+        if not page.has_next:
+            return pages
+        after = page.next_cursor
+
+def test_null_sort_keys_stay_on_later_pages(db_session, make_person):
+    # Imported people can lack a last name despite the model's NOT NULL
+    db_session.execute(text('ALTER TABLE church.people ALTER COLUMN last_name DROP NOT NULL'))
+    people = [make_person(f'Person {i}', 'Zed' if i % 2 else 'Able') for i in range(6)]
+    db_session.execute(
+        Person.__table__.update().where(Person.person_id.in_([p.person_id for p in people[:3]])).values(last_name=None)
+    )
+    db_session.expire_all()
+
+    sort_columns = (Person.last_name, Person.first_name, Person.person_id)
+    pages = _walk(Person.query, sort_columns, per_page=2)
+
+    seen = [person.person_id for page in pages for person in page.items]
+    assert sorted(seen) == sorted(person.person_id for person in people)
+    assert len(seen) == len(set(seen))
+    # NULL sorts as '', ahead of every name
+    assert [person.last_name for person in pages[0].items] == [None, None]
+
+def test_previous_page_with_null_sort_keys(db_session, make_person):
+    db_session.execute(text('ALTER TABLE church.people ALTER COLUMN last_name DROP NOT NULL'))
+    people = [make_person(f'Person {i}', 'Able') for i in range(4)]
+    db_session.execute(
+        Person.__table__.update().where(Person.person_id == people[0].person_id).values(last_name=None)
+    )
+    db_session.expire_all()
+
+    sort_columns = (Person.last_name, Person.first_name, Person.person_id)
+    first, second = _walk(Person.query, sort_columns, per_page=2)
+    back = keyset_paginate(Person.query, sort_columns, 2, before=second.prev_cursor)
+    assert [p.person_id for p in back.items] == [p.person_id for p in first.items]
+    assert not back.has_prev
+
+def test_paginate_rejects_tampered_cursor(db_session, make_person):
+    make_person('Ann', 'Able')
+    token = encode_cursor(['Able', 'Ann', 'drop'])
+    with pytest.raises(InvalidCursor):
+        keyset_paginate(Person.query, (Person.last_name, Person.first_name, Person.person_id), 2, after=token)
+
+def test_array_cursor_values_must_be_strings():
+    token = encode_cursor([['North', 'Youth'], 42])
+    assert decode_cursor(token, (list, int)) == [['North', 'Youth'], 42]
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([['North', 1], 42]), (list, int))
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(['North', 42]), (list, int))
+
+def test_org_sort_names_follow_renames_and_moves(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+    bob = make_person('Bob', 'Baker', cell=org['cell_b'])
+    sort_columns = (Person.org_sort_names, Person.last_name, Person.first_name, Person.person_id)
+
+    def order():
+        db_session.expire_all()
+        return [person.person_id for page in _walk(Person.query, sort_columns, per_page=1) for person in page.items]
+
+    # Music sorts before Youth
+    assert order() == [bob.person_id, ann.person_id]
+
+    org['direction_b'].direction_name = 'Worship'
+    db_session.flush()
+    assert order() == [ann.person_id, bob.person_id]
+
+    ann.cell_id = org['cell_b'].cell_id
+    db_session.flush()
+    db_session.expire_all()
+    assert ann.org_sort_names == ['North', 'Worship', 'Music Dept', 'Music Team', 'Music Cell']
@@ -0,0 +1,39 @@
+from app.models.organization import Region
+
+
+def _ancestors(db_session, person):
+    db_session.expire(person)
+    return person.team_id, person.department_id, person.direction_id, person.region_id
+
+def test_new_people_get_their_cell_ancestors(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+
+    assert _ancestors(db_session, ann) == (
+        org['team_a'].team_id, org['department_a'].department_id,
+        org['direction_a'].direction_id, org['region'].region_id
+    )
+
+def test_people_follow_a_cell_change(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+
+    ann.cell_id = org['cell_b'].cell_id
+    db_session.flush()
+
+    assert _ancestors(db_session, ann)[:3] == (
+        org['team_b'].team_id, org['department_b'].department_id, org['direction_b'].direction_id
+    )
+
+def test_people_follow_an_org_node_move(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+    south = Region(region_name='South')
+    db_session.add(south)
+    db_session.flush()
+
+    org['team_a'].department_id = org['department_b'].department_id
+    org['direction_b'].region_id = south.region_id
+    db_session.flush()
+
+    assert _ancestors(db_session, ann) == (
+        org['team_a'].team_id, org['department_b'].department_id,
+        org['direction_b'].direction_id, south.region_id
+    )
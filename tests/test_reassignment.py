@@ -0,0 +1,50 @@
+import pytest
+
+from app.models.people import Person
+from app.services.reassignment import reassign_people
+
+
+def _reload(db_session, person):
+    db_session.expire_all()
+    return db_session.get(Person, person.person_id)
+
+def test_moves_people_by_id_and_updates_direction(db_session, org, make_person):
+    ann, bob = make_person('Ann', 'Able'), make_person('Bob', 'Baker')
+    target = org['cell_b']
+
+    assert reassign_people(target.cell_id, person_ids=[ann.person_id, ann.person_id]) == 1
+
+    ann, bob = _reload(db_session, ann), _reload(db_session, bob)
+    assert ann.cell_id == target.cell_id
+    assert ann.direction == 'Music'
+    assert (ann.team_id, ann.direction_id) == (org['team_b'].team_id, org['direction_b'].direction_id)
+    assert bob.cell_id == org['cell_a'].cell_id
+    assert bob.direction == 'Youth'
+
+def test_counts_only_people_who_move(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+    bob = make_person('Bob', 'Baker', cell=org['cell_b'])
+
+    assert reassign_people(org['cell_b'].cell_id, person_ids=[ann.person_id, bob.person_id]) == 1
+    assert reassign_people(org['cell_b'].cell_id, person_ids=[]) == 0
+
+def test_moves_a_whole_cell_or_team(db_session, org, make_person):
+    people = [make_person(f'Person {i}', 'Able') for i in range(3)]
+    make_person('Bob', 'Baker', cell=org['cell_b'])
+
+    assert reassign_people(org['cell_b'].cell_id, from_cell_id=org['cell_a'].cell_id) == 3
+    assert reassign_people(org['cell_a'].cell_id, from_team_id=org['team_b'].team_id) == 4
+    assert all(_reload(db_session, person).direction == 'Youth' for person in people)
+
+@pytest.mark.parametrize('selectors', [
+    {},
+    {'person_ids': [1], 'from_cell_id': 1},
+])
+def test_requires_exactly_one_selector(db_session, org, selectors):
+    with pytest.raises(ValueError):
+        reassign_people(org['cell_a'].cell_id, **selectors)
+
+def test_rejects_unknown_cell(db_session, org, make_person):
+    ann = make_person('Ann', 'Able')
+    with pytest.raises(ValueError, match='does not exist'):
+        reassign_people(999999, person_ids=[ann.person_id])
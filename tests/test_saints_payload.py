@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from app.controllers.saints import COMPACT_COLUMNS, _compact_people_payload
+from app.services.pagination import KeysetPage
+
+
+def _path(cell, team):
+    names = {'cell': cell, 'team': team, 'department': 'Youth Dept', 'direction': 'Youth', 'region': 'North'}
+    return {level: {'id': 1, 'name': name} for level, name in names.items()}
+
+def _person(person_id, first_name, last_name, cell_id):
+    return SimpleNamespace(
+        person_id=person_id, first_name=first_name, last_name=last_name, cell_id=cell_id,
+        phone=None, is_active=True, country='India'
+    )
+
+def test_rows_share_one_label_table():
+    people = [_person(1, 'Ann', 'Able', 10), _person(2, 'Bob', float('nan'), 10), _person(3, 'Cy', 'Cole', 11)]
+    paths = {10: _path('Cell A', 'Team A'), 11: _path('Cell B', 'Team A')}
+    page = KeysetPage(people, 3, False, True, None, 'next', total=7)
+
+    payload = _compact_people_payload(people, paths, page)
+
+    assert payload['columns'] == COMPACT_COLUMNS
+    assert payload['labels'] == ['Cell A', 'Team A', 'Youth Dept', 'Youth', 'North', 'Cell B']
+    assert payload['rows'] == [
+        [1, 'Ann', 'Able', None, 1, 'India', 0, 1, 2, 3, 4],
+        [2, 'Bob', '', None, 1, 'India', 0, 1, 2, 3, 4],
+        [3, 'Cy', 'Cole', None, 1, 'India', 5, 1, 2, 3, 4],
+    ]
+    assert payload['pagination']['next_cursor'] == 'next'
+    assert payload['pagination']['total'] == 7
+    assert 'html' not in payload
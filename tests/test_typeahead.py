@@ -0,0 +1,86 @@
+from collections import namedtuple
+from datetime import datetime
+import threading
+import time
+
+import pytest
+
+from app.services import typeahead
+from app.services.typeahead import TypeaheadIndex, normalize
+
+Row = namedtuple('Row', 'person_id first_name last_name cell_id is_active changed_at')
+
+CHANGED_AT = datetime(2026, 1, 4, 10, 0)
+
+
+def _row(person_id, first_name, last_name, cell_id=1):
+    return Row(person_id, first_name, last_name, cell_id, True, CHANGED_AT)
+
+@pytest.fixture
+def paths(monkeypatch):
+    """Cell 1 has a hierarchy path; any other cell does not resolve"""
+    path = {'cell': {'id': 1, 'name': 'Youth Cell'}}
+    monkeypatch.setattr(typeahead, 'resolve_hierarchy_paths', lambda cell_ids: {
+        cell_id: path for cell_id in cell_ids if cell_id == 1
+    })
+    return path
+
+def _index(rows):
+    index = TypeaheadIndex()
+    index._load_rows = lambda changed_since=None: list(rows)
+    return index
+
+def _names(entries):
+    return [f'{entry.first_name} {entry.last_name}' for entry in entries]
+
+def test_normalize_strips_case_and_accents():
+    assert normalize('Zoé ÁNDRES') == 'zoe andres'
+    assert normalize(None) == ''
+
+def test_search_ranks_name_prefixes_first(app, paths):
+    index = _index([
+        _row(1, 'Ann', 'Johansen'),
+        _row(2, 'Bob', 'Johnson'),
+        _row(3, 'John', 'Smith'),
+        _row(4, 'Zoé', 'Ándres'),
+    ])
+    with app.app_context():
+        assert _names(index.search('joh')) == ['John Smith', 'Bob Johnson', 'Ann Johansen']
+        assert _names(index.search('zoe an')) == ['Zoé Ándres']
+        assert _names(index.search('j s')) == ['John Smith']
+        assert index.search('  ') == []
+        assert index.search('johnsmith') == []
+
+def test_people_whose_cell_has_no_path_are_left_out(app, paths):
+    index = _index([_row(1, 'Ann', 'Able'), _row(2, 'Ann', 'Lost', cell_id=404)])
+    with app.app_context():
+        results = index.search('ann')
+    assert _names(results) == ['Ann Able']
+    assert results[0].path is paths
+
+def test_periodic_rebuild_runs_in_the_background(app, paths):
+    rows = [_row(1, 'Ann', 'Able')]
+    index = _index(rows)
+    with app.app_context():
+        assert _names(index.search('ann')) == ['Ann Able']
+
+        release = threading.Event()
+        loading = threading.Event()
+
+        def slow_load(changed_since=None):
+            loading.set()
+            release.wait(5)
+            return [_row(1, 'Ann', 'Able'), _row(2, 'Ann', 'Baker')]
+        index._load_rows = slow_load
+        index._built_at = time.time() - typeahead.FULL_REBUILD_INTERVAL
+
+        # The old index keeps answering while the rebuild is loading
+        assert _names(index.search('ann')) == ['Ann Able']
+        assert loading.wait(5)
+        assert _names(index.search('ann')) == ['Ann Able']
+
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'typeahead-rebuild':
+                thread.join(5)
+        assert _names(index.search('ann')) == ['Ann Able', 'Ann Baker']
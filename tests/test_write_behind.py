@@ -0,0 +1,44 @@
+import os
+
+from app.services.write_behind import Segment, WriteBehindBuffer, read_segment
+
+
+def _records(service_id, *person_ids, status='present'):
+    return [
+        {'service_id': service_id, 'person_id': person_id, 'status': status, 'ts': 1767520800.0}
+        for person_id in person_ids
+    ]
+
+def test_torn_final_line_is_ignored(tmp_path):
+    segment = Segment.create(str(tmp_path))
+    segment.append(_records(1, 10, 11))
+    segment.handle.write(b'{"service_id": 1, "pers')
+    segment.handle.flush()
+
+    with open(segment.path, 'rb') as handle:
+        assert read_segment(handle) == _records(1, 10, 11)
+
+def test_segments_of_crashed_processes_are_replayed(tmp_path):
+    directory = str(tmp_path)
+
+    # A worker logged marks and died before flushing: its lock is gone
+    crashed = Segment.create(directory)
+    crashed.append(_records(1, 10, 11))
+    crashed.handle.close()
+    # Another worker is still running and holds its segment
+    live = Segment.create(directory)
+    live.append(_records(2, 20))
+    # A worker died before logging anything
+    empty = Segment.create(directory)
+    empty.handle.close()
+
+    buffer = WriteBehindBuffer()
+    current = Segment.create(directory)
+    buffer._segments = [current]
+    buffer._recover(directory)
+
+    assert buffer._pending == _records(1, 10, 11)
+    # Replayed segments stay ahead of the current one until they are flushed
+    assert [segment.path for segment in buffer._segments] == [crashed.path, current.path]
+    assert os.path.exists(live.path)
+    assert not os.path.exists(empty.path)